@@ -11,7 +11,7 @@ import numpy as np
 import pyspiel
 from open_spiel.python.rl_environment import Environment, StepType
 
-from chessenv.env import CChessEnv
+from fastchessenv import CChessEnv, ShardedChessEnv
 
 
 def random_action(masks):
@@ -133,16 +133,19 @@ class PySpielChessEnvParallel:
 
 def benchmark(env, n, n_steps=100):
     env = env(n)
-    state, mask = env.reset()
     times = []
-
-    for _ in range(n_steps):
-        action = random_action(mask)
-        start = time.time()
-        _, mask, _, _ = env.step(action)
-        times.append(time.time() - start)
-
-    del env
+    try:
+        state, mask = env.reset()
+        for _ in range(n_steps):
+            action = random_action(mask)
+            start = time.time()
+            _, mask, _, _ = env.step(action)
+            times.append(time.time() - start)
+    finally:
+        # ShardedChessEnv workers and shared memory need an explicit close
+        if hasattr(env, "close"):
+            env.close()
+        del env
 
     return times
 
@@ -161,3 +164,9 @@ if __name__ == "__main__":
         times = benchmark(CChessEnv, n)
         times = list(map(str, times))
         print(f'cchessenv,{n},{",".join(times)}')
+
+        times = benchmark(
+            lambda n: ShardedChessEnv(n, shards=min(n, mp.cpu_count())), n
+        )
+        times = list(map(str, times))
+        print(f'sharded,{n},{",".join(times)}')
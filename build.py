@@ -10,12 +10,97 @@ ffibuilder.cdef(
 typedef struct {
 } Board;
 
+typedef struct {
+    ...;
+} Move;
+
+#define OPPONENT_NONE 0
+#define OPPONENT_RANDOM 1
+#define OPPONENT_STOCKFISH 2
+
+#define PACKED_MASK_BYTES 704
+#define N_PLANES 19
+#define HASH_HISTORY 128
+#define MOVE_STACK_DEPTH 64
+
+#define END_NONE 0
+#define END_CHECKMATE 1
+#define END_STALEMATE 2
+#define END_REPETITION 3
+#define END_FIFTY_MOVES 4
+#define END_MATERIAL 5
+#define END_TRUNCATED 6
+
+#define SCHEDULE_STATIC 0
+#define SCHEDULE_DYNAMIC 1
+#define SCHEDULE_GUIDED 2
+
+#define CURRICULUM_HORIZON 50
+
+#define N_STAT_PHASES 7
+#define N_STAT_FIELDS 17
+#define MAX_MOVES ...
+
+typedef struct StackEntry StackEntry;
+typedef struct Curriculum Curriculum;
+typedef struct ThreadConfig ThreadConfig;
+typedef struct Stats Stats;
+
 struct Env {
-    Board boards[1024];
+    Board *boards;
+    int *t;
+    unsigned long long *rng;
+    Move *legal;
+    int *n_legal;
+    unsigned long long *hashes;
+    int *n_plies;
+    int *halfmove;
+    int *history;
+    int history_len;
+    struct StackEntry *stack;
+    int *stack_history;
+    int *stack_len;
+    int *bank;
+    size_t bank_size;
+    double *bank_cdf;
+    struct Curriculum *curriculum;
+    int *start_idx;
+    struct ThreadConfig *threads;
+    struct Stats *stats;
     size_t N;
+    size_t capacity;
+    int max_step;
+    float draw_reward;
+    int min_random;
+    int max_random;
+    int invert;
+    float material_weight;
+    float mobility_weight;
+    float check_weight;
+    void *async;
 };
 typedef struct Env Env;
 
+struct StepOutput {
+    int *boards;
+    int *final_boards;
+    unsigned char *planes;
+    float *planes_float;
+    int *history;
+    int *repetitions;
+    int *mask;
+    unsigned char *packed_mask;
+    int *legal_offsets;
+    int *legal_moves;
+    float *reward;
+    float *shaped_reward;
+    int *terminated;
+    int *truncated;
+    int *reason;
+    int *steps;
+};
+typedef struct StepOutput StepOutput;
+
 struct SFPipe {
     int pid;
     FILE* in;
@@ -27,11 +112,44 @@ struct SFArray {
     size_t N;
     int depth;
     SFPipe sfpipe[256];
+    struct ThreadConfig *threads;
+    struct SFLocks *locks;
 };
 typedef struct SFArray SFArray;
 
+typedef struct EnvPool EnvPool;
+
+Env *create_env(size_t n);
+void free_env(Env *env);
+void seed_env(Env *env, unsigned long long seed, size_t first_index);
+void reseed_env(Env *env, int *indices, unsigned long long *seeds, int n);
 void get_mask(Env* env, int *move_mask);
-void reset_env(Env* env, int n);
+void get_mask_packed(Env* env, unsigned char *packed_mask);
+void get_mask_subset(Env *env, int *env_ids, int n, int *move_mask);
+void get_mask_packed_subset(Env *env, int *env_ids, int n, unsigned char *packed_mask);
+void get_legal_moves_csr(Env *env, int *offsets, int *move_ids);
+void get_planes(Env *env, unsigned char *planes);
+void get_planes_float(Env *env, float *planes);
+int set_history_len(Env *env, int history_len);
+int repetition_count(Env *env, size_t i);
+void get_history(Env *env, int *history);
+void get_repetitions(Env *env, int *repetitions);
+size_t snapshot_size(Env *env);
+void snapshot_env(Env *env, int *indices, int n, unsigned char *buf);
+void restore_env(Env *env, int *indices, int n, unsigned char *buf);
+void clone_env(Env *env, int *src, int *dst, int n);
+int push_env(Env *env, int *moves);
+void pop_env(Env *env, int k);
+int reset_env(Env* env, int n);
+void set_reset_bank(Env *env, int *positions, size_t n_positions, double *cdf);
+int set_curriculum(Env *env, float rate);
+int get_curriculum(Env *env, double *priority, float *outcome, float *length);
+int enable_stats(Env *env, int on);
+int stats_slots(Env *env);
+void get_stats(Env *env, unsigned long long *values);
+void reset_stats(Env *env);
+int configure_threads(ThreadConfig *config, int n_threads, int schedule, int chunk, int *cpus, int n_cpus);
+int thread_count(ThreadConfig *config);
 void print_board(Env* env);
 void step_env(Env *env, int* moves, int *dones, int *reward);
 void get_boards(Env *env, int* boards);
@@ -41,7 +159,7 @@ void reset_boards(Env *env, int *reset);
 void get_possible_moves(Env* env, int*);
 
 void generate_stockfish_move(Env* env, SFArray *sfa, int* moves);
-void create_sfarray(SFArray *sfa, int depth, size_t n_threads);
+int create_sfarray(SFArray *sfa, int depth, size_t n_threads);
 void clean_sfarray(SFArray* arr);
 
 void fen_to_array(int* boards, char *fen);
@@ -64,13 +182,29 @@ void array_to_inverted_fen(char* fen, int* boards);
 
 void invert_board(Board *boards);
 void invert_array(int *boards);
+void invert_arrays(int *boards, int n);
 
-void invert_env(Env* env, int n);
+int invert_env(Env* env, int n);
 void reset_and_randomize_boards_invert(Env *env, int *reset, int min_rand, int max_rand);
 void board_arr_to_moves(int* moves, SFArray *sfa, int* boards, size_t N);
 void board_arr_to_move_int(int *moves, SFArray *sfa, int *boards, size_t N);
 
 void board_arr_to_mask(int* board_arr, int *move_mask);
+void transition_arrays(int *boards, int *moves, int n, int *next_boards, int *move_mask, int *terminated, float *reward);
+int rollout_arrays(int *boards, int n, int n_playouts, int max_plies, unsigned long long seed,
+                   int *wins, int *draws, int *losses, float *mean_length);
+
+void configure_env(Env *env, int max_step, float draw_reward, int min_random, int max_random, int invert);
+void configure_shaping(Env *env, float material, float mobility, float check);
+void step_env_fused(Env *env, SFArray *sfa, int opponent, int *moves, StepOutput *out);
+void step_env_subset(Env *env, SFArray *sfa, int opponent, int *moves, int *env_ids, int n, StepOutput *out);
+int step_env_async(Env *env, SFArray *sfa, int opponent, int *moves, StepOutput *out);
+void step_env_wait(Env *env);
+
+EnvPool *create_env_pool(Env *env, SFArray *sfa, int opponent, StepOutput *out, size_t n_threads);
+void free_env_pool(EnvPool *pool);
+void env_pool_send(EnvPool *pool, int *moves, int *env_ids, int n);
+int env_pool_recv(EnvPool *pool, int min_batch, int max_batch, int *env_ids);
 """
 )
 
@@ -126,15 +260,24 @@ ffibuilder.set_source(
     "fastchessenv_c",
     """
     #include "chessenv.h"
+    #include "gen.h"
     #include "sfarray.h"
     #include "rep.h"
     #include "move_map.h"
+    #include "envpool.h"
+    #include "curriculum.h"
+    #include "threads.h"
+    #include "stats.h"
 """,
     sources=[
         "src/chessenv.c",
         "src/sfarray.c",
         "src/rep.c",
         "src/move_map.c",
+        "src/envpool.c",
+        "src/curriculum.c",
+        "src/threads.c",
+        "src/stats.c",
     ],
     include_dirs=[
         "MisterQueen/src/",
@@ -6,17 +6,40 @@ from fastchessenv.libloader import initialize
 # Only import the rest if libraries were loaded successfully
 if initialize():
     from fastchessenv.env import CChessEnv, RandomChessEnv, SFCChessEnv
-    from fastchessenv.rep import CBoard, CBoards, CMove, CMoves
+    from fastchessenv.rep import (
+        CBoard,
+        CBoards,
+        CMove,
+        CMoves,
+        invert_boards,
+        rollout,
+        transition,
+        unpack_mask,
+    )
+    from fastchessenv.sharded import ShardedChessEnv
 
     __all__ = [
         "SFCChessEnv",
         "CChessEnv",
         "RandomChessEnv",
+        "ShardedChessEnv",
         "CMove",
         "CBoard",
         "CMoves",
         "CBoards",
+        "invert_boards",
+        "rollout",
+        "transition",
+        "unpack_mask",
     ]
+
+    # The Gymnasium vector env is only available with gymnasium installed
+    try:
+        from fastchessenv.vector import ChessVectorEnv
+    except ImportError:
+        pass
+    else:
+        __all__.append("ChessVectorEnv")
 else:
     import warnings
 
@@ -1,21 +1,279 @@
+import os
+
 import numpy as np
 from cffi import FFI
 
 import fastchessenv_c
 from fastchessenv.rep import CMoves
 from fastchessenv_c.lib import (
+    MAX_MOVES,
+    MOVE_STACK_DEPTH,
+    N_PLANES,
+    N_STAT_PHASES,
+    OPPONENT_RANDOM,
+    OPPONENT_STOCKFISH,
+    PACKED_MASK_BYTES,
+    SCHEDULE_DYNAMIC,
+    SCHEDULE_GUIDED,
+    SCHEDULE_STATIC,
     clean_sfarray,
+    clone_env,
+    configure_env,
+    configure_shaping,
+    configure_threads,
+    create_env,
+    create_env_pool,
     create_sfarray,
+    enable_stats,
+    env_pool_recv,
+    env_pool_send,
+    free_env,
+    free_env_pool,
     generate_random_move,
     generate_stockfish_move,
     get_boards,
+    get_curriculum,
+    get_history,
+    get_legal_moves_csr,
     get_mask,
+    get_mask_packed,
+    get_mask_packed_subset,
+    get_mask_subset,
+    get_planes,
+    get_planes_float,
+    get_repetitions,
+    get_stats,
     invert_env,
+    pop_env,
+    push_env,
     reset_and_randomize_boards_invert,
+    reseed_env,
     reset_env,
+    reset_stats,
+    restore_env,
+    seed_env,
+    set_curriculum,
+    set_history_len,
+    set_reset_bank,
+    snapshot_env,
+    snapshot_size,
     step_env,
+    step_env_async,
+    step_env_fused,
+    step_env_subset,
+    step_env_wait,
+    stats_slots,
+    thread_count,
+)
+
+_SCHEDULES = {
+    "static": SCHEDULE_STATIC,
+    "dynamic": SCHEDULE_DYNAMIC,
+    "guided": SCHEDULE_GUIDED,
+}
+
+# Shaping terms and their weight when not given, see CChessEnv
+_SHAPING_TERMS = ("material", "mobility", "check")
+
+# Timed phases of a step, in the order of the STAT_* phases of stats.h
+STAT_PHASES = (
+    "movegen",
+    "make_move",
+    "mask",
+    "encode",
+    "reset",
+    "random_start",
+    "opponent",
 )
 
+_STATS_DTYPE = np.dtype(
+    [
+        ("ns", np.uint64, (N_STAT_PHASES,)),
+        ("calls", np.uint64, (N_STAT_PHASES,)),
+        ("boards", np.uint64),
+        ("legal_moves", np.uint64),
+        ("resets", np.uint64),
+    ]
+)
+
+
+def _mask_layout(packed):
+    """Per-board shape and dtype of the dense or bit-packed move mask"""
+    if packed:
+        return (PACKED_MASK_BYTES,), np.uint8
+    return (88 * 64,), np.int32
+
+
+def _planes_dtype(planes):
+    """dtype of the plane observations, None when they are disabled"""
+    if planes is None or planes is False:
+        return None
+    dtype = np.dtype(np.uint8 if planes is True else planes)
+    if dtype not in (np.uint8, np.float32):
+        raise ValueError(f"planes must be uint8 or float32, got {dtype}")
+    return dtype
+
+
+def _load_positions(positions):
+    """
+    Opens a bank of 69-int board records. Paths are memory-mapped read-only,
+    `.npy` files through numpy and anything else as raw native int32 records.
+    """
+    if isinstance(positions, (str, os.PathLike)):
+        if os.fspath(positions).endswith(".npy"):
+            positions = np.load(positions, mmap_mode="r")
+        else:
+            positions = np.memmap(positions, dtype=np.int32, mode="r")
+    # Only copies if the bank is not int32 and C-contiguous already
+    positions = np.ascontiguousarray(positions, dtype=np.int32)
+    if positions.size == 0 or positions.size % 69 != 0:
+        raise ValueError("reset_positions must hold a non-empty set of 69-int boards")
+    return positions.reshape(-1, 69)
+
+
+def _to_seed(seed):
+    """Turns an int or None into a 64 bit seed, None draws fresh entropy"""
+    if seed is not None:
+        seed = int(seed)
+    return int(np.random.SeedSequence(seed).generate_state(1, np.uint64)[0])
+
+
+def _read_only(arr):
+    view = arr.view()
+    view.flags.writeable = False
+    return view
+
+
+def _check_out(arr, shape, dtype, name):
+    if (
+        not isinstance(arr, np.ndarray)
+        or arr.dtype != dtype
+        or arr.shape != tuple(shape)
+        or not arr.flags.c_contiguous
+        or not arr.flags.writeable
+    ):
+        raise ValueError(
+            f"out {name} must be a writeable, C-contiguous {np.dtype(dtype).name} "
+            f"array with shape {shape}"
+        )
+    return arr
+
+
+class _StepBuffers:
+    """
+    One set of output arrays for a step, together with the StepOutput struct
+    pointing at them so the C side can fill them in place. The main outputs
+    can be pointed at caller-owned arrays with `attach`, the side outputs
+    always live here.
+    """
+
+    def __init__(
+        self,
+        n,
+        packed=False,
+        csr=False,
+        planes=None,
+        history_len=0,
+        shaping=False,
+    ):
+        self.packed = packed
+        self.mask_layout = _mask_layout(packed)
+        mask_shape, mask_dtype = self.mask_layout
+        self._own = (
+            np.zeros(shape=(n, 69), dtype=np.int32),
+            np.zeros(shape=(n,) + mask_shape, dtype=mask_dtype),
+            np.zeros(shape=(n,), dtype=np.float32),
+            np.zeros(shape=(n,), dtype=bool),
+        )
+        self._attached = (None,) * 4
+        self.terminated = np.zeros(shape=(n,), dtype=np.int32)
+        self.truncated = np.zeros(shape=(n,), dtype=np.int32)
+        self.reason = np.zeros(shape=(n,), dtype=np.int32)
+        self.repetitions = np.zeros(shape=(n,), dtype=np.int32)
+        self.final_state = np.zeros(shape=(n, 69), dtype=np.int32)
+
+        ffi = fastchessenv_c.ffi
+        self.out = ffi.new("StepOutput *")
+        self.out.final_boards = ffi.cast("int *", self.final_state.ctypes.data)
+        self.out.terminated = ffi.cast("int *", self.terminated.ctypes.data)
+        self.out.truncated = ffi.cast("int *", self.truncated.ctypes.data)
+        self.out.reason = ffi.cast("int *", self.reason.ctypes.data)
+        self.out.repetitions = ffi.cast("int *", self.repetitions.ctypes.data)
+        self.attach(None)
+
+        self.planes = None
+        if planes is not None:
+            self.planes = np.zeros(shape=(n, N_PLANES, 8, 8), dtype=planes)
+            if planes == np.uint8:
+                self.out.planes = ffi.cast("unsigned char *", self.planes.ctypes.data)
+            else:
+                self.out.planes_float = ffi.cast("float *", self.planes.ctypes.data)
+
+        self.shaped_reward = None
+        if shaping:
+            self.shaped_reward = np.zeros(shape=(n,), dtype=np.float32)
+            self.out.shaped_reward = ffi.cast("float *", self.shaped_reward.ctypes.data)
+
+        self.history = None
+        if history_len > 0:
+            self.history = np.zeros(shape=(n, history_len, 69), dtype=np.int32)
+            self.out.history = ffi.cast("int *", self.history.ctypes.data)
+
+        self.legal_offsets = None
+        self.legal_ids = None
+        if csr:
+            self.legal_offsets = np.zeros(shape=(n + 1,), dtype=np.int32)
+            self.legal_ids = np.zeros(shape=(n * MAX_MOVES,), dtype=np.int32)
+            self.out.legal_offsets = ffi.cast("int *", self.legal_offsets.ctypes.data)
+            self.out.legal_moves = ffi.cast("int *", self.legal_ids.ctypes.data)
+
+    def attach(self, out, n=None):
+        """Points the (state, mask, reward, done) outputs at the arrays of out
+        with n rows, the own arrays for out or any entry of it being None.
+        The struct is only rewritten when the arrays change."""
+        arrs = self._own if out is None else out
+        arrs = tuple(own if a is None else a for a, own in zip(arrs, self._own))
+        if all(a is b for a, b in zip(arrs, self._attached)):
+            return
+
+        n = len(self._own[0]) if n is None else n
+        mask_shape, mask_dtype = self.mask_layout
+        layouts = [
+            ((n, 69), np.int32, "state"),
+            ((n,) + mask_shape, mask_dtype, "mask"),
+            ((n,), np.float32, "reward"),
+            ((n,), np.bool_, "done"),
+        ]
+        for arr, own, (shape, dtype, name) in zip(arrs, self._own, layouts):
+            if arr is not own:
+                _check_out(arr, shape, dtype, name)
+
+        ffi = fastchessenv_c.ffi
+        self.state, self.mask, self.reward, self.done = arrs
+        self._attached = arrs
+        self.out.boards = ffi.cast("int *", self.state.ctypes.data)
+        if self.packed:
+            self.out.packed_mask = ffi.cast("unsigned char *", self.mask.ctypes.data)
+        else:
+            self.out.mask = ffi.cast("int *", self.mask.ctypes.data)
+        self.out.reward = ffi.cast("float *", self.reward.ctypes.data)
+
+    def legal_moves(self, k=None):
+        offsets = self.legal_offsets if k is None else self.legal_offsets[: k + 1]
+        offsets = _read_only(offsets)
+        return offsets, _read_only(self.legal_ids[: offsets[-1]])
+
+    def results(self, read_only, k=None):
+        """The (state, mask, reward, done) outputs, only the first k rows
+        when a subset of boards was stepped"""
+        arrs = (self.state, self.mask, self.reward, self.done)
+        if k is not None:
+            arrs = tuple(a[:k] for a in arrs)
+        np.logical_or(self.terminated[:k], self.truncated[:k], out=arrs[3])
+        if read_only:
+            return tuple(_read_only(a) for a in arrs)
+        return arrs
+
 
 class CChessEnv:
     """
@@ -48,73 +306,764 @@ class CChessEnv:
         maximum number of random moves to apply to the starting board
     invert: bool
         ensure the side to move is always white
+    buffers: int
+        number of env-owned output buffer sets that `step` and `reset` rotate
+        through. Returned arrays are read-only views that stay valid for
+        `buffers - 1` further calls, so the default of 2 double-buffers.
+    seed: int, optional
+        seed for the per-board random streams used for random starts and
+        random opponents. Runs with the same seed replay exactly.
+    packed_mask: bool
+        return masks bit-packed as (N, 704) uint8 arrays in numpy `packbits`
+        order instead of (N, 5632) int32, see `fastchessenv.unpack_mask`
+    csr_moves: bool
+        also compute the legal moves in CSR form during `reset` and `step`,
+        exposed as `legal_offsets` (N + 1,) and `legal_ids`, with the move
+        ids of board i in `legal_ids[legal_offsets[i]:legal_offsets[i + 1]]`
+    pool_threads: int
+        number of native worker threads used by `send`/`recv`, 0 picks one
+        per Stockfish instance or one per CPU
+    planes: np.dtype, optional
+        also compute (N, 19, 8, 8) uint8 or float32 plane observations during
+        `reset` and `step`, exposed as `planes`. See `get_planes` for the
+        plane layout.
+    history: int
+        number of past positions kept per board. When set, `reset` and
+        `step` also expose them as `history`, a (N, history, 69) array with
+        the oldest position first and the current one last.
+    reset_positions: np.array or path, optional
+        (M, 69) bank of board arrays that resets draw their starting
+        position from, instead of playing `min_random..max_random` random
+        moves. A path is memory-mapped read-only, either a `.npy` file or raw
+        native int32 records, so worker processes share one copy through the
+        page cache. Positions with black to move are inverted when `invert`
+        is set.
+    reset_weights: np.array, optional
+        (M,) non-negative sampling weights of the bank positions, uniform by
+        default
+    curriculum: float
+        when set, resets sample the bank by curriculum priority instead:
+        every position keeps running averages of the outcome, its square and
+        the length of the episodes started from it, updated at this rate by
+        `step`. Positions are drawn in proportion to
+        `(0.05 + variance) * 50 / (50 + length)`, so positions whose results
+        vary come up more often than ones that are reliably won, lost or
+        drawn, and short episodes are preferred over long ones.
+        `reset_weights` scale the priorities. See `get_curriculum`.
+    threads: int
+        number of native threads the batched calls on this env run on, 0 for
+        one per CPU. See `set_threads` for the schedule and CPU pinning.
+    stats: bool
+        whether to count the time and calls of every phase of the native
+        step, see `stats`. Off by default as timing costs a clock read per
+        phase.
+    shaping: dict, optional
+        weights of the shaping terms `step` computes natively from the
+        boards before and after each step, seen from the agent: `material`
+        for the change of the material balance in pawns (1/3/3/5/9),
+        `mobility` for the change of its number of legal moves from this
+        turn to the next, and `check` for +1 when its move gives check and
+        -1 when the reply checks it. Missing terms weigh 0. The weighted sum
+        is kept in `self.shaped_reward`, `reward` stays the sparse game
+        result. Mobility is 0 for steps that do not end with the agent to
+        move.
     """
 
+    opponent = OPPONENT_RANDOM
+
     def __init__(
-        self, n, max_step=100, draw_reward=0, min_random=0, max_random=0, invert=False
+        self,
+        n,
+        max_step=100,
+        draw_reward=0,
+        min_random=0,
+        max_random=0,
+        invert=False,
+        buffers=2,
+        seed=None,
+        packed_mask=False,
+        csr_moves=False,
+        pool_threads=0,
+        planes=None,
+        history=0,
+        reset_positions=None,
+        reset_weights=None,
+        curriculum=0,
+        threads=0,
+        stats=False,
+        shaping=None,
     ):
         self.ffi = FFI()
         self.n = n
         self.max_step = max_step
         self.draw_reward = draw_reward
-        self._env = fastchessenv_c.ffi.new("Env *")
+        self._env = create_env(n)
+        if self._env == fastchessenv_c.ffi.NULL:
+            raise MemoryError(f"Could not allocate an environment with {n} boards")
+        self._sfa = fastchessenv_c.ffi.NULL
+        self.seed(seed)
+        self.history_len = history
+        if history > 0 and set_history_len(self._env, history) != 0:
+            raise MemoryError(f"Could not allocate {history} positions of history")
+        self._set_reset_positions(reset_positions, reset_weights)
+        self.curriculum = curriculum
+        if curriculum:
+            if not 0 < curriculum <= 1:
+                raise ValueError("curriculum must be a rate in (0, 1]")
+            if self._reset_positions is None:
+                raise ValueError("curriculum needs reset_positions")
+            if set_curriculum(self._env, curriculum) != 0:
+                raise MemoryError("Could not allocate the curriculum")
         self.min_random = min_random
         self.max_random = max_random
         self.invert = invert
+        self.packed_mask = packed_mask
+        self.csr_moves = csr_moves
+        self.pool_threads = pool_threads
+        self.planes_dtype = _planes_dtype(planes)
+        self.shaping = None
+        if shaping is not None:
+            unknown = set(shaping) - set(_SHAPING_TERMS)
+            if unknown:
+                raise ValueError(
+                    f"Unknown shaping terms {sorted(unknown)}, "
+                    f"expected some of {_SHAPING_TERMS}"
+                )
+            self.shaping = {term: float(shaping.get(term, 0)) for term in _SHAPING_TERMS}
+
+        # Step counters live in the C env, this is a view onto them
+        self.t = np.frombuffer(
+            fastchessenv_c.ffi.buffer(self._env.t, 4 * self.n), dtype=np.int32
+        )
+        self.stack_depth = np.frombuffer(
+            fastchessenv_c.ffi.buffer(self._env.stack_len, 4 * self.n), dtype=np.int32
+        )
+        self._buffers = [self._make_step_buffers() for _ in range(max(buffers, 1))]
+        self._buffer_idx = 0
+        self._set_results(self._buffers[0])
+
+        self._async_moves = self._make_move_arr()
+        self._pending = None
 
-        self.t = np.zeros(self.n)
+        self._pool = None
+        self._pool_buffers = None
+        self._in_flight = np.zeros(shape=(self.n,), dtype=bool)
 
-    def reset(self):
+        if threads:
+            self.set_threads(threads)
+        if stats and enable_stats(self._env, 1) != 0:
+            raise MemoryError("Could not allocate the step stats")
+
+    def _set_reset_positions(self, positions, weights):
+        self._reset_positions = None
+        self._reset_cdf = None
+        if positions is None:
+            if weights is not None:
+                raise ValueError("reset_weights needs reset_positions")
+            return
+
+        positions = _load_positions(positions)
+        cdf = fastchessenv_c.ffi.NULL
+        if weights is not None:
+            weights = np.asarray(weights, dtype=np.float64).reshape(-1)
+            if weights.shape != (positions.shape[0],):
+                raise ValueError("reset_weights needs one weight per position")
+            if (weights < 0).any() or not weights.sum() > 0:
+                raise ValueError("reset_weights must be non-negative, not all zero")
+            self._reset_cdf = np.cumsum(weights)
+            cdf = self.ffi.cast("double *", self._reset_cdf.ctypes.data)
+
+        # The C env reads the bank in place, keep it alive with the env
+        self._reset_positions = positions
+        set_reset_bank(
+            self._env,
+            self.ffi.cast("int *", positions.ctypes.data),
+            positions.shape[0],
+            cdf,
+        )
+
+    def _make_step_buffers(self):
+        return _StepBuffers(
+            self.n,
+            packed=self.packed_mask,
+            csr=self.csr_moves,
+            planes=self.planes_dtype,
+            history_len=self.history_len,
+            shaping=self.shaping is not None,
+        )
+
+    def _next_buffers(self, out, n=None):
+        """The next env-owned buffer set, writing its main outputs to the
+        arrays of out with n rows when given"""
+        buffers = self._buffers[self._buffer_idx]
+        self._buffer_idx = (self._buffer_idx + 1) % len(self._buffers)
+        buffers.attach(out, n)
+        return buffers
+
+    def _set_results(self, buffers, k=None):
+        """Points the per-step side outputs at the buffers just written, only
+        the first k rows after a subset step"""
+        self.terminated = buffers.terminated[:k]
+        self.truncated = buffers.truncated[:k]
+        self.reason = buffers.reason[:k]
+        self.repetitions = buffers.repetitions[:k]
+        self.final_state = _read_only(buffers.final_state[:k])
+        if self.history_len > 0:
+            self.history = _read_only(buffers.history[:k])
+        if self.csr_moves:
+            self.legal_offsets, self.legal_ids = buffers.legal_moves(k)
+        if self.planes_dtype is not None:
+            self.planes = _read_only(buffers.planes[:k])
+        if self.shaping is not None:
+            self.shaped_reward = _read_only(buffers.shaped_reward[:k])
+
+    def _check_env_ids(self, env_ids):
+        """Validates a list of distinct board indices"""
+        env_ids = np.ascontiguousarray(env_ids, dtype=np.int32).reshape(-1)
+        if ((env_ids < 0) | (env_ids >= self.n)).any():
+            raise IndexError(f"env ids must be in [0, {self.n})")
+        if len(np.unique(env_ids)) != len(env_ids):
+            raise ValueError("env ids must be distinct")
+        return env_ids
+
+    def reset(self, out=None):
         """
         Resets the environment, returns the new intial states.
 
+        Parameters
+        ----------
+        out: tuple, optional
+            (state, mask) arrays to write into instead of the env-owned
+            buffers
+
         Returns
         -------
         state: np.array
             (N, 69) vector representing the board state
         mask: np.array
-            (N, 5632) vector represeting the move mask
+            (N, 5632) vector represeting the move mask, (N, 704) bytes when
+            `packed_mask` is set
         """
-        self.t = np.zeros(self.n)
-        reset_env(self._env, self.n)
-        mask = self.get_mask()
-        return self.get_state(), mask
+        self._check_not_pending()
+        configure_env(
+            self._env,
+            self.max_step,
+            self.draw_reward,
+            self.min_random,
+            self.max_random,
+            self.invert,
+        )
+        if self.shaping is not None:
+            configure_shaping(
+                self._env,
+                self.shaping["material"],
+                self.shaping["mobility"],
+                self.shaping["check"],
+            )
+        if reset_env(self._env, self.n) != 0:
+            raise ValueError(f"Environment can not hold {self.n} boards")
+
+        buffers = self._next_buffers(None)
+        buffers.terminated[:] = 0
+        buffers.truncated[:] = 0
+        buffers.reason[:] = 0
+        if self.csr_moves:
+            self.get_legal_moves(out=(buffers.legal_offsets, buffers.legal_ids))
+        if self.planes_dtype is not None:
+            self.get_planes(out=buffers.planes)
+        if self.history_len > 0:
+            self.get_history(out=buffers.history)
+        self.get_repetitions(out=buffers.repetitions)
+        self._set_results(buffers)
+
+        if out is not None:
+            state, mask = out
+            return self.get_state(out=state), self.get_mask(out=mask)
 
-    def step(self, move_arr):
+        self.get_state(out=buffers.state)
+        self.get_mask(out=buffers.mask)
+        return _read_only(buffers.state), _read_only(buffers.mask)
+
+    def step(self, move_arr, out=None, env_ids=None):
         """
         Steps the environment foward one timestep.
 
+        The agent move, the opponent reply, terminal detection, resets and
+        the new state and mask are all computed by a single call into C. The
+        termination/truncation split of the returned done flag is kept in
+        `self.terminated` and `self.truncated`. Boards that finished are
+        reset within the step, their last position before the reset is kept
+        in the rows of `self.final_state` where done is set.
+
+        Games end by checkmate (reward 1 for the agent delivering it, -1 when
+        the opponent does) or by a draw: stalemate, threefold repetition, the
+        fifty move rule or insufficient material, all scored `draw_reward`.
+        Why each game ended is kept in `self.reason` as one of the END_*
+        codes of `fastchessenv_c.lib`: 0 still running, 1 checkmate,
+        2 stalemate, 3 repetition, 4 fifty moves, 5 insufficient material,
+        6 truncated at `max_step`.
+
+        Results are written in place into env-owned buffers and returned as
+        read-only views, so steady-state stepping does not allocate. Pass
+        `out` to have them written into your own arrays instead, the side
+        outputs then still use the env-owned buffers and nothing is
+        allocated either.
+
+        With `env_ids`, only those K boards are stepped and every output,
+        including the side outputs such as `terminated`, is compacted to K
+        rows in the order of `env_ids`.
+
+        Parameters
+        ----------
+        move_arr: np.array
+            (N,) array of move integers, (K,) when `env_ids` is given
+        out: tuple, optional
+            (state, mask, reward, done) arrays of dtype int32, int32, float32
+            and bool to write the results into
+        env_ids: np.array, optional
+            (K,) distinct indices of the boards to step, all boards by default
+
         Returns
         -------
         state: np.array
             (N, 69) vector representing the board state
         mask: np.array
-            (N, 5632) vector represeting the move mask
+            (N, 5632) vector represeting the move mask, (N, 704) bytes when
+            `packed_mask` is set
         reward: np.array
-            (N, 1) vector represeting the reward
+            (N,) float32 vector represeting the reward
         done: np.array
-            (N, 1) vector represeting wether or not it was a "done" transition
+            (N,) vector represeting wether or not it was a "done" transition
+        """
+        self._check_not_pending()
+        move_arr = np.ascontiguousarray(move_arr, dtype=np.int32)
+        if env_ids is None:
+            buffers = self._next_buffers(out)
+            step_env_fused(
+                self._env,
+                self._sfa,
+                self.opponent,
+                self.ffi.cast("int *", move_arr.ctypes.data),
+                buffers.out,
+            )
+            self._set_results(buffers)
+            return buffers.results(read_only=out is None)
+
+        env_ids = self._check_env_ids(env_ids)
+        move_arr = move_arr.reshape(-1)
+        if env_ids.shape != move_arr.shape:
+            raise ValueError("move_arr and env_ids must have the same length")
+        k = len(env_ids)
+
+        # The env-owned buffers have room for all boards, only k rows are used
+        buffers = self._next_buffers(out, n=k)
+        step_env_subset(
+            self._env,
+            self._sfa,
+            self.opponent,
+            self.ffi.cast("int *", move_arr.ctypes.data),
+            self.ffi.cast("int *", env_ids.ctypes.data),
+            k,
+            buffers.out,
+        )
+        self._set_results(buffers, k)
+        return buffers.results(read_only=out is None, k=k)
+
+    def step_async(self, move_arr, out=None):
         """
-        done_one, my_reward = self.push_moves(move_arr)
-        response = self.sample_opponent()
-        done_two, their_reward = self.push_moves(response)
+        Starts a step on a background native thread and returns immediately,
+        so the caller can run inference while the boards are stepped. Collect
+        the results with `step_wait`.
 
-        reward = my_reward - (1 - done_one) * (their_reward)
+        Parameters
+        ----------
+        move_arr: np.array
+            (N,) array of move integers, copied before the step starts
+        out: tuple, optional
+            (state, mask, reward, done) arrays to write into, see `step`.
+            They must not be touched until `step_wait` returns.
+        """
+        self._check_not_pending()
+        np.copyto(
+            self._async_moves, np.asarray(move_arr).reshape(-1), casting="unsafe"
+        )
+        buffers = self._next_buffers(out)
 
-        reward[(self.t > self.max_step)] = self.draw_reward
+        status = step_env_async(
+            self._env,
+            self._sfa,
+            self.opponent,
+            self.ffi.cast("int *", self._async_moves.ctypes.data),
+            buffers.out,
+        )
+        if status != 0:
+            raise RuntimeError("Could not start the background step")
+        self._pending = (buffers, out is None)
 
-        total_done = ((done_one + done_two) > 0) | (self.t > self.max_step)
-        self.t[(total_done == 1)] = 0
+    def step_wait(self):
+        """
+        Waits for the step started by `step_async`.
 
-        self.reset_boards(total_done)
+        Returns
+        -------
+        The same (state, mask, reward, done) tuple as `step`
+        """
+        if self._pending is None:
+            raise RuntimeError("step_wait called without a pending step_async")
 
-        mask = self.get_mask()
-        state = self.get_state()
+        step_env_wait(self._env)
+        buffers, read_only = self._pending
+        self._pending = None
 
-        return state, mask, reward, total_done
+        self._set_results(buffers)
+        return buffers.results(read_only=read_only)
+
+    def send(self, move_arr, env_ids=None):
+        """
+        Queues moves for a subset of boards on the native worker pool and
+        returns immediately. Boards are stepped independently, so slow
+        positions (e.g. long Stockfish searches) do not hold back the rest.
+        Collect finished boards with `recv`.
+
+        Parameters
+        ----------
+        move_arr: np.array
+            (K,) array of move integers
+        env_ids: np.array, optional
+            (K,) array of board indices the moves belong to, all boards by
+            default. A board can not be sent again until it has been received.
+        """
+        if self._pending is not None:
+            raise RuntimeError("A step_async is still running, call step_wait first")
+
+        if env_ids is None:
+            env_ids = np.arange(self.n, dtype=np.int32)
+        env_ids = np.ascontiguousarray(env_ids, dtype=np.int32).reshape(-1)
+        move_arr = np.ascontiguousarray(move_arr, dtype=np.int32).reshape(-1)
+        if env_ids.shape != move_arr.shape:
+            raise ValueError("move_arr and env_ids must have the same length")
+        if ((env_ids < 0) | (env_ids >= self.n)).any():
+            raise IndexError(f"env ids must be in [0, {self.n})")
+        if self._in_flight[env_ids].any() or len(np.unique(env_ids)) != len(env_ids):
+            raise ValueError("Boards can only be sent once until they are received")
+
+        if self._pool is None:
+            self._pool_buffers = _StepBuffers(self.n, packed=self.packed_mask)
+            self._pool = create_env_pool(
+                self._env,
+                self._sfa,
+                self.opponent,
+                self._pool_buffers.out,
+                self.pool_threads,
+            )
+            if self._pool == fastchessenv_c.ffi.NULL:
+                self._pool = None
+                raise RuntimeError("Could not start the native worker pool")
+
+        self._in_flight[env_ids] = True
+        env_pool_send(
+            self._pool,
+            self.ffi.cast("int *", move_arr.ctypes.data),
+            self.ffi.cast("int *", env_ids.ctypes.data),
+            len(env_ids),
+        )
+
+    def recv(self, min_batch=1, max_batch=None):
+        """
+        Waits until at least `min_batch` of the boards queued with `send`
+        have been stepped and returns the results for those boards, in the
+        order they finished.
+
+        Parameters
+        ----------
+        min_batch: int
+            minimum number of boards to wait for
+        max_batch: int, optional
+            maximum number of boards to return, defaults to `min_batch`
+
+        Returns
+        -------
+        env_ids: np.array
+            (K,) indices of the returned boards
+        state: np.array
+            (K, 69) board states
+        mask: np.array
+            (K, 5632) move masks, (K, 704) bytes when `packed_mask` is set
+        reward: np.array
+            (K,) float32 rewards
+        done: np.array
+            (K,) done flags
+
+        The termination/truncation split and the end reason of the returned
+        boards are kept in `self.terminated`, `self.truncated` and
+        `self.reason`, row for row with `env_ids`, as `step` does.
+        """
+        if max_batch is None:
+            max_batch = min_batch
+        in_flight = int(self._in_flight.sum())
+        if min_batch < 1 or min_batch > in_flight or max_batch < min_batch:
+            raise ValueError(
+                f"Need 1 <= min_batch <= max_batch and min_batch <= {in_flight} "
+                "boards in flight"
+            )
+
+        env_ids = np.zeros(shape=(max_batch,), dtype=np.int32)
+        count = env_pool_recv(
+            self._pool,
+            min_batch,
+            max_batch,
+            self.ffi.cast("int *", env_ids.ctypes.data),
+        )
+        env_ids = env_ids[:count]
+        self._in_flight[env_ids] = False
+
+        buffers = self._pool_buffers
+        self.terminated = buffers.terminated[env_ids]
+        self.truncated = buffers.truncated[env_ids]
+        self.reason = buffers.reason[env_ids]
+        done = (self.terminated | self.truncated) > 0
+        return (
+            env_ids,
+            buffers.state[env_ids],
+            buffers.mask[env_ids],
+            buffers.reward[env_ids],
+            done,
+        )
+
+    def _check_not_pending(self):
+        if getattr(self, "_pending", None) is not None:
+            raise RuntimeError("A step_async is still running, call step_wait first")
+        in_flight = getattr(self, "_in_flight", None)
+        if in_flight is not None and in_flight.any():
+            raise RuntimeError("Boards are still in flight, recv them first")
+
+    def __del__(self):
+        pool = getattr(self, "_pool", None)
+        if pool is not None:
+            free_env_pool(pool)
+            self._pool = None
+
+        env = getattr(self, "_env", None)
+        if env is not None and env != fastchessenv_c.ffi.NULL:
+            free_env(env)
+            self._env = None
+
+    def set_threads(self, n_threads=0, schedule="static", chunk=0, cpus=None):
+        """
+        Sets how the batched native calls of this env are spread over
+        threads. Only this env is affected, other envs in the process keep
+        their own settings. Without OpenMP the calls run on a persistent
+        pthread pool owned by the env.
+
+        Parameters
+        ----------
+        n_threads: int
+            number of threads, 0 for one per CPU
+        schedule: str
+            "static", "dynamic" or "guided" distribution of the boards
+        chunk: int
+            boards handed out at a time, 0 for the schedule's default
+        cpus: list, optional
+            CPUs the worker threads are pinned to, round robin. The calling
+            thread is never pinned. Only supported on Linux.
+        """
+        self._check_not_pending()
+        if schedule not in _SCHEDULES:
+            raise ValueError(f"schedule must be one of {sorted(_SCHEDULES)}")
+        if n_threads < 0 or chunk < 0:
+            raise ValueError("n_threads and chunk must be non-negative")
+        cpus = np.ascontiguousarray([] if cpus is None else cpus, dtype=np.int32)
+        status = configure_threads(
+            self._env.threads,
+            n_threads,
+            _SCHEDULES[schedule],
+            chunk,
+            self.ffi.cast("int *", cpus.ctypes.data),
+            len(cpus),
+        )
+        if status != 0:
+            raise ValueError("Invalid CPU list, or CPU pinning is not supported here")
+
+    @property
+    def n_threads(self):
+        """Number of native threads the batched calls run on"""
+        return thread_count(self._env.threads)
+
+    def seed(self, seed=None, first_index=0):
+        """
+        Restarts the random streams of every board from one seed.
+
+        Parameters
+        ----------
+        seed: int, optional
+            seed for the streams, fresh entropy by default
+        first_index: int
+            index of the first board in a larger env this one is a slice
+            of. Board i gets the stream board first_index + i has there, so
+            envs over consecutive slices replay the larger env.
+        """
+        if first_index < 0:
+            raise ValueError("first_index must be non-negative")
+        seed_env(self._env, _to_seed(seed), first_index)
+
+    def reseed(self, indices, seeds):
+        """
+        Restarts the random streams of the given boards.
+
+        Parameters
+        ----------
+        indices: np.array
+            (K,) array of board indices
+        seeds: np.array
+            (K,) array of seeds, one per index
+        """
+        indices = np.ascontiguousarray(indices, dtype=np.int32).reshape(-1)
+        seeds = np.array(
+            [_to_seed(s) for s in np.asarray(seeds).reshape(-1)], dtype=np.uint64
+        )
+        if indices.shape != seeds.shape:
+            raise ValueError("indices and seeds must have the same length")
+        if ((indices < 0) | (indices >= self.n)).any():
+            raise IndexError(f"board indices must be in [0, {self.n})")
+
+        reseed_env(
+            self._env,
+            self.ffi.cast("int *", indices.ctypes.data),
+            self.ffi.cast("unsigned long long *", seeds.ctypes.data),
+            len(indices),
+        )
+
+    def _indices(self, indices):
+        if indices is None:
+            return np.arange(self.n, dtype=np.int32)
+        indices = np.ascontiguousarray(indices, dtype=np.int32).reshape(-1)
+        if ((indices < 0) | (indices >= self.n)).any():
+            raise IndexError(f"board indices must be in [0, {self.n})")
+        return indices
+
+    def snapshot(self, indices=None):
+        """
+        Saves the full state of boards as raw bytes: the board itself with
+        its hashes, the step counter, the random stream and the position
+        history. Restoring a snapshot with `restore` continues exactly where
+        it was taken.
+
+        Parameters
+        ----------
+        indices: np.array, optional
+            (K,) array of board indices, all boards by default
+
+        Returns
+        -------
+        np.array
+            (K, S) uint8 array, one row per board
+        """
+        self._check_not_pending()
+        indices = self._indices(indices)
+        buf = np.zeros(shape=(len(indices), snapshot_size(self._env)), dtype=np.uint8)
+        snapshot_env(
+            self._env,
+            self.ffi.cast("int *", indices.ctypes.data),
+            len(indices),
+            self.ffi.cast("unsigned char *", buf.ctypes.data),
+        )
+        return buf
+
+    def restore(self, buf, indices=None):
+        """
+        Restores boards from a `snapshot`. Row k of `buf` is written to board
+        `indices[k]`, which does not need to be the board it was taken from.
+
+        Parameters
+        ----------
+        buf: np.array
+            (K, S) uint8 array returned by `snapshot` of an env with the same
+            `history` length
+        indices: np.array, optional
+            (K,) array of distinct board indices, all boards by default
+        """
+        self._check_not_pending()
+        indices = self._check_env_ids(self._indices(indices))
+        size = snapshot_size(self._env)
+        buf = np.ascontiguousarray(buf, dtype=np.uint8)
+        if buf.size != len(indices) * size:
+            raise ValueError(
+                f"buf must hold {len(indices)} snapshots of {size} bytes, "
+                f"got {buf.size} bytes"
+            )
+        restore_env(
+            self._env,
+            self.ffi.cast("int *", indices.ctypes.data),
+            len(indices),
+            self.ffi.cast("unsigned char *", buf.ctypes.data),
+        )
+
+    def clone(self, src, dst):
+        """
+        Copies the full state of boards `src[k]` over boards `dst[k]` in
+        place, see `snapshot`. The random stream is copied as well, reseed
+        the copies to let them diverge.
+
+        Parameters
+        ----------
+        src: np.array
+            (K,) array of board indices to copy from
+        dst: np.array
+            (K,) array of distinct board indices to copy to, none of them
+            in `src`
+        """
+        self._check_not_pending()
+        src = self._indices(src)
+        dst = self._check_env_ids(dst)
+        if src.shape != dst.shape:
+            raise ValueError("src and dst must have the same length")
+        if np.isin(dst, src).any():
+            raise ValueError("A board can not be both copied from and to")
+        clone_env(
+            self._env,
+            self.ffi.cast("int *", src.ctypes.data),
+            self.ffi.cast("int *", dst.ctypes.data),
+            len(src),
+        )
+
+    def push(self, move_arr):
+        """
+        Makes moves on the boards in a way that can be taken back with
+        `pop`, for batched lookahead without copying boards. There is no
+        opponent reply, no reset and no reward. Pushed moves count towards
+        repetitions and the history until popped, and a `step` or `reset`
+        commits them. `stack_depth` holds the number of pushed moves per
+        board, at most MOVE_STACK_DEPTH.
+
+        Parameters
+        ----------
+        move_arr: np.array
+            (N,) array of move integers, -1 leaves a board unchanged
+        """
+        self._check_not_pending()
+        move_arr = np.ascontiguousarray(move_arr, dtype=np.int32).reshape(-1)
+        if move_arr.shape != (self.n,):
+            raise ValueError(f"move_arr must have shape ({self.n},)")
+        if ((move_arr >= 0) & (self.stack_depth >= MOVE_STACK_DEPTH)).any():
+            raise RuntimeError(f"Can not push more than {MOVE_STACK_DEPTH} moves")
+        push_env(self._env, self.ffi.cast("int *", move_arr.ctypes.data))
+
+    def pop(self, k=1):
+        """
+        Takes back the last `k` pushed moves of every board, boards with
+        fewer pushed moves go back to where the first push started.
+
+        Parameters
+        ----------
+        k: int
+            number of moves to take back
+        """
+        self._check_not_pending()
+        pop_env(self._env, int(k))
 
     def invert_boards(self):
-        invert_env(self._env, self.n)
+        if invert_env(self._env, self.n) != 0:
+            raise ValueError(f"Environment can not hold {self.n} boards")
 
     def push_moves(self, move_arr):
         """
@@ -174,15 +1123,262 @@ class CChessEnv:
         )
         self.t[(done == 1)] = 0
 
-    def get_state(self):
-        board_arr = self._make_board_arr()
+    def get_state(self, out=None):
+        self._check_not_pending()
+        if out is None:
+            board_arr = self._make_board_arr()
+        else:
+            board_arr = _check_out(out, (self.n, 69), np.int32, "state")
         get_boards(self._env, self.ffi.cast("int *", board_arr.ctypes.data))
         return board_arr.reshape(self.n, 69)
 
-    def get_mask(self):
-        mask_arr = self._make_mask_arr()
-        get_mask(self._env, self.ffi.cast("int *", mask_arr.ctypes.data))
-        return mask_arr.reshape(self.n, 88 * 64)
+    def get_planes(self, out=None, dtype=None):
+        """
+        Computes AlphaZero style plane observations of every board.
+
+        Planes are 8x8 with rank 8 in the first row, matching the state
+        vector. Planes 0-11 hold the white then black pawns, knights,
+        bishops, rooks, queens and kings, plane 12 is all ones when white is
+        to move, planes 13-16 are all ones when white king side, white queen
+        side, black king side and black queen side castling is available,
+        plane 17 marks the en passant square and plane 18 is all ones.
+
+        Parameters
+        ----------
+        out: np.array, optional
+            array to write the planes into
+        dtype: np.dtype, optional
+            uint8 or float32, defaults to the `planes` constructor argument
+            or uint8
+
+        Returns
+        -------
+        np.array
+            (N, 19, 8, 8) planes
+        """
+        self._check_not_pending()
+        if dtype is None:
+            dtype = self.planes_dtype or np.uint8
+        dtype = _planes_dtype(dtype)
+        shape = (self.n, N_PLANES, 8, 8)
+        if out is None:
+            out = np.zeros(shape=shape, dtype=dtype)
+        else:
+            out = _check_out(out, shape, dtype, "planes")
+
+        if dtype == np.uint8:
+            get_planes(self._env, self.ffi.cast("unsigned char *", out.ctypes.data))
+        else:
+            get_planes_float(self._env, self.ffi.cast("float *", out.ctypes.data))
+        return out.reshape(shape)
+
+    def get_history(self, out=None):
+        """
+        Returns the last `history` positions of every board as state vectors,
+        oldest first. Boards with a shorter game are zero padded at the
+        front. The history restarts whenever a board is reset.
+
+        Parameters
+        ----------
+        out: np.array, optional
+            int32 array to write the history into
+
+        Returns
+        -------
+        np.array
+            (N, history, 69) stacked states
+        """
+        self._check_not_pending()
+        if self.history_len <= 0:
+            raise RuntimeError("Create the env with history > 0 to keep a history")
+        shape = (self.n, self.history_len, 69)
+        if out is None:
+            out = np.zeros(shape=shape, dtype=np.int32)
+        else:
+            out = _check_out(out, shape, np.int32, "history")
+        get_history(self._env, self.ffi.cast("int *", out.ctypes.data))
+        return out.reshape(shape)
+
+    def get_repetitions(self, out=None):
+        """
+        Counts how often the current position of every board occurred
+        before in the same game, 0 for a position seen for the first time.
+
+        Parameters
+        ----------
+        out: np.array, optional
+            int32 array to write the counts into
+
+        Returns
+        -------
+        np.array
+            (N,) repetition counts
+        """
+        self._check_not_pending()
+        if out is None:
+            out = np.zeros(shape=(self.n,), dtype=np.int32)
+        else:
+            out = _check_out(out, (self.n,), np.int32, "repetitions")
+        get_repetitions(self._env, self.ffi.cast("int *", out.ctypes.data))
+        return out
+
+    def get_curriculum(self):
+        """
+        Returns the curriculum statistics of every bank position. Only
+        episodes finished by `step` count, positions that never finished an
+        episode keep an outcome and length of 0.
+
+        Returns
+        -------
+        priority: np.array
+            (M,) float64 current sampling priorities
+        outcome: np.array
+            (M,) float32 running average of the final reward
+        length: np.array
+            (M,) float32 running average of the episode length in steps
+        """
+        if not self.curriculum:
+            raise RuntimeError("Create the env with curriculum > 0 to use one")
+        m = self._reset_positions.shape[0]
+        priority = np.zeros(shape=(m,), dtype=np.float64)
+        outcome = np.zeros(shape=(m,), dtype=np.float32)
+        length = np.zeros(shape=(m,), dtype=np.float32)
+        get_curriculum(
+            self._env,
+            self.ffi.cast("double *", priority.ctypes.data),
+            self.ffi.cast("float *", outcome.ctypes.data),
+            self.ffi.cast("float *", length.ctypes.data),
+        )
+        return priority, outcome, length
+
+    def stats(self):
+        """
+        Returns the counters of the native step since the env was created or
+        `reset_stats` was last called. `step`, `step_async` and `send` count,
+        the other batched calls do not. Times are wall-clock nanoseconds
+        summed over threads, so they exceed the elapsed time when threads run
+        in parallel. The reset phase includes its random_start moves.
+
+        Returns
+        -------
+        dict
+            `<phase>_ns` and `<phase>_calls` for every phase of
+            `STAT_PHASES`, `boards` stepped, `legal_moves` generated and
+            `resets` done, all summed over threads, and `per_thread`, a
+            structured array with the same counters for every thread slot
+        """
+        slots = stats_slots(self._env)
+        if slots == 0:
+            raise RuntimeError("Create the env with stats=True to count them")
+        per_thread = np.zeros(shape=(slots,), dtype=_STATS_DTYPE)
+        get_stats(
+            self._env, self.ffi.cast("unsigned long long *", per_thread.ctypes.data)
+        )
+
+        result = {}
+        ns = per_thread["ns"].sum(axis=0)
+        calls = per_thread["calls"].sum(axis=0)
+        for p, phase in enumerate(STAT_PHASES):
+            result[f"{phase}_ns"] = int(ns[p])
+            result[f"{phase}_calls"] = int(calls[p])
+        for name in ("boards", "legal_moves", "resets"):
+            result[name] = int(per_thread[name].sum())
+        result["per_thread"] = per_thread
+        return result
+
+    def reset_stats(self):
+        """Zeroes the counters of `stats`"""
+        if stats_slots(self._env) == 0:
+            raise RuntimeError("Create the env with stats=True to count them")
+        reset_stats(self._env)
+
+    def get_mask(self, out=None, packed=None, env_ids=None):
+        """
+        Computes the legal move mask of every board.
+
+        Parameters
+        ----------
+        out: np.array, optional
+            array to write the mask into
+        packed: bool, optional
+            return the mask bit-packed, defaults to the env's `packed_mask`
+        env_ids: np.array, optional
+            (K,) indices of the boards to compute the mask of, the result
+            then has K rows in the order of `env_ids`
+
+        Returns
+        -------
+        mask: np.array
+            (N, 5632) int32 mask, or (N, 704) uint8 when packed
+        """
+        self._check_not_pending()
+        if packed is None:
+            packed = self.packed_mask
+        mask_shape, mask_dtype = _mask_layout(packed)
+
+        n = self.n
+        if env_ids is not None:
+            env_ids = self._check_env_ids(env_ids)
+            n = len(env_ids)
+
+        if out is None:
+            mask_arr = np.zeros(shape=(n,) + mask_shape, dtype=mask_dtype)
+        else:
+            mask_arr = _check_out(out, (n,) + mask_shape, mask_dtype, "mask")
+
+        if env_ids is None:
+            if packed:
+                get_mask_packed(
+                    self._env, self.ffi.cast("unsigned char *", mask_arr.ctypes.data)
+                )
+            else:
+                get_mask(self._env, self.ffi.cast("int *", mask_arr.ctypes.data))
+        else:
+            ids = self.ffi.cast("int *", env_ids.ctypes.data)
+            if packed:
+                get_mask_packed_subset(
+                    self._env,
+                    ids,
+                    n,
+                    self.ffi.cast("unsigned char *", mask_arr.ctypes.data),
+                )
+            else:
+                get_mask_subset(
+                    self._env, ids, n, self.ffi.cast("int *", mask_arr.ctypes.data)
+                )
+        return mask_arr.reshape((n,) + mask_shape)
+
+    def get_legal_moves(self, out=None):
+        """
+        Get the legal move ids of every board in CSR form.
+
+        Parameters
+        ----------
+        out: tuple, optional
+            (offsets, ids) int32 arrays of size N + 1 and N * MAX_MOVES to
+            write into
+
+        Returns
+        -------
+        offsets: np.array
+            (N + 1,) row offsets into ids
+        ids: np.array
+            move ids, those of board i are ids[offsets[i]:offsets[i + 1]]
+        """
+        self._check_not_pending()
+        if out is None:
+            offsets = np.zeros(shape=(self.n + 1,), dtype=np.int32)
+            ids = np.zeros(shape=(self.n * MAX_MOVES,), dtype=np.int32)
+        else:
+            offsets = _check_out(out[0], (self.n + 1,), np.int32, "offsets")
+            ids = _check_out(out[1], (self.n * MAX_MOVES,), np.int32, "ids")
+
+        get_legal_moves_csr(
+            self._env,
+            self.ffi.cast("int *", offsets.ctypes.data),
+            self.ffi.cast("int *", ids.ctypes.data),
+        )
+        return offsets, ids[: offsets[-1]]
 
     def get_possible_moves(self):
         """
@@ -193,9 +1389,11 @@ class CChessEnv:
         list:
             List of CMoves objects, one for each board
         """
-        mask = self.get_mask()
-        moves = [CMoves.from_int(np.argwhere(mask[i] == 1)) for i in range(self.n)]
-        return moves
+        # get_legal_moves refuses while boards are being stepped
+        offsets, ids = self.get_legal_moves()
+        return [
+            CMoves.from_int(ids[offsets[i] : offsets[i + 1]]) for i in range(self.n)
+        ]
 
     def random(self):
         move_arr = self._make_move_arr()
@@ -245,8 +1443,36 @@ class SFCChessEnv(CChessEnv):
         Maximum number of random moves at start of game
     invert: bool
         Whether to invert board after each move to ensure white to move
+    seed: int, optional
+        Seed for the per-board random streams
+    buffers: int
+        Number of env-owned output buffer sets, see CChessEnv
+    packed_mask: bool
+        Whether to return bit-packed (N, 704) uint8 masks, see CChessEnv
+    csr_moves: bool
+        Whether to also return the legal moves in CSR form, see CChessEnv
+    pool_threads: int
+        Number of native worker threads used by send/recv, see CChessEnv
+    planes: np.dtype, optional
+        uint8 or float32 to also compute plane observations, see CChessEnv
+    history: int
+        Number of past positions kept per board, see CChessEnv
+    reset_positions: np.array or path, optional
+        Bank of starting positions for resets, see CChessEnv
+    reset_weights: np.array, optional
+        Sampling weights of the bank positions, see CChessEnv
+    curriculum: float
+        Rate of the outcome-adaptive bank sampling, see CChessEnv
+    threads: int
+        Number of native threads, see CChessEnv
+    stats: bool
+        Whether to count per-phase step stats, see CChessEnv
+    shaping: dict, optional
+        Weights of the native shaping terms, see CChessEnv
     """
 
+    opponent = OPPONENT_STOCKFISH
+
     def __init__(
         self,
         n,
@@ -256,6 +1482,19 @@ class SFCChessEnv(CChessEnv):
         min_random=0,
         max_random=0,
         invert=False,
+        seed=None,
+        buffers=2,
+        packed_mask=False,
+        csr_moves=False,
+        pool_threads=0,
+        planes=None,
+        history=0,
+        reset_positions=None,
+        reset_weights=None,
+        curriculum=0,
+        threads=0,
+        stats=False,
+        shaping=None,
     ):
         super().__init__(
             n,
@@ -264,12 +1503,29 @@ class SFCChessEnv(CChessEnv):
             min_random=min_random,
             max_random=max_random,
             invert=invert,
+            seed=seed,
+            buffers=buffers,
+            packed_mask=packed_mask,
+            csr_moves=csr_moves,
+            pool_threads=pool_threads,
+            planes=planes,
+            history=history,
+            reset_positions=reset_positions,
+            reset_weights=reset_weights,
+            curriculum=curriculum,
+            threads=threads,
+            stats=stats,
+            shaping=shaping,
         )
         self._sfa = fastchessenv_c.ffi.new("SFArray *")
         # We need enough Stockfish instances to handle n environments
         # The third parameter is the number of threads/stockfish instances to use
-        create_sfarray(self._sfa, depth, n)
+        if create_sfarray(self._sfa, depth, n) != 0:
+            raise MemoryError("Could not allocate the Stockfish array")
         self.depth = depth
+        # Boards block on their Stockfish pipe, run one thread per instance
+        if not threads:
+            self.set_threads(self._sfa.N)
 
     def sample_opponent(self):
         move_arr = self._make_move_arr()
@@ -279,6 +1535,7 @@ class SFCChessEnv(CChessEnv):
         return move_arr
 
     def __del__(self):
+        super().__del__()
         clean_sfarray(self._sfa)
 
 
@@ -303,10 +1560,55 @@ class RandomChessEnv(CChessEnv):
         Maximum number of random moves at start of game
     invert: bool
         Whether to invert board after each move to ensure white to move
+    seed: int, optional
+        Seed for the per-board random streams
+    buffers: int
+        Number of env-owned output buffer sets, see CChessEnv
+    packed_mask: bool
+        Whether to return bit-packed (N, 704) uint8 masks, see CChessEnv
+    csr_moves: bool
+        Whether to also return the legal moves in CSR form, see CChessEnv
+    pool_threads: int
+        Number of native worker threads used by send/recv, see CChessEnv
+    planes: np.dtype, optional
+        uint8 or float32 to also compute plane observations, see CChessEnv
+    history: int
+        Number of past positions kept per board, see CChessEnv
+    reset_positions: np.array or path, optional
+        Bank of starting positions for resets, see CChessEnv
+    reset_weights: np.array, optional
+        Sampling weights of the bank positions, see CChessEnv
+    curriculum: float
+        Rate of the outcome-adaptive bank sampling, see CChessEnv
+    threads: int
+        Number of native threads, see CChessEnv
+    stats: bool
+        Whether to count per-phase step stats, see CChessEnv
+    shaping: dict, optional
+        Weights of the native shaping terms, see CChessEnv
     """
 
     def __init__(
-        self, n, max_step=100, draw_reward=0, min_random=0, max_random=0, invert=False
+        self,
+        n,
+        max_step=100,
+        draw_reward=0,
+        min_random=0,
+        max_random=0,
+        invert=False,
+        seed=None,
+        buffers=2,
+        packed_mask=False,
+        csr_moves=False,
+        pool_threads=0,
+        planes=None,
+        history=0,
+        reset_positions=None,
+        reset_weights=None,
+        curriculum=0,
+        threads=0,
+        stats=False,
+        shaping=None,
     ):
         super().__init__(
             n,
@@ -315,6 +1617,19 @@ class RandomChessEnv(CChessEnv):
             min_random=min_random,
             max_random=max_random,
             invert=invert,
+            seed=seed,
+            buffers=buffers,
+            packed_mask=packed_mask,
+            csr_moves=csr_moves,
+            pool_threads=pool_threads,
+            planes=planes,
+            history=history,
+            reset_positions=reset_positions,
+            reset_weights=reset_weights,
+            curriculum=curriculum,
+            threads=threads,
+            stats=stats,
+            shaping=shaping,
         )
 
     def sample_opponent(self):
@@ -11,10 +11,13 @@ from fastchessenv_c.lib import (
     board_arr_to_mask,
     fen_to_array,
     int_to_move_arr,
+    invert_arrays,
     legal_mask_to_move_arr_mask,
     move_arr_to_int,
     move_str_to_array,
     parallel_array_to_possible,
+    rollout_arrays,
+    transition_arrays,
 )
 
 _ffi = FFI()
@@ -135,7 +138,6 @@ class CBoard:
 
     @classmethod
     def from_fen(cls, fen_str):
-        fen_str = fen_str.replace("-", "")
         return cls(_fen_to_array(fen_str))
 
     def to_array(self):
@@ -371,6 +373,156 @@ class CBoards:
         return [chess.Board(f) for f in fens]
 
 
+def unpack_mask(packed, dtype=np.bool_):
+    """
+    Expands bit-packed masks back into dense move masks.
+
+    Parameters
+    ----------
+    packed: np.array
+        (..., 704) uint8 array, as returned by an env with `packed_mask=True`
+    dtype: np.dtype
+        dtype of the dense mask, e.g. bool or np.float32
+
+    Returns
+    -------
+    np.array
+        (..., 5632) dense mask
+    """
+    mask = np.unpackbits(np.asarray(packed, dtype=np.uint8), axis=-1, count=88 * 64)
+    if np.dtype(dtype) == np.bool_:
+        return mask.view(np.bool_)
+    return mask.astype(dtype)
+
+
+def invert_boards(board_arrs):
+    """
+    Mirrors boards vertically and swaps piece colors, the array version of
+    the inversion applied by envs with `invert=True`.
+
+    Parameters
+    ----------
+    board_arrs: np.array
+        (N, 69) or (69,) board arrays
+
+    Returns
+    -------
+    np.array
+        int32 array of the same shape with every board inverted
+    """
+    board_arrs = np.array(board_arrs, dtype=np.int32, order="C")
+    invert_arrays(
+        _ffi.cast("int *", board_arrs.ctypes.data),
+        board_arrs.size // 69,
+    )
+    return board_arrs
+
+
+def transition(boards, moves):
+    """
+    Plays one move on each of a batch of board arrays, independent of any
+    env. Runs in parallel in C.
+
+    Only checkmate, stalemate and insufficient material end a game, as the
+    arrays carry no move history for repetitions or the fifty move rule.
+
+    Parameters
+    ----------
+    boards: np.array
+        (N, 69) board arrays
+    moves: np.array
+        (N,) move integers, each legal on its board
+
+    Returns
+    -------
+    next_boards: np.array
+        (N, 69) int32 board arrays after the moves
+    mask: np.array
+        (N, 5632) int32 legal move masks of the new positions
+    terminated: np.array
+        (N,) bool, whether the move ended the game
+    reward: np.array
+        (N,) float32 reward of the side that moved, 1 for checkmate
+    """
+    boards = np.ascontiguousarray(boards, dtype=np.int32).reshape(-1, 69)
+    moves = np.ascontiguousarray(moves, dtype=np.int32).reshape(-1)
+    n = boards.shape[0]
+    if moves.shape != (n,):
+        raise ValueError("boards and moves must have the same length")
+
+    next_boards = np.zeros(shape=(n, 69), dtype=np.int32)
+    mask = np.zeros(shape=(n, 88 * 64), dtype=np.int32)
+    terminated = np.zeros(shape=(n,), dtype=np.int32)
+    reward = np.zeros(shape=(n,), dtype=np.float32)
+    transition_arrays(
+        _ffi.cast("int *", boards.ctypes.data),
+        _ffi.cast("int *", moves.ctypes.data),
+        n,
+        _ffi.cast("int *", next_boards.ctypes.data),
+        _ffi.cast("int *", mask.ctypes.data),
+        _ffi.cast("int *", terminated.ctypes.data),
+        _ffi.cast("float *", reward.ctypes.data),
+    )
+    return next_boards, mask, terminated.astype(bool), reward
+
+
+def rollout(boards, n_playouts, max_plies=200, seed=None):
+    """
+    Plays random games to the end from each of a batch of board arrays, all
+    in a single parallel region in C.
+
+    Results are from the point of view of the side to move on each board.
+    Games are won or lost by checkmate and drawn by stalemate, insufficient
+    material, the fifty move rule or running out of `max_plies`.
+
+    Parameters
+    ----------
+    boards: np.array
+        (N, 69) board arrays
+    n_playouts: int
+        number of random games per board
+    max_plies: int
+        maximum length of a game, longer games count as draws
+    seed: int, optional
+        seed of the playout random streams, fresh entropy by default
+
+    Returns
+    -------
+    wins: np.array
+        (N,) int32 number of won playouts
+    draws: np.array
+        (N,) int32 number of drawn playouts
+    losses: np.array
+        (N,) int32 number of lost playouts
+    mean_length: np.array
+        (N,) float32 mean number of plies played
+    """
+    if n_playouts < 0:
+        raise ValueError("n_playouts must be non-negative")
+    boards = np.ascontiguousarray(boards, dtype=np.int32).reshape(-1, 69)
+    n = boards.shape[0]
+    seed = int(np.random.SeedSequence(seed).generate_state(1, np.uint64)[0])
+
+    wins = np.zeros(shape=(n,), dtype=np.int32)
+    draws = np.zeros(shape=(n,), dtype=np.int32)
+    losses = np.zeros(shape=(n,), dtype=np.int32)
+    mean_length = np.zeros(shape=(n,), dtype=np.float32)
+    status = rollout_arrays(
+        _ffi.cast("int *", boards.ctypes.data),
+        n,
+        int(n_playouts),
+        int(max_plies),
+        seed,
+        _ffi.cast("int *", wins.ctypes.data),
+        _ffi.cast("int *", draws.ctypes.data),
+        _ffi.cast("int *", losses.ctypes.data),
+        _ffi.cast("float *", mean_length.ctypes.data),
+    )
+    if status != 0:
+        raise MemoryError(f"Could not allocate {n} x {n_playouts} playouts")
+    return wins, draws, losses, mean_length
+
+
 """
 Below is the wrapper code for interacting with the C library. These functions
 wrap the underlying C defintion with a function that only operates on numpy
@@ -380,6 +532,9 @@ arrays for simplicity. See src/ and build.py
 
 def _fen_to_array(fen_str):
     """Converts a fen to a board array"""
+    # MisterQueen's parser stops on a "-" castling field without stepping
+    # past it, which drops the en passant square that follows.
+    fen_str = fen_str.replace("-", "")
     board_arr = np.zeros(shape=(69), dtype=np.int32)
     x = _ffi.new(f"char[{len(fen_str) + 10}]", bytes(fen_str, encoding="utf-8"))
     fen_to_array(_ffi.cast("int *", board_arr.ctypes.data), _ffi.cast("char *", x))
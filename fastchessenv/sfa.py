@@ -19,7 +19,8 @@ class SFArray:
         self._sfa = fastchessenv_c.ffi.new("SFArray *")
         # The third parameter specifies how many Stockfish instances to create
         # If n_threads is 0, it will use a reasonable default based on CPU cores
-        create_sfarray(self._sfa, self.depth, n_threads)
+        if create_sfarray(self._sfa, self.depth, n_threads) != 0:
+            raise MemoryError("Could not allocate the Stockfish array")
 
     def get_moves(self, board_arr):
         N = board_arr.shape[0]
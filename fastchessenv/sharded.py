@@ -0,0 +1,292 @@
+import multiprocessing as mp
+import traceback
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from fastchessenv.env import CChessEnv, _mask_layout, _read_only
+
+_RESET = 1
+_STEP = 2
+_CLOSE = 3
+
+
+def _layout(n, k, packed):
+    """Name, shape, dtype and byte offset of every shared array, together
+    with the total size of the block"""
+    mask_shape, mask_dtype = _mask_layout(packed)
+    arrays = [
+        ("actions", (n,), np.int32),
+        ("state", (n, 69), np.int32),
+        ("mask", (n,) + mask_shape, mask_dtype),
+        ("reward", (n,), np.float32),
+        ("done", (n,), np.bool_),
+        ("terminated", (n,), np.int32),
+        ("truncated", (n,), np.int32),
+        ("reason", (n,), np.int32),
+        ("command", (k,), np.int32),
+        ("status", (k,), np.int32),
+    ]
+    layout = []
+    offset = 0
+    for name, shape, dtype in arrays:
+        layout.append((name, shape, dtype, offset))
+        # Keep every array on its own cache lines
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        offset += -(-size // 64) * 64
+    return layout, offset
+
+
+def _shared_arrays(buf, n, k, packed):
+    """Views of the shared arrays in buf by name"""
+    layout, _ = _layout(n, k, packed)
+    return {
+        name: np.ndarray(shape, dtype=dtype, buffer=buf, offset=offset)
+        for name, shape, dtype, offset in layout
+    }
+
+
+def _shard_worker(name, n, k, shard, lo, hi, packed, seed, env_cls, kwargs, cmd, done):
+    shm = shared_memory.SharedMemory(name=name)
+    arrays = _shared_arrays(shm.buf, n, k, packed)
+    rows = slice(lo, hi)
+    env = None
+    try:
+        try:
+            env = env_cls(hi - lo, packed_mask=packed, **kwargs)
+            if seed is not None:
+                # The streams of boards lo..hi of one env with this seed
+                env.seed(seed, first_index=lo)
+            arrays["status"][shard] = 0
+        except Exception:
+            traceback.print_exc()
+            arrays["status"][shard] = 1
+        done.release()
+        if env is None:
+            return
+
+        while True:
+            cmd.acquire()
+            command = arrays["command"][shard]
+            if command == _CLOSE:
+                break
+            try:
+                if command == _RESET:
+                    env.reset(out=(arrays["state"][rows], arrays["mask"][rows]))
+                    arrays["terminated"][rows] = 0
+                    arrays["truncated"][rows] = 0
+                    arrays["reason"][rows] = 0
+                else:
+                    env.step(
+                        arrays["actions"][rows],
+                        out=(
+                            arrays["state"][rows],
+                            arrays["mask"][rows],
+                            arrays["reward"][rows],
+                            arrays["done"][rows],
+                        ),
+                    )
+                    arrays["terminated"][rows] = env.terminated
+                    arrays["truncated"][rows] = env.truncated
+                    arrays["reason"][rows] = env.reason
+                arrays["status"][shard] = 0
+            except Exception:
+                traceback.print_exc()
+                arrays["status"][shard] = 1
+            done.release()
+    finally:
+        # Views into the block must go before it can be closed
+        del env, arrays
+        shm.close()
+
+
+class ShardedChessEnv:
+    """
+    Boards split over worker processes
+
+    Every worker owns a CChessEnv over a contiguous shard of the boards and
+    steps it in place inside one shared memory block holding the actions
+    and all outputs. Workers are woken and waited on through a pair of
+    semaphores each, nothing is pickled per step, so stepping scales with
+    the number of processes rather than being bound by one interpreter.
+
+    With a seed, the boards get the same random streams as in a single
+    `CChessEnv(n, seed=seed)`, so runs replay independent of the shards.
+
+    Example
+    -------
+    >>> env = ShardedChessEnv(1024, shards=8)
+    >>> state, mask = env.reset()
+    >>> action = ...
+    >>> state, mask, reward, done = env.step(action)
+    >>> env.close()
+
+    Parameters
+    ----------
+    n: int
+        Total number of boards
+    shards: int
+        Number of worker processes
+    env_cls: type
+        CChessEnv subclass every worker runs
+    seed: int, optional
+        Seed for the per-board random streams
+    packed_mask: bool
+        Whether to return bit-packed (N, 704) uint8 masks, see CChessEnv
+    start_method: str
+        multiprocessing start method of the workers. spawn is the default
+        as forking a process that already ran OpenMP is unsafe.
+    **kwargs
+        Passed on to `env_cls`, see CChessEnv
+    """
+
+    def __init__(
+        self,
+        n,
+        shards=2,
+        env_cls=CChessEnv,
+        seed=None,
+        packed_mask=False,
+        start_method="spawn",
+        **kwargs,
+    ):
+        if not 0 < shards <= n:
+            raise ValueError(f"shards must be in [1, {n}]")
+        self.n = n
+        self.shards = shards
+        self.packed_mask = packed_mask
+        self._procs = []
+        self._shm = shared_memory.SharedMemory(
+            create=True, size=_layout(n, shards, packed_mask)[1]
+        )
+        self._arrays = _shared_arrays(self._shm.buf, n, shards, packed_mask)
+
+        # Board offsets of the shards, shard s holds boards offsets[s]..offsets[s + 1]
+        self.offsets = bounds = [n * s // shards for s in range(shards + 1)]
+        ctx = mp.get_context(start_method)
+        self._cmd = [ctx.Semaphore(0) for _ in range(shards)]
+        self._done = [ctx.Semaphore(0) for _ in range(shards)]
+        for s in range(shards):
+            proc = ctx.Process(
+                target=_shard_worker,
+                args=(
+                    self._shm.name,
+                    n,
+                    shards,
+                    s,
+                    bounds[s],
+                    bounds[s + 1],
+                    packed_mask,
+                    seed,
+                    env_cls,
+                    kwargs,
+                    self._cmd[s],
+                    self._done[s],
+                ),
+                daemon=True,
+            )
+            proc.start()
+            self._procs.append(proc)
+
+        try:
+            self._wait()
+        except RuntimeError:
+            self.close()
+            raise
+
+        self.terminated = _read_only(self._arrays["terminated"])
+        self.truncated = _read_only(self._arrays["truncated"])
+        self.reason = _read_only(self._arrays["reason"])
+
+    def _wait(self):
+        """Waits for every worker to finish its command"""
+        for proc, done in zip(self._procs, self._done):
+            while not done.acquire(timeout=1.0):
+                if not proc.is_alive():
+                    raise RuntimeError(f"Shard worker {proc.name} died")
+        if self._arrays["status"].any():
+            failed = np.flatnonzero(self._arrays["status"]).tolist()
+            raise RuntimeError(f"Shard workers {failed} failed, see their traceback")
+
+    def _run(self, command):
+        if self._shm is None:
+            raise RuntimeError("The env is closed")
+        self._arrays["command"][:] = command
+        for cmd in self._cmd:
+            cmd.release()
+        self._wait()
+
+    def reset(self):
+        """
+        Resets every board, see `CChessEnv.reset`.
+
+        Returns
+        -------
+        state: np.array
+            (N, 69) read-only view of the board states
+        mask: np.array
+            (N, 5632) read-only view of the move masks, (N, 704) bytes when
+            `packed_mask` is set
+        """
+        self._run(_RESET)
+        return _read_only(self._arrays["state"]), _read_only(self._arrays["mask"])
+
+    def step(self, move_arr):
+        """
+        Steps every shard one timestep, see `CChessEnv.step`. The outputs
+        are views into the shared block that the next call overwrites, the
+        termination split is kept in `self.terminated`, `self.truncated` and
+        `self.reason`.
+
+        Parameters
+        ----------
+        move_arr: np.array
+            (N,) array of move integers
+
+        Returns
+        -------
+        state: np.array
+            (N, 69) vector representing the board state
+        mask: np.array
+            (N, 5632) move masks, (N, 704) bytes when `packed_mask` is set
+        reward: np.array
+            (N,) float32 rewards
+        done: np.array
+            (N,) whether the game of each board ended
+        """
+        if self._shm is None:
+            raise RuntimeError("The env is closed")
+        np.copyto(
+            self._arrays["actions"], np.asarray(move_arr).reshape(-1), casting="unsafe"
+        )
+        self._run(_STEP)
+        return tuple(
+            _read_only(self._arrays[name])
+            for name in ("state", "mask", "reward", "done")
+        )
+
+    def close(self):
+        """Stops the workers and frees the shared block"""
+        if getattr(self, "_shm", None) is None:
+            return
+        self._arrays["command"][:] = _CLOSE
+        for proc, cmd in zip(self._procs, self._cmd):
+            if proc.is_alive():
+                cmd.release()
+        for proc in self._procs:
+            proc.join(timeout=5)
+            if proc.is_alive():
+                proc.kill()
+
+        self._arrays = None
+        self.terminated = self.truncated = self.reason = None
+        self._shm.unlink()
+        try:
+            self._shm.close()
+        except BufferError:
+            # Results still held by the caller keep the mapping alive
+            pass
+        self._shm = None
+
+    def __del__(self):
+        self.close()
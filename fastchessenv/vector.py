@@ -0,0 +1,130 @@
+import gymnasium as gym
+import numpy as np
+from gymnasium import spaces
+from gymnasium.vector import AutoresetMode
+
+from fastchessenv.env import RandomChessEnv
+
+
+class ChessVectorEnv(gym.vector.VectorEnv):
+    """
+    Gymnasium vector env over a batch of native boards
+
+    Observations are the (N, 69) board arrays and actions the move integers
+    of `CMove.to_int`. Stepping, the terminated/truncated split and the
+    autoreset of finished boards all happen in one native call, so the env
+    follows the same-step autoreset mode: a board whose game ended returns
+    the first observation of its next game, with the last position of the
+    finished game in `info["final_obs"]` where `info["_final_obs"]` is set.
+
+    The info dict holds arrays with one row per board:
+
+    - `action_mask`: legal move mask of the returned observation
+    - `reason`: END_* code of why the game ended, see `CChessEnv.step`,
+      valid where `_reason` is set
+    - `final_obs`: last position of the finished games, valid where
+      `_final_obs` is set
+    - `shaped_reward`: weighted shaping terms of the step, only when the
+      env is created with `shaping`, see `CChessEnv`
+
+    Returned arrays are read-only views into env-owned buffers that stay
+    valid for `buffers - 1` further calls, copy them to keep them longer.
+
+    Example
+    -------
+    >>> env = ChessVectorEnv(8)
+    >>> obs, info = env.reset(seed=0)
+    >>> action = ...
+    >>> obs, reward, terminated, truncated, info = env.step(action)
+
+    Parameters
+    ----------
+    num_envs: int
+        Number of parallel boards
+    env_cls: type
+        CChessEnv subclass that plays the opponent, RandomChessEnv by default
+    **kwargs
+        Passed on to `env_cls`, see CChessEnv
+    """
+
+    metadata = {"autoreset_mode": AutoresetMode.SAME_STEP}
+
+    def __init__(self, num_envs, env_cls=RandomChessEnv, **kwargs):
+        if kwargs.get("packed_mask"):
+            raise ValueError("ChessVectorEnv needs unpacked action masks")
+        self.env = env_cls(num_envs, **kwargs)
+        self.num_envs = num_envs
+
+        self.single_observation_space = spaces.Box(
+            0, 23, shape=(69,), dtype=np.int32
+        )
+        self.single_action_space = spaces.Discrete(88 * 64)
+        self.observation_space = spaces.Box(
+            0, 23, shape=(num_envs, 69), dtype=np.int32
+        )
+        self.action_space = spaces.MultiDiscrete(np.full(num_envs, 88 * 64))
+
+    def reset(self, *, seed=None, options=None):
+        """
+        Resets every board.
+
+        Parameters
+        ----------
+        seed: int or list, optional
+            One seed for all boards, each board gets seed + index, or one
+            seed per board
+        options: dict, optional
+            Unused
+
+        Returns
+        -------
+        obs: np.array
+            (N, 69) board arrays
+        info: dict
+            `action_mask` of the new positions
+        """
+        if seed is not None:
+            if np.ndim(seed) == 0:
+                seed = [seed + i for i in range(self.num_envs)]
+            self.env.reseed(np.arange(self.num_envs), seed)
+        state, mask = self.env.reset()
+        return state, {"action_mask": mask}
+
+    def step(self, actions):
+        """
+        Plays one move on every board and autoresets finished games.
+
+        Parameters
+        ----------
+        actions: np.array
+            (N,) move integers
+
+        Returns
+        -------
+        obs: np.array
+            (N, 69) board arrays, the new game for boards that finished
+        reward: np.array
+            (N,) float32 rewards of the agent
+        terminated: np.array
+            (N,) games that ended by checkmate or a draw rule
+        truncated: np.array
+            (N,) games cut off at `max_step`
+        info: dict
+            see the class docstring
+        """
+        state, mask, reward, done = self.env.step(actions)
+        terminated = self.env.terminated.astype(bool)
+        truncated = self.env.truncated.astype(bool)
+        info = {
+            "action_mask": mask,
+            "reason": self.env.reason,
+            "_reason": done,
+            "final_obs": self.env.final_state,
+            "_final_obs": done,
+        }
+        if self.env.shaping is not None:
+            info["shaped_reward"] = self.env.shaped_reward
+        return state, reward, terminated, truncated, info
+
+    def close_extras(self, **kwargs):
+        self.env = None
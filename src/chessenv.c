@@ -5,54 +5,792 @@
 #include <signal.h>
 #include <math.h>
 #include <time.h>
+#include <pthread.h>
 
 #include "chessenv.h"
+#include "sfarray.h"
 #include "rep.h"
 #include "move_map.h"
+#include "curriculum.h"
+#include "threads.h"
+#include "stats.h"
 
 #include "board.h"
 #include "move.h"
 #include "gen.h"
 
 // Forward declarations
-void random_step_board(Board *board, int n_moves);
-void random_step_board_invert(Board *board, int n_moves);
+int random_step_board(Board *board, int n_moves, unsigned long long *rng, Move *possible_moves);
+int random_step_board_invert(Board *board, int n_moves, unsigned long long *rng, Move *possible_moves);
 void board_to_mask(Board *board, int *move_mask);
+static void moves_to_ids(Move *possible_moves, int total_legal, int *move_ids);
+static void ids_to_mask(int *move_ids, int total_legal, int *move_mask);
+static void record_position(Env *env, size_t i);
+static void clear_history(Env *env, size_t i);
+static void count_halfmove(Env *env, size_t i, Move *move);
+static int reset_board(Env *env, size_t i, int thread);
+static int bank_reset_board(Env *env, size_t i, int invert);
 
-/** Resets the boards in the environment */
-void reset_env(Env* env, int n) {
+/* Arguments of the loop bodies run by parallel_for, each body reads the
+ * fields its function passes */
+typedef struct {
+    Env *env;
+    SFArray *sfa;
+    int opponent;
+    int *moves;
+    int *ids;
+    int *flags;
+    void *out;
+    int n;
+    int min_rand;
+    int max_rand;
+    int full;
+} Loop;
 
-    bb_init();
-    srand(time(0));
+/** Allocates an environment with storage for n boards */
+Env *create_env(size_t n) {
+    Env *env = calloc(1, sizeof(Env));
+    if (env == NULL) {
+        return NULL;
+    }
 
-    for (size_t i = 0; i < (size_t)n; i++){
-        board_reset(&env->boards[i]);
+    env->boards = calloc(n, sizeof(Board));
+    env->t = calloc(n, sizeof(int));
+    env->rng = calloc(n, sizeof(unsigned long long));
+    env->legal = calloc(n * MAX_MOVES, sizeof(Move));
+    env->n_legal = malloc(n * sizeof(int));
+    env->hashes = calloc(n * HASH_HISTORY, sizeof(unsigned long long));
+    env->n_plies = calloc(n, sizeof(int));
+    env->halfmove = calloc(n, sizeof(int));
+    env->stack = calloc(n * MOVE_STACK_DEPTH, sizeof(StackEntry));
+    env->stack_len = calloc(n, sizeof(int));
+    env->threads = create_thread_config(0);
+    if (env->boards == NULL || env->t == NULL || env->rng == NULL
+            || env->legal == NULL || env->n_legal == NULL
+            || env->hashes == NULL || env->n_plies == NULL || env->halfmove == NULL
+            || env->stack == NULL || env->stack_len == NULL || env->threads == NULL) {
+        free_env(env);
+        return NULL;
+    }
 
+    for (size_t i = 0; i < n; i++) {
+        env->n_legal[i] = -1;
     }
+
+    env->capacity = n;
     env->N = n;
+    env->max_step = 100;
+    seed_env(env, (unsigned long long)time(0), 0);
+    return env;
+}
+
+/** Frees an environment created by create_env */
+void free_env(Env *env) {
+    if (env == NULL) {
+        return;
+    }
+    step_env_wait(env);
+    free(env->boards);
+    free(env->t);
+    free(env->rng);
+    free(env->legal);
+    free(env->n_legal);
+    free(env->hashes);
+    free(env->n_plies);
+    free(env->halfmove);
+    free(env->history);
+    free(env->stack);
+    free(env->stack_len);
+    free(env->stack_history);
+    free_curriculum(env->curriculum);
+    free(env->start_idx);
+    free_thread_config(env->threads);
+    free_stats(env->stats);
+    free(env);
+}
+
+/** Checks that n boards fit in the environment storage, returns -1 if not */
+static int check_capacity(Env *env, int n) {
+    if (n < 0 || (size_t)n > env->capacity) {
+        return -1;
+    }
+    return 0;
+}
+
+/** Regenerates the cached legal moves of board i after the board changed */
+static int refresh_legal(Env *env, size_t i) {
+    env->n_legal[i] = gen_legal_moves(&env->boards[i], env->legal + i * MAX_MOVES);
+    return env->n_legal[i];
+}
+
+/** Returns the cached legal moves of board i, generating them only if the
+ * board changed since they were last computed */
+static Move *cached_legal(Env *env, size_t i, int *total) {
+    if (env->n_legal[i] < 0) {
+        refresh_legal(env, i);
+    }
+    *total = env->n_legal[i];
+    return env->legal + i * MAX_MOVES;
+}
+
+/** Sets the number of past positions kept per board for get_history,
+ * returns -1 if they could not be allocated */
+int set_history_len(Env *env, int history_len) {
+    int *history = NULL;
+    int *stack_history = NULL;
+    if (history_len > 0) {
+        history = calloc(env->capacity * history_len * 69, sizeof(int));
+        stack_history = calloc(env->capacity * MOVE_STACK_DEPTH * 69, sizeof(int));
+        if (history == NULL || stack_history == NULL) {
+            free(history);
+            free(stack_history);
+            return -1;
+        }
+    }
+    free(env->history);
+    free(env->stack_history);
+    env->history = history;
+    env->stack_history = stack_history;
+    env->history_len = history_len;
+    for (size_t i = 0; i < env->N; i++) {
+        clear_history(env, i);
+    }
+    return 0;
+}
+
+/** Appends the current position of board i to its history */
+static void record_position(Env *env, size_t i) {
+    Board *board = &env->boards[i];
+    int ply = env->n_plies[i];
+
+    env->hashes[i * HASH_HISTORY + ply % HASH_HISTORY] = board->hash;
+    if (env->history_len > 0) {
+        int slot = ply % env->history_len;
+        board_to_array(env->history + (i * env->history_len + slot) * 69, *board);
+    }
+    env->n_plies[i] = ply + 1;
+}
+
+/** Starts a new history for board i at its current position, this also
+ * restarts the fifty move count */
+static void clear_history(Env *env, size_t i) {
+    env->n_plies[i] = 0;
+    env->halfmove[i] = 0;
+    env->stack_len[i] = 0;
+    if (env->start_idx != NULL) {
+        env->start_idx[i] = -1;
+    }
+    record_position(env, i);
+}
+
+/** Updates the fifty move count of board i for a move about to be made */
+static void count_halfmove(Env *env, size_t i, Move *move) {
+    Board *board = &env->boards[i];
+    if (PIECE(board->squares[move->src]) == PAWN || board->squares[move->dst] != EMPTY) {
+        env->halfmove[i] = 0;
+    } else {
+        env->halfmove[i] += 1;
+    }
+}
+
+/** Overwrites the latest history entry of board i, for changes that are not
+ * a move such as inverting the board */
+static void rerecord_position(Env *env, size_t i) {
+    if (env->n_plies[i] > 0) {
+        env->n_plies[i] -= 1;
+    }
+    record_position(env, i);
+}
+
+/** Number of earlier positions of board i, within the last HASH_HISTORY
+ * plies, with the same hash as the current position. Only positions with the
+ * same side to move since the last capture or pawn move can repeat, so only
+ * those are compared */
+int repetition_count(Env *env, size_t i) {
+    int ply = env->n_plies[i] - 1;
+    if (ply < 0) {
+        return 0;
+    }
+
+    unsigned long long *hashes = env->hashes + i * HASH_HISTORY;
+    unsigned long long hash = hashes[ply % HASH_HISTORY];
+    int oldest = ply - env->halfmove[i];
+    if (oldest < ply - HASH_HISTORY + 1) {
+        oldest = ply - HASH_HISTORY + 1;
+    }
+    if (oldest < 0) {
+        oldest = 0;
+    }
+
+    int count = 0;
+    for (int p = ply - 2; p >= oldest; p -= 2) {
+        count += hashes[p % HASH_HISTORY] == hash;
+    }
+    return count;
+}
+
+/** Checks for positions where neither side can checkmate: bare kings, a
+ * single minor piece, or only bishops all on the same square color */
+static int insufficient_material(Board *board) {
+    int minors = 0;
+    int knights = 0;
+    int bishop_colors = 0;
+
+    for (int sq = 0; sq < 64; sq++) {
+        switch (PIECE(board->squares[sq])) {
+            case PAWN:
+            case ROOK:
+            case QUEEN:
+                return 0;
+            case KNIGHT:
+                minors++;
+                knights++;
+                break;
+            case BISHOP:
+                minors++;
+                bishop_colors |= 1 << ((sq / 8 + sq % 8) % 2);
+                break;
+        }
+    }
+
+    if (minors <= 1) {
+        return 1;
+    }
+    return knights == 0 && bishop_colors != 3;
+}
+
+/** Material of the side to move minus that of the other side, in pawns */
+static int material_balance(Board *board) {
+    int balance = 0;
+
+    for (int sq = 0; sq < 64; sq++) {
+        int piece = board->squares[sq];
+        int value;
+        switch (PIECE(piece)) {
+            case PAWN:
+                value = 1;
+                break;
+            case KNIGHT:
+            case BISHOP:
+                value = 3;
+                break;
+            case ROOK:
+                value = 5;
+                break;
+            case QUEEN:
+                value = 9;
+                break;
+            default:
+                continue;
+        }
+        balance += COLOR(piece) == board->color ? value : -value;
+    }
+    return balance;
+}
+
+/** Returns the END_* reason the game on board i is over, END_NONE if it is
+ * not. total is the number of legal moves of the side to move */
+static int end_reason(Env *env, size_t i, int total) {
+    Board *board = &env->boards[i];
+
+    if (total == 0) {
+        return is_check(board) ? END_CHECKMATE : END_STALEMATE;
+    }
+    if (repetition_count(env, i) >= 2) {
+        return END_REPETITION;
+    }
+    if (env->halfmove[i] >= 100) {
+        return END_FIFTY_MOVES;
+    }
+    if (insufficient_material(board)) {
+        return END_MATERIAL;
+    }
+    return END_NONE;
+}
+
+/** Writes the last history_len positions of board i, oldest first, zero
+ * filled when the game is shorter */
+static void board_history(Env *env, size_t i, int *history) {
+    int T = env->history_len;
+    int plies = env->n_plies[i];
+    for (int j = 0; j < T; j++) {
+        int ply = plies - T + j;
+        int *dst = history + j * 69;
+        if (ply < 0) {
+            memset(dst, 0, sizeof(int) * 69);
+        } else {
+            memcpy(dst, env->history + (i * T + ply % T) * 69, sizeof(int) * 69);
+        }
+    }
+}
+
+static void history_body(void *arg, size_t i, int thread) {
+    Loop *loop = arg;
+    Env *env = loop->env;
+    int *history = loop->out;
+
+    board_history(env, i, history + i * env->history_len * 69);
+}
+
+/** Writes the (N, history_len, 69) stacked past positions of every board */
+void get_history(Env *env, int *history) {
+
+    parallel_for(env->threads, env->N, history_body, &(Loop){.env = env, .out = history});
+}
+
+static void repetitions_body(void *arg, size_t i, int thread) {
+    Loop *loop = arg;
+    Env *env = loop->env;
+    int *repetitions = loop->out;
+
+    repetitions[i] = repetition_count(env, i);
+}
+
+/** Writes the repetition count of every board, see repetition_count */
+void get_repetitions(Env *env, int *repetitions) {
+
+    parallel_for(env->threads, env->N, repetitions_body, &(Loop){.env = env, .out = repetitions});
+}
+
+/** Size in bytes of the snapshot of one board, see snapshot_env */
+size_t snapshot_size(Env *env) {
+    return sizeof(Board) + 3 * sizeof(int) + sizeof(unsigned long long)
+        + HASH_HISTORY * sizeof(unsigned long long)
+        + env->history_len * 69 * sizeof(int);
+}
+
+/** Copies size bytes from src to dst and returns the end of dst */
+static unsigned char *pack(unsigned char *dst, const void *src, size_t size) {
+    if (size > 0) {
+        memcpy(dst, src, size);
+    }
+    return dst + size;
+}
+
+/** Copies size bytes from src to dst and returns the end of src */
+static const unsigned char *unpack(void *dst, const unsigned char *src, size_t size) {
+    if (size > 0) {
+        memcpy(dst, src, size);
+    }
+    return src + size;
+}
+
+static void snapshot_body(void *arg, size_t k, int thread) {
+    Loop *loop = arg;
+    Env *env = loop->env;
+    int *indices = loop->ids;
+    unsigned char *buf = loop->out;
+    size_t size = snapshot_size(env);
+    size_t T = env->history_len;
+
+    size_t i = indices[k];
+    unsigned char *dst = buf + k * size;
+    dst = pack(dst, &env->boards[i], sizeof(Board));
+    dst = pack(dst, &env->t[i], sizeof(int));
+    dst = pack(dst, &env->halfmove[i], sizeof(int));
+    dst = pack(dst, &env->n_plies[i], sizeof(int));
+    dst = pack(dst, &env->rng[i], sizeof(unsigned long long));
+    dst = pack(dst, env->hashes + i * HASH_HISTORY, HASH_HISTORY * sizeof(unsigned long long));
+    pack(dst, env->history + i * T * 69, T * 69 * sizeof(int));
+}
+
+/**
+ * Writes the full state of the n boards listed in indices to buf, which
+ * needs n * snapshot_size(env) bytes: the Board (including its hashes), the
+ * step counter, fifty move count, random stream and position history.
+ */
+void snapshot_env(Env *env, int *indices, int n, unsigned char *buf) {
+    parallel_for(env->threads, n, snapshot_body, &(Loop){.env = env, .ids = indices, .out = buf});
+}
+
+static void restore_body(void *arg, size_t k, int thread) {
+    Loop *loop = arg;
+    Env *env = loop->env;
+    int *indices = loop->ids;
+    const unsigned char *buf = loop->out;
+    size_t size = snapshot_size(env);
+    size_t T = env->history_len;
+
+    size_t i = indices[k];
+    const unsigned char *src = buf + k * size;
+    src = unpack(&env->boards[i], src, sizeof(Board));
+    src = unpack(&env->t[i], src, sizeof(int));
+    src = unpack(&env->halfmove[i], src, sizeof(int));
+    src = unpack(&env->n_plies[i], src, sizeof(int));
+    src = unpack(&env->rng[i], src, sizeof(unsigned long long));
+    src = unpack(env->hashes + i * HASH_HISTORY, src, HASH_HISTORY * sizeof(unsigned long long));
+    unpack(env->history + i * T * 69, src, T * 69 * sizeof(int));
+    env->n_legal[i] = -1;
+    env->stack_len[i] = 0;
+}
+
+/** Restores the n boards listed in indices from a buffer written by
+ * snapshot_env with the same history length */
+void restore_env(Env *env, int *indices, int n, unsigned char *buf) {
+    parallel_for(env->threads, n, restore_body, &(Loop){.env = env, .ids = indices, .out = buf});
+}
+
+static void clone_body(void *arg, size_t k, int thread) {
+    Loop *loop = arg;
+    Env *env = loop->env;
+    int *src = loop->ids;
+    int *dst = loop->flags;
+    size_t T = env->history_len;
+
+    size_t i = src[k];
+    size_t j = dst[k];
+    env->boards[j] = env->boards[i];
+    env->t[j] = env->t[i];
+    env->halfmove[j] = env->halfmove[i];
+    env->n_plies[j] = env->n_plies[i];
+    env->rng[j] = env->rng[i];
+    memcpy(env->hashes + j * HASH_HISTORY, env->hashes + i * HASH_HISTORY,
+           HASH_HISTORY * sizeof(unsigned long long));
+    if (T > 0) {
+        memcpy(env->history + j * T * 69, env->history + i * T * 69, T * 69 * sizeof(int));
+    }
+
+    env->stack_len[j] = 0;
+    env->n_legal[j] = env->n_legal[i];
+    if (env->n_legal[i] > 0) {
+        memcpy(env->legal + j * MAX_MOVES, env->legal + i * MAX_MOVES,
+               env->n_legal[i] * sizeof(Move));
+    }
+}
+
+/** Copies the full state of board src[k] over board dst[k], including the
+ * random stream. A board must not be both a source and a destination */
+void clone_env(Env *env, int *src, int *dst, int n) {
+    parallel_for(env->threads, n, clone_body, &(Loop){.env = env, .ids = src, .flags = dst});
+}
+
+static void push_body(void *arg, size_t i, int thread) {
+    Loop *loop = arg;
+    Env *env = loop->env;
+    int *moves = loop->moves;
+    size_t T = env->history_len;
+
+    if (moves[i] < 0) {
+        return;
+    }
+    if (env->stack_len[i] == MOVE_STACK_DEPTH) {
+        __atomic_fetch_add(&loop->full, 1, __ATOMIC_RELAXED);
+        return;
+    }
+
+    StackEntry *entry = env->stack + i * MOVE_STACK_DEPTH + env->stack_len[i];
+    int ply = env->n_plies[i];
+    int_to_move(&entry->move, moves[i]);
+    entry->halfmove = env->halfmove[i];
+
+    // The history entries this move overwrites are put back on pop
+    entry->hash = env->hashes[i * HASH_HISTORY + ply % HASH_HISTORY];
+    if (T > 0) {
+        memcpy(env->stack_history + (i * MOVE_STACK_DEPTH + env->stack_len[i]) * 69,
+               env->history + (i * T + ply % T) * 69, sizeof(int) * 69);
+    }
+
+    count_halfmove(env, i, &entry->move);
+    do_move(&env->boards[i], &entry->move, &entry->undo);
+    record_position(env, i);
+    env->n_legal[i] = -1;
+    env->stack_len[i] += 1;
+}
+
+/**
+ * Makes moves[i] on every board i with a negative entry skipped, saving what
+ * is needed to take it back with pop_env. Pushed moves extend the position
+ * history like regular moves, until they are popped or a step commits them.
+ * Returns the number of boards whose stack was already MOVE_STACK_DEPTH deep,
+ * those are left unchanged.
+ */
+int push_env(Env *env, int *moves) {
+    Loop loop = {.env = env, .moves = moves};
+    parallel_for(env->threads, env->N, push_body, &loop);
+    return loop.full;
 }
 
-void invert_env(Env* env, int n) {
+static void pop_body(void *arg, size_t i, int thread) {
+    Loop *loop = arg;
+    Env *env = loop->env;
+    int k = loop->n;
+    size_t T = env->history_len;
+
+    for (int j = 0; j < k && env->stack_len[i] > 0; j++) {
+        env->stack_len[i] -= 1;
+        StackEntry *entry = env->stack + i * MOVE_STACK_DEPTH + env->stack_len[i];
 
+        undo_move(&env->boards[i], &entry->move, &entry->undo);
+        env->halfmove[i] = entry->halfmove;
+
+        env->n_plies[i] -= 1;
+        int ply = env->n_plies[i];
+        env->hashes[i * HASH_HISTORY + ply % HASH_HISTORY] = entry->hash;
+        if (T > 0) {
+            memcpy(env->history + (i * T + ply % T) * 69,
+                   env->stack_history + (i * MOVE_STACK_DEPTH + env->stack_len[i]) * 69,
+                   sizeof(int) * 69);
+        }
+        env->n_legal[i] = -1;
+    }
+}
+
+/** Takes back the last k pushed moves of every board, or all of them when
+ * fewer were pushed */
+void pop_env(Env *env, int k) {
+    parallel_for(env->threads, env->N, pop_body, &(Loop){.env = env, .n = k});
+}
+
+/** Resets the boards in the environment, returns -1 if n boards do not fit */
+int reset_env(Env* env, int n) {
+
+    if (check_capacity(env, n) != 0) {
+        return -1;
+    }
     bb_init();
-    srand(time(0));
 
-#pragma omp parallel for
     for (size_t i = 0; i < (size_t)n; i++){
-        invert_board(&env->boards[i]);
+        if (env->bank != NULL) {
+            reset_board(env, i, 0);
+            continue;
+        }
+        board_reset(&env->boards[i]);
+        env->t[i] = 0;
+        env->n_legal[i] = -1;
+        clear_history(env, i);
+    }
+    env->N = n;
+    return 0;
+}
+
+/**
+ * Makes resets draw their starting position from a bank of n_positions
+ * board arrays instead of playing random moves, uniformly or, when cdf is
+ * not NULL, with probability proportional to the increments of the
+ * cumulative weights in cdf. The arrays are used in place and must outlive
+ * the env or the next call. n_positions 0 goes back to random starts.
+ */
+void set_reset_bank(Env *env, int *positions, size_t n_positions, double *cdf) {
+    env->bank = n_positions > 0 ? positions : NULL;
+    env->bank_size = n_positions;
+    env->bank_cdf = n_positions > 0 ? cdf : NULL;
+
+    // Priorities belong to the previous bank
+    free_curriculum(env->curriculum);
+    env->curriculum = NULL;
+}
+
+/**
+ * Makes resets sample the reset bank by curriculum priority, see
+ * curriculum.h, with running averages updated at rate from the episodes
+ * finished by the fused step. The bank weights become the base priorities.
+ * A rate of 0 goes back to plain bank sampling. Returns -1 if there is no
+ * bank or the curriculum could not be allocated.
+ */
+int set_curriculum(Env *env, float rate) {
+    free_curriculum(env->curriculum);
+    env->curriculum = NULL;
+    if (rate <= 0) {
+        return 0;
+    }
+    if (env->bank == NULL) {
+        return -1;
+    }
+
+    if (env->start_idx == NULL) {
+        env->start_idx = malloc(env->capacity * sizeof(int));
+        if (env->start_idx == NULL) {
+            return -1;
+        }
+        for (size_t i = 0; i < env->capacity; i++) {
+            env->start_idx[i] = -1;
+        }
+    }
+
+    env->curriculum = create_curriculum(env->bank_size, env->bank_cdf, rate);
+    return env->curriculum == NULL ? -1 : 0;
+}
+
+/** Copies out the curriculum priority, average outcome and average length
+ * of every bank position, returns -1 without a curriculum */
+int get_curriculum(Env *env, double *priority, float *outcome, float *length) {
+    if (env->curriculum == NULL) {
+        return -1;
+    }
+    curriculum_stats(env->curriculum, priority, outcome, length);
+    return 0;
+}
+
+/**
+ * Turns the per-phase step counters of stats.h on, with one slot per
+ * thread of the env, or off. Turning them on again keeps the counts.
+ * Returns -1 if the counters could not be allocated.
+ */
+int enable_stats(Env *env, int on) {
+    if (!on) {
+        free_stats(env->stats);
+        env->stats = NULL;
+        return 0;
+    }
+    if (env->stats == NULL) {
+        env->stats = create_stats(thread_count(env->threads));
+    }
+    return env->stats == NULL ? -1 : 0;
+}
+
+/** Number of per-thread slots get_stats writes, 0 when stats are off */
+int stats_slots(Env *env) {
+    return env->stats == NULL ? 0 : env->stats->n_slots;
+}
+
+/** Copies out the N_STAT_FIELDS counters of every slot */
+void get_stats(Env *env, unsigned long long *values) {
+    if (env->stats != NULL) {
+        copy_stats(env->stats, values);
+    }
+}
+
+void reset_stats(Env *env) {
+    if (env->stats != NULL) {
+        clear_stats(env->stats);
+    }
+}
+
+/** Samples the index of a bank position */
+static size_t sample_bank(Env *env, unsigned long long *rng) {
+    size_t n = env->bank_size;
+    double u = (rng_next(rng) >> 11) / 9007199254740992.0;
 
+    if (env->curriculum != NULL) {
+        return curriculum_sample(env->curriculum, u);
     }
+    if (env->bank_cdf == NULL) {
+        size_t j = (size_t)(u * n);
+        return j < n ? j : n - 1;
+    }
+
+    // First position whose cumulative weight exceeds u
+    u *= env->bank_cdf[n - 1];
+    size_t lo = 0;
+    size_t hi = n - 1;
+    while (lo < hi) {
+        size_t mid = lo + (hi - lo) / 2;
+        if (env->bank_cdf[mid] > u) {
+            hi = mid;
+        } else {
+            lo = mid + 1;
+        }
+    }
+    return lo;
+}
+
+/** Loads a bank position into board i, inverted to white to move if asked,
+ * and fills its legal move cache. Returns the number of legal moves */
+static int bank_reset_board(Env *env, size_t i, int invert) {
+    Board *board = &env->boards[i];
+    size_t j = sample_bank(env, &env->rng[i]);
+
+    array_to_board(board, env->bank + j * 69);
+    if (invert && board->color == BLACK) {
+        invert_board(board);
+    }
+    env->t[i] = 0;
+    clear_history(env, i);
+    if (env->start_idx != NULL) {
+        env->start_idx[i] = j;
+    }
+    return refresh_legal(env, i);
+}
+
+/** SplitMix64, advances the state and returns the next 64 random bits */
+unsigned long long rng_next(unsigned long long *state) {
+    unsigned long long z = (*state += 0x9E3779B97F4A7C15ULL);
+    z = (z ^ (z >> 30)) * 0xBF58476D1CE4E5B9ULL;
+    z = (z ^ (z >> 27)) * 0x94D049BB133111EBULL;
+    return z ^ (z >> 31);
+}
+
+/** Returns a random integer in [0, n) */
+int rng_int(unsigned long long *state, int n) {
+    return (int)(((rng_next(state) >> 32) * (unsigned long long)n) >> 32);
+}
+
+/** Derives the random stream of every board from a single seed. Board i
+ * gets the stream of board first_index + i of an env seeded the same, so
+ * envs holding consecutive slices of boards replay one larger env */
+void seed_env(Env *env, unsigned long long seed, size_t first_index) {
+    for (size_t i = 0; i < env->capacity; i++) {
+        unsigned long long state = seed ^ (0xD1B54A32D192ED03ULL * (first_index + i + 1));
+        env->rng[i] = rng_next(&state);
+    }
+}
+
+/** Restarts the random streams of the given boards from new seeds */
+void reseed_env(Env *env, int *indices, unsigned long long *seeds, int n) {
+    for (int j = 0; j < n; j++) {
+        unsigned long long state = seeds[j] ^ (0xD1B54A32D192ED03ULL * (indices[j] + 1));
+        env->rng[indices[j]] = rng_next(&state);
+    }
+}
+
+/** Sets the episode parameters used by step_env_fused */
+void configure_env(Env *env, int max_step, float draw_reward, int min_random, int max_random, int invert) {
+    env->max_step = max_step;
+    env->draw_reward = draw_reward;
+    env->min_random = min_random;
+    env->max_random = max_random;
+    env->invert = invert;
+}
+
+/** Sets the weights of the shaping terms step_env_fused writes to
+ * shaped_reward, see step_board */
+void configure_shaping(Env *env, float material, float mobility, float check) {
+    env->material_weight = material;
+    env->mobility_weight = mobility;
+    env->check_weight = check;
+}
+
+static void invert_body(void *arg, size_t i, int thread) {
+    Loop *loop = arg;
+    Env *env = loop->env;
+
+    invert_board(&env->boards[i]);
+    env->n_legal[i] = -1;
+    rerecord_position(env, i);
+}
+
+/** Inverts the boards in the environment, returns -1 if n boards do not fit */
+int invert_env(Env* env, int n) {
+
+    if (check_capacity(env, n) != 0) {
+        return -1;
+    }
+    bb_init();
+
+    parallel_for(env->threads, n, invert_body, &(Loop){.env = env});
     env->N = n;
+    return 0;
 }
 
-/** Computes the mask of legal moves for each board. Mask is based on move id
+static void mask_body(void *arg, size_t i, int thread) {
+    Loop *loop = arg;
+    Env *env = loop->env;
+    int *move_mask = loop->out;
+
+    int total_legal;
+    Move *possible_moves = cached_legal(env, i, &total_legal);
+
+    int move_ids[MAX_MOVES];
+    moves_to_ids(possible_moves, total_legal, move_ids);
+    ids_to_mask(move_ids, total_legal, move_mask + i * 64 * OFF_TOTAL);
+}
+
+/** Computes the mask of legal moves for each board. Mask is based on move id,
+ * the buffer is cleared first so it can be reused between calls
  * */
 void get_mask(Env* env, int *move_mask) {
 
-#pragma omp parallel for
-    for (size_t i = 0; i < env->N; i++){
-        board_to_mask(&env->boards[i], move_mask + i * 64 * OFF_TOTAL);
-    }
+    parallel_for(env->threads, env->N, mask_body, &(Loop){.env = env, .out = move_mask});
 }
 
 void board_to_mask(Board *board, int *move_mask) {
@@ -71,12 +809,359 @@ void board_to_mask(Board *board, int *move_mask) {
 
 }
 
+/** Expands a board into N_PLANES 8x8 planes, rank 8 in the first row like
+ * board_to_array. Planes 0-11 hold the white then black P, N, B, R, Q, K,
+ * plane 12 is set when white is to move, 13-16 when white king side, white
+ * queen side, black king side and black queen side castling is available,
+ * 17 marks the en passant square and 18 is all ones.
+ * */
+void board_to_planes(Board *board, unsigned char *planes) {
+    memset(planes, 0, N_PLANES * 64);
+
+    for (int sq = 0; sq < 64; sq++) {
+        int piece = board->squares[sq];
+        if (piece != EMPTY) {
+            int plane = PIECE(piece) - 1 + (COLOR(piece) ? 6 : 0);
+            planes[plane * 64 + PLANE_SQUARE(sq)] = 1;
+        }
+    }
+
+    if (board->color == WHITE) {
+        memset(planes + 12 * 64, 1, 64);
+    }
+    for (int c = 0; c < 4; c++) {
+        if (board->castle & (1 << c)) {
+            memset(planes + (13 + c) * 64, 1, 64);
+        }
+    }
+    if (board->ep) {
+        planes[17 * 64 + PLANE_SQUARE(LSB(board->ep))] = 1;
+    }
+    memset(planes + 18 * 64, 1, 64);
+}
+
+/** float32 version of board_to_planes */
+void board_to_planes_float(Board *board, float *planes) {
+    unsigned char byte_planes[N_PLANES * 64];
+    board_to_planes(board, byte_planes);
+    for (int j = 0; j < N_PLANES * 64; j++) {
+        planes[j] = byte_planes[j];
+    }
+}
+
+static void planes_body(void *arg, size_t i, int thread) {
+    Loop *loop = arg;
+    Env *env = loop->env;
+    unsigned char *planes = loop->out;
+
+    board_to_planes(&env->boards[i], planes + i * N_PLANES * 64);
+}
+
+/** Computes the (N, N_PLANES, 8, 8) plane observation of every board */
+void get_planes(Env *env, unsigned char *planes) {
+
+    parallel_for(env->threads, env->N, planes_body, &(Loop){.env = env, .out = planes});
+}
+
+static void planes_float_body(void *arg, size_t i, int thread) {
+    Loop *loop = arg;
+    Env *env = loop->env;
+    float *planes = loop->out;
+
+    board_to_planes_float(&env->boards[i], planes + i * N_PLANES * 64);
+}
+
+/** float32 version of get_planes */
+void get_planes_float(Env *env, float *planes) {
+
+    parallel_for(env->threads, env->N, planes_float_body, &(Loop){.env = env, .out = planes});
+}
+
+/** Converts a list of legal moves into move ids */
+static void moves_to_ids(Move *possible_moves, int total_legal, int *move_ids) {
+    for (int j = 0; j < total_legal; j++) {
+        int move_arr[5];
+        move_to_array(move_arr, possible_moves[j]);
+        move_arr_to_int(&move_ids[j], move_arr);
+    }
+}
+
+/** Writes the mask for a list of legal move ids */
+static void ids_to_mask(int *move_ids, int total_legal, int *move_mask) {
+    memset(move_mask, 0, sizeof(int) * 64 * OFF_TOTAL);
+
+    for (int j = 0; j < total_legal; j++) {
+        move_mask[move_ids[j]] = 1;
+    }
+}
+
+/** Writes the mask for a list of legal move ids bit-packed, 8 moves per byte
+ * with the first move id in the most significant bit (numpy packbits order) */
+static void ids_to_packed_mask(int *move_ids, int total_legal, unsigned char *packed_mask) {
+    memset(packed_mask, 0, PACKED_MASK_BYTES);
+
+    for (int j = 0; j < total_legal; j++) {
+        packed_mask[move_ids[j] >> 3] |= 0x80 >> (move_ids[j] & 7);
+    }
+}
+
+static void mask_packed_body(void *arg, size_t i, int thread) {
+    Loop *loop = arg;
+    Env *env = loop->env;
+    unsigned char *packed_mask = loop->out;
+
+    int total_legal;
+    Move *possible_moves = cached_legal(env, i, &total_legal);
+
+    int move_ids[MAX_MOVES];
+    moves_to_ids(possible_moves, total_legal, move_ids);
+    ids_to_packed_mask(move_ids, total_legal, packed_mask + i * PACKED_MASK_BYTES);
+}
+
+/** Computes the bit-packed mask of legal moves for each board, PACKED_MASK_BYTES per board */
+void get_mask_packed(Env* env, unsigned char *packed_mask) {
+
+    parallel_for(env->threads, env->N, mask_packed_body, &(Loop){.env = env, .out = packed_mask});
+}
+
+static void mask_subset_body(void *arg, size_t k, int thread) {
+    Loop *loop = arg;
+    Env *env = loop->env;
+    int *env_ids = loop->ids;
+    int *move_mask = loop->out;
+
+    int total_legal;
+    Move *possible_moves = cached_legal(env, env_ids[k], &total_legal);
+
+    int move_ids[MAX_MOVES];
+    moves_to_ids(possible_moves, total_legal, move_ids);
+    ids_to_mask(move_ids, total_legal, move_mask + k * 64 * OFF_TOTAL);
+}
+
+/** Computes the mask of the n boards listed in env_ids, row k of move_mask
+ * holds the mask of board env_ids[k] */
+void get_mask_subset(Env *env, int *env_ids, int n, int *move_mask) {
+
+    parallel_for(env->threads, n, mask_subset_body, &(Loop){.env = env, .ids = env_ids, .out = move_mask});
+}
+
+static void mask_packed_subset_body(void *arg, size_t k, int thread) {
+    Loop *loop = arg;
+    Env *env = loop->env;
+    int *env_ids = loop->ids;
+    unsigned char *packed_mask = loop->out;
+
+    int total_legal;
+    Move *possible_moves = cached_legal(env, env_ids[k], &total_legal);
+
+    int move_ids[MAX_MOVES];
+    moves_to_ids(possible_moves, total_legal, move_ids);
+    ids_to_packed_mask(move_ids, total_legal, packed_mask + k * PACKED_MASK_BYTES);
+}
+
+/** Bit-packed version of get_mask_subset */
+void get_mask_packed_subset(Env *env, int *env_ids, int n, unsigned char *packed_mask) {
+
+    parallel_for(env->threads, n, mask_packed_subset_body,
+                 &(Loop){.env = env, .ids = env_ids, .out = packed_mask});
+}
+
+/**
+ * Packs per-board move id lists into CSR form. On entry board k's ids are
+ * at move_ids + k * MAX_MOVES and its count is in offsets[k + 1]; on exit
+ * offsets holds the N + 1 row offsets and the ids are contiguous.
+ */
+static void compact_csr(int *offsets, int *move_ids, size_t n) {
+    offsets[0] = 0;
+    for (size_t k = 0; k < n; k++) {
+        int count = offsets[k + 1];
+        memmove(move_ids + offsets[k], move_ids + k * MAX_MOVES, sizeof(int) * count);
+        offsets[k + 1] = offsets[k] + count;
+    }
+}
+
+static void legal_moves_body(void *arg, size_t i, int thread) {
+    Loop *loop = arg;
+    Env *env = loop->env;
+    int *offsets = loop->flags;
+    int *move_ids = loop->out;
+
+    int total_legal;
+    Move *possible_moves = cached_legal(env, i, &total_legal);
+    moves_to_ids(possible_moves, total_legal, move_ids + i * MAX_MOVES);
+    offsets[i + 1] = total_legal;
+}
+
+/**
+ * Writes the legal move ids of every board in CSR form: offsets has N + 1
+ * entries and the ids of board i are move_ids[offsets[i]:offsets[i + 1]].
+ * move_ids must have room for N * MAX_MOVES ids.
+ */
+void get_legal_moves_csr(Env *env, int *offsets, int *move_ids) {
+
+    parallel_for(env->threads, env->N, legal_moves_body, &(Loop){.env = env, .flags = offsets, .out = move_ids});
+
+    compact_csr(offsets, move_ids, env->N);
+}
+
 void board_arr_to_mask(int* board_arr, int *move_mask) {
     Board board;
     array_to_board(&board, board_arr);
     board_to_mask(&board, move_mask);
 }
 
+/* Arguments of the playouts of rollout_arrays */
+typedef struct {
+    Board *starts;
+    int n_playouts;
+    int max_plies;
+    unsigned long long seed;
+    signed char *results;
+    int *lengths;
+} Rollout;
+
+/** Plays random game p of rollout_arrays, records its result and length */
+static void playout_body(void *arg, size_t p, int thread) {
+    Rollout *rollout = arg;
+    Board board = rollout->starts[p / rollout->n_playouts];
+    unsigned long long rng = rollout->seed ^ (0xD1B54A32D192ED03ULL * (p + 1));
+
+    Move possible_moves[MAX_MOVES];
+    int halfmove = 0;
+    int ply = 0;
+    int result = 0;
+    for (; ply < rollout->max_plies; ply++) {
+        int total = gen_legal_moves(&board, possible_moves);
+        if (total == 0) {
+            // The side to move lost or it is stalemate
+            if (is_check(&board)) {
+                result = ply % 2 == 0 ? -1 : 1;
+            }
+            break;
+        }
+        if (halfmove >= 100 || insufficient_material(&board)) {
+            break;
+        }
+
+        Move move = possible_moves[rng_int(&rng, total)];
+        if (PIECE(board.squares[move.src]) == PAWN || board.squares[move.dst] != EMPTY) {
+            halfmove = 0;
+        } else {
+            halfmove++;
+        }
+        make_move(&board, &move);
+    }
+
+    rollout->results[p] = result;
+    rollout->lengths[p] = ply;
+}
+
+/**
+ * Plays n_playouts random games from each of the n board arrays, each for at
+ * most max_plies plies. Results are counted from the point of view of the
+ * side to move in the starting position: a game is won or lost by
+ * checkmate, and drawn by stalemate, insufficient material, the fifty move
+ * rule or reaching max_plies. Every playout has its own random stream
+ * derived from seed, so results do not depend on the thread count. Returns
+ * -1 if the playouts could not be allocated.
+ */
+int rollout_arrays(int *boards, int n, int n_playouts, int max_plies, unsigned long long seed,
+                   int *wins, int *draws, int *losses, float *mean_length) {
+    if (n <= 0 || n_playouts <= 0) {
+        for (int i = 0; i < n; i++) {
+            wins[i] = draws[i] = losses[i] = 0;
+            mean_length[i] = 0;
+        }
+        return 0;
+    }
+    bb_init();
+
+    size_t total_playouts = (size_t)n * n_playouts;
+    Rollout rollout = {
+        .starts = malloc(n * sizeof(Board)),
+        .n_playouts = n_playouts,
+        .max_plies = max_plies,
+        .seed = seed,
+        .results = malloc(total_playouts),
+        .lengths = malloc(total_playouts * sizeof(int)),
+    };
+    if (rollout.starts == NULL || rollout.results == NULL || rollout.lengths == NULL) {
+        free(rollout.starts);
+        free(rollout.results);
+        free(rollout.lengths);
+        return -1;
+    }
+
+    for (int i = 0; i < n; i++) {
+        array_to_board(&rollout.starts[i], boards + i * 69);
+    }
+    parallel_for(NULL, total_playouts, playout_body, &rollout);
+
+    // Summed per board after the playouts, no counters are shared
+    for (int i = 0; i < n; i++) {
+        long long length = 0;
+        wins[i] = draws[i] = losses[i] = 0;
+        for (size_t p = (size_t)i * n_playouts; p < (size_t)(i + 1) * n_playouts; p++) {
+            wins[i] += rollout.results[p] == 1;
+            losses[i] += rollout.results[p] == -1;
+            draws[i] += rollout.results[p] == 0;
+            length += rollout.lengths[p];
+        }
+        mean_length[i] = (float)length / n_playouts;
+    }
+    free(rollout.starts);
+    free(rollout.results);
+    free(rollout.lengths);
+    return 0;
+}
+
+/* Arguments of the boards of transition_arrays */
+typedef struct {
+    int *boards;
+    int *moves;
+    int *next_boards;
+    int *move_mask;
+    int *terminated;
+    float *reward;
+} Transition;
+
+static void transition_body(void *arg, size_t i, int thread) {
+    Transition *tr = arg;
+    Board board;
+    array_to_board(&board, tr->boards + i * 69);
+
+    Move move;
+    int_to_move(&move, tr->moves[i]);
+    make_move(&board, &move);
+    board_to_array(tr->next_boards + i * 69, board);
+
+    Move possible_moves[MAX_MOVES];
+    int total = gen_legal_moves(&board, possible_moves);
+    if (tr->move_mask) {
+        int move_ids[MAX_MOVES];
+        moves_to_ids(possible_moves, total, move_ids);
+        ids_to_mask(move_ids, total, tr->move_mask + i * 64 * OFF_TOTAL);
+    }
+
+    int checkmate = total == 0 && is_check(&board);
+    tr->terminated[i] = total == 0 || insufficient_material(&board);
+    tr->reward[i] = checkmate;
+}
+
+/**
+ * Plays moves[i] on board array i without an environment. Writes the new
+ * board arrays, their masks (skipped when NULL), whether the game ended and
+ * the reward of the side that moved: 1 for checkmate, 0 otherwise. Without
+ * a game history only checkmate, stalemate and insufficient material end a
+ * game.
+ */
+void transition_arrays(int *boards, int *moves, int n, int *next_boards, int *move_mask, int *terminated, float *reward) {
+    bb_init();
+
+    Transition tr = {boards, moves, next_boards, move_mask, terminated, reward};
+    parallel_for(NULL, n, transition_body, &tr);
+}
+
 
 void print_board(Env *env) {
     for (size_t i = 0; i < env->N; i++){
@@ -94,69 +1179,90 @@ void get_boards(Env *env, int* boards) {
 }
 
 
+static void step_body(void *arg, size_t i, int thread) {
+    Loop *loop = arg;
+    Env *env = loop->env;
+    int *moves = loop->moves;
+    int *dones = loop->flags;
+    int *reward = loop->out;
+
+    // Convert move id to actual move, apply to board
+    Move move;
+    int_to_move(&move, moves[i]);
+    env->stack_len[i] = 0;
+    count_halfmove(env, i, &move);
+    make_move(&env->boards[i], &move);
+    record_position(env, i);
+
+    // The game is over if the opponent has no response or it is a draw,
+    // you only win by checkmate
+    int total = refresh_legal(env, i);
+    int reason = end_reason(env, i, total);
+
+    dones[i] = (reason != END_NONE);
+    reward[i] = (reason == END_CHECKMATE);
+}
+
 /** Steps the environment forward one step in time */
 void step_env(Env *env, int *moves, int *dones, int *reward) {
 
-#pragma omp parallel for
-    for (size_t i = 0; i < env->N; i++) {
+    parallel_for(env->threads, env->N, step_body, &(Loop){.env = env, .moves = moves, .flags = dones, .out = reward});
+}
+
 
-        // Convert move id to actual move, apply to board
-        Move move;
-        int_to_move(&move, moves[i]);
-        make_move(&env->boards[i], &move);
+static void possible_moves_body(void *arg, size_t i, int thread) {
+    Loop *loop = arg;
+    Env *env = loop->env;
+    int *total_moves = loop->out;
 
-        // See if there is a possible response, if not, you win.
-        Move possible_moves[MAX_MOVES];
-        int total = gen_legal_moves(&env->boards[i], possible_moves);
+    // Get possible moves
+    int total_legal;
+    Move *possible_moves = cached_legal(env, i, &total_legal);
 
-        dones[i] = (total == 0);
-        reward[i] = (total == 0);
+    // Write to array
+    int idx = MAX_MOVES * 5 * i;
+    for (int j = 0; j < total_legal; j++) {
+        move_to_array(&total_moves[idx], possible_moves[j]);
+        idx += 5;
     }
 }
 
-
 /** Computes the total possible moves from the current environment state */
 void get_possible_moves(Env* env, int* total_moves) {
 
-#pragma omp parallel for
-    for (size_t i = 0; i < env->N; i++) {
+    parallel_for(env->threads, env->N, possible_moves_body, &(Loop){.env = env, .out = total_moves});
+}
 
-        // Get possible moves
-        Move possible_moves[MAX_MOVES];
-        int total_legal = gen_legal_moves(&env->boards[i], possible_moves);
+static void reset_boards_body(void *arg, size_t i, int thread) {
+    Loop *loop = arg;
+    Env *env = loop->env;
+    int *reset = loop->flags;
 
-        // Write to array
-        int idx = MAX_MOVES * 5 * i;
-        for (int j = 0; j < total_legal; j++) {
-            move_to_array(&total_moves[idx], possible_moves[j]);
-            idx += 5;
-        }
+    if (reset[i] == 1) {
+        board_reset(&env->boards[i]);
+        env->n_legal[i] = -1;
+        clear_history(env, i);
     }
 }
 
 void reset_boards(Env *env, int *reset) {
-#pragma omp parallel for
-    for (size_t i = 0; i < env->N; i += 1) {
-        if (reset[i] == 1) {
-            board_reset(&env->boards[i]);
-        }
-    }
+    parallel_for(env->threads, env->N, reset_boards_body, &(Loop){.env = env, .flags = reset});
 }
 
-/** Applies a random step to the board */
-void random_step_board(Board *board, int n_moves) {
+/** Applies a random step to the board, possible_moves is left holding the
+ * legal moves of the final position and their count is returned */
+int random_step_board(Board *board, int n_moves, unsigned long long *rng, Move *possible_moves) {
 
-    Move possible_moves[MAX_MOVES];
     for (int i = 0; i < n_moves; i++) {
 
         int total = gen_legal_moves(board, possible_moves);
 
         if (total == 0) {
             board_reset(board);
-            return random_step_board(board, n_moves);
+            return random_step_board(board, n_moves, rng, possible_moves);
         }
 
-        int random_idx = rand() % total;
+        int random_idx = rng_int(rng, total);
         Move move = possible_moves[random_idx];
         make_move(board, &move);
     }
@@ -165,61 +1271,399 @@ void random_step_board(Board *board, int n_moves) {
 
     if (total == 0) {
         board_reset(board);
-        return random_step_board(board, n_moves);
+        return random_step_board(board, n_moves, rng, possible_moves);
     }
 
+    return total;
 }
 
 /** Implement random_step_board_invert before it's used */
-void random_step_board_invert(Board *board, int n_moves) {
-    random_step_board(board, n_moves);
+int random_step_board_invert(Board *board, int n_moves, unsigned long long *rng, Move *possible_moves) {
+    int total = random_step_board(board, n_moves, rng, possible_moves);
 
     if (n_moves % 2 == 1) {
         invert_board(board);
+        total = gen_legal_moves(board, possible_moves);
+    }
+    return total;
+}
+
+static void randomize_body(void *arg, size_t i, int thread) {
+    Loop *loop = arg;
+    Env *env = loop->env;
+    int *reset = loop->flags;
+    int min_rand = loop->min_rand;
+    int max_rand = loop->max_rand;
+
+    if (reset[i] == 1 && env->bank != NULL) {
+        bank_reset_board(env, i, 0);
+    } else if (reset[i] == 1) {
+        board_reset(&env->boards[i]);
+        int num = rng_int(&env->rng[i], max_rand - min_rand + 1) + min_rand;
+        env->n_legal[i] = random_step_board(&env->boards[i], num, &env->rng[i],
+                                            env->legal + i * MAX_MOVES);
+        clear_history(env, i);
     }
 }
 
 /** Resets any done boards, applies a random number of moves in [min_rand, max_rand] */
 void reset_and_randomize_boards(Env *env, int *reset, int min_rand, int max_rand) {
-#pragma omp parallel for
-    for (size_t i = 0; i < env->N; i += 1) {
-        if (reset[i] == 1) {
-            board_reset(&env->boards[i]);
-            int num = (rand() % (max_rand - min_rand + 1)) + min_rand;
-            random_step_board(&env->boards[i], num);
-        }
+    parallel_for(env->threads, env->N, randomize_body,
+                 &(Loop){.env = env, .flags = reset, .min_rand = min_rand, .max_rand = max_rand});
+}
+
+static void randomize_invert_body(void *arg, size_t i, int thread) {
+    Loop *loop = arg;
+    Env *env = loop->env;
+    int *reset = loop->flags;
+    int min_rand = loop->min_rand;
+    int max_rand = loop->max_rand;
+
+    if (reset[i] == 1 && env->bank != NULL) {
+        bank_reset_board(env, i, 1);
+    } else if (reset[i] == 1) {
+        board_reset(&env->boards[i]);
+        int num = rng_int(&env->rng[i], max_rand - min_rand + 1) + min_rand;
+        env->n_legal[i] = random_step_board_invert(&env->boards[i], num, &env->rng[i],
+                                                   env->legal + i * MAX_MOVES);
+        clear_history(env, i);
     }
 }
 
 void reset_and_randomize_boards_invert(Env *env, int *reset, int min_rand, int max_rand) {
-#pragma omp parallel for
-    for (size_t i = 0; i < env->N; i += 1) {
-        if (reset[i] == 1) {
-            board_reset(&env->boards[i]);
-            int num = (rand() % (max_rand - min_rand + 1)) + min_rand;
-            random_step_board_invert(&env->boards[i], num);
-        }
+    parallel_for(env->threads, env->N, randomize_invert_body,
+                 &(Loop){.env = env, .flags = reset, .min_rand = min_rand, .max_rand = max_rand});
+}
+
+static void random_move_body(void *arg, size_t i, int thread) {
+    Loop *loop = arg;
+    Env *env = loop->env;
+    int *moves = loop->out;
+
+    int total;
+    Move *possible_moves = cached_legal(env, i, &total);
+
+    if (total == 0) {
+        return;
     }
+
+    int random_idx = rng_int(&env->rng[i], total);
+    Move move = possible_moves[random_idx];
+
+    move_to_int(&moves[i], move);
 }
 
 /** Samples a random move for the current environment state  */
 void generate_random_move(Env *env, int *moves) {
 
-#pragma omp parallel for
-    for (size_t i = 0; i < env->N; i++) {
-        Move possible_moves[MAX_MOVES];
+    parallel_for(env->threads, env->N, random_move_body, &(Loop){.env = env, .out = moves});
+}
 
-        int total = gen_legal_moves(&env->boards[i], possible_moves);
+/** Resets a single board to a new, randomized or bank starting position
+ * and fills its legal move cache, returns the number of legal moves */
+static int reset_board(Env *env, size_t i, int thread) {
+    stat_add(env->stats, thread, STAT_RESETS, 1);
+    if (env->bank != NULL) {
+        return bank_reset_board(env, i, env->invert);
+    }
 
-        if (total == 0) {
-            continue;
+    Board *board = &env->boards[i];
+    Move *possible_moves = env->legal + i * MAX_MOVES;
+    board_reset(board);
+
+    unsigned long long start = stat_clock(env->stats);
+    int num = rng_int(&env->rng[i], env->max_random - env->min_random + 1) + env->min_random;
+    if (env->invert) {
+        env->n_legal[i] = random_step_board_invert(board, num, &env->rng[i], possible_moves);
+    } else {
+        env->n_legal[i] = random_step_board(board, num, &env->rng[i], possible_moves);
+    }
+    stat_time(env->stats, thread, STAT_RANDOM_START, start);
+    env->t[i] = 0;
+    clear_history(env, i);
+    return env->n_legal[i];
+}
+
+/**
+ * Runs one full environment step for board i: the agent move, the opponent
+ * reply, terminal detection and the reset of finished games. Results are
+ * written to slot k of the output buffers.
+ *
+ * shaped_reward gets the weighted shaping terms of the step, seen from the
+ * agent: the change of material_balance, the change of its number of legal
+ * moves from this turn to its next one, and +1 for giving check, -1 for
+ * being checked by the reply. Mobility only counts when the step ends with
+ * the agent to move, not when its move ended the game or nobody replied.
+ */
+void step_board(Env *env, SFArray *sfa, int opponent, size_t i, int move_int, StepOutput *out, size_t k,
+                int thread) {
+    Board *board = &env->boards[i];
+    Move *possible_moves = env->legal + i * MAX_MOVES;
+    Stats *stats = env->stats;
+
+    int terminated = 0;
+    float reward = 0;
+    stat_add(stats, thread, STAT_BOARDS, 1);
+
+    // Shaping terms are seen from the agent, the side to move now
+    int shaping = out->shaped_reward != NULL;
+    int material = 0;
+    int mobility = 0;
+    float shaped = 0;
+    if (shaping) {
+        material = material_balance(board);
+        cached_legal(env, i, &mobility);
+    }
+
+    // Moves pushed for search become part of the game
+    env->stack_len[i] = 0;
+
+    // Agent move, checkmate wins and any draw ends the game with draw_reward
+    unsigned long long start = stat_clock(stats);
+    Move move;
+    int_to_move(&move, move_int);
+    count_halfmove(env, i, &move);
+    make_move(board, &move);
+    if (env->invert) {
+        invert_board(board);
+    }
+    env->t[i] += 1;
+    record_position(env, i);
+    stat_time(stats, thread, STAT_MAKE_MOVE, start);
+
+    start = stat_clock(stats);
+    int total = refresh_legal(env, i);
+    stat_time(stats, thread, STAT_MOVEGEN, start);
+    stat_add(stats, thread, STAT_LEGAL_MOVES, total);
+
+    int reason = end_reason(env, i, total);
+    if (reason != END_NONE) {
+        terminated = 1;
+        reward = reason == END_CHECKMATE ? 1 : env->draw_reward;
+    }
+    if (shaping && is_check(board)) {
+        shaped += env->check_weight;
+    }
+
+    // Opponent reply, being checkmated loses
+    int replied = 0;
+    if (!terminated && opponent != OPPONENT_NONE) {
+        replied = 1;
+        start = stat_clock(stats);
+        int response_int;
+        if (opponent == OPPONENT_STOCKFISH) {
+            board_to_sf_move_int(&response_int, sfa, i % sfa->N, board);
+            int_to_move(&move, response_int);
+        } else {
+            move = possible_moves[rng_int(&env->rng[i], total)];
         }
+        stat_time(stats, thread, STAT_OPPONENT, start);
 
-        int random_idx = rand() % total;
-        Move move = possible_moves[random_idx];
+        start = stat_clock(stats);
+        count_halfmove(env, i, &move);
+        make_move(board, &move);
+        if (env->invert) {
+            invert_board(board);
+        }
+        env->t[i] += 1;
+        record_position(env, i);
+        stat_time(stats, thread, STAT_MAKE_MOVE, start);
+
+        start = stat_clock(stats);
+        total = refresh_legal(env, i);
+        stat_time(stats, thread, STAT_MOVEGEN, start);
+        stat_add(stats, thread, STAT_LEGAL_MOVES, total);
+
+        reason = end_reason(env, i, total);
+        if (reason != END_NONE) {
+            terminated = 1;
+            reward = reason == END_CHECKMATE ? -1 : env->draw_reward;
+        }
+        if (shaping && is_check(board)) {
+            shaped -= env->check_weight;
+        }
+    }
+
+    // After a reply the agent is to move again, otherwise its opponent
+    if (shaping) {
+        int balance = material_balance(board);
+        shaped += env->material_weight * ((replied ? balance : -balance) - material);
+        if (replied) {
+            shaped += env->mobility_weight * (total - mobility);
+        }
+    }
+
+    int truncated = !terminated && env->t[i] > env->max_step;
+    if (truncated) {
+        reason = END_TRUNCATED;
+        reward = env->draw_reward;
+    }
+
+    if (terminated || truncated) {
+        if (out->final_boards) {
+            board_to_array(out->final_boards + 69 * k, *board);
+        }
+        if (env->curriculum != NULL && env->start_idx[i] >= 0) {
+            curriculum_update(env->curriculum, env->start_idx[i], reward, env->t[i]);
+        }
+        start = stat_clock(stats);
+        total = reset_board(env, i, thread);
+        stat_time(stats, thread, STAT_RESET, start);
+    }
+
+    start = stat_clock(stats);
+    if (out->boards) {
+        board_to_array(out->boards + 69 * k, *board);
+    }
+    if (out->planes) {
+        board_to_planes(board, out->planes + k * N_PLANES * 64);
+    }
+    if (out->planes_float) {
+        board_to_planes_float(board, out->planes_float + k * N_PLANES * 64);
+    }
+    if (out->history) {
+        board_history(env, i, out->history + k * env->history_len * 69);
+    }
+    if (out->repetitions) {
+        out->repetitions[k] = repetition_count(env, i);
+    }
+    stat_time(stats, thread, STAT_ENCODE, start);
+
+    start = stat_clock(stats);
+    if (out->mask || out->packed_mask || out->legal_moves) {
+        int move_ids[MAX_MOVES];
+        moves_to_ids(possible_moves, total, move_ids);
+
+        if (out->mask) {
+            ids_to_mask(move_ids, total, out->mask + k * 64 * OFF_TOTAL);
+        }
+        if (out->packed_mask) {
+            ids_to_packed_mask(move_ids, total, out->packed_mask + k * PACKED_MASK_BYTES);
+        }
+        if (out->legal_moves) {
+            memcpy(out->legal_moves + k * MAX_MOVES, move_ids, sizeof(int) * total);
+            out->legal_offsets[k + 1] = total;
+        }
+    }
+    stat_time(stats, thread, STAT_MASK, start);
+
+    if (out->reward) {
+        out->reward[k] = reward;
+    }
+    if (shaping) {
+        out->shaped_reward[k] = shaped;
+    }
+    if (out->terminated) {
+        out->terminated[k] = terminated;
+    }
+    if (out->truncated) {
+        out->truncated[k] = truncated;
+    }
+    if (out->reason) {
+        out->reason[k] = reason;
+    }
+    if (out->steps) {
+        out->steps[k] = env->t[i];
+    }
+}
+
+static void step_fused_body(void *arg, size_t i, int thread) {
+    Loop *loop = arg;
+    step_board(loop->env, loop->sfa, loop->opponent, i, loop->moves[i], loop->out, i, thread);
+}
+
+/**
+ * Steps every board in a single parallel pass: applies the agent moves,
+ * samples and applies the opponent replies (OPPONENT_RANDOM,
+ * OPPONENT_STOCKFISH or OPPONENT_NONE), resets finished games and writes the
+ * new state, planes, mask, legal moves, reward, terminated, truncated, end
+ * reason and step counters to out.
+ */
+void step_env_fused(Env *env, SFArray *sfa, int opponent, int *moves, StepOutput *out) {
+
+    parallel_for(env->threads, env->N, step_fused_body,
+                 &(Loop){.env = env, .sfa = sfa, .opponent = opponent, .moves = moves, .out = out});
+
+    if (out->legal_moves) {
+        compact_csr(out->legal_offsets, out->legal_moves, env->N);
+    }
+}
+
+static void step_subset_body(void *arg, size_t k, int thread) {
+    Loop *loop = arg;
+    step_board(loop->env, loop->sfa, loop->opponent, loop->ids[k], loop->moves[k], loop->out, k, thread);
+}
+
+/**
+ * Steps only the n boards listed in env_ids, like step_env_fused. moves[k]
+ * is the move for board env_ids[k] and its results are written to slot k of
+ * out, so the outputs are compacted to n rows. The ids must be distinct.
+ */
+void step_env_subset(Env *env, SFArray *sfa, int opponent, int *moves, int *env_ids, int n, StepOutput *out) {
+
+    parallel_for(env->threads, n, step_subset_body,
+                 &(Loop){.env = env, .sfa = sfa, .opponent = opponent, .moves = moves, .ids = env_ids, .out = out});
+
+    if (out->legal_moves) {
+        compact_csr(out->legal_offsets, out->legal_moves, n);
+    }
+}
+
+/** Arguments of a step running on a background thread */
+struct AsyncStep {
+    pthread_t thread;
+    Env *env;
+    SFArray *sfa;
+    int opponent;
+    int *moves;
+    StepOutput *out;
+};
+typedef struct AsyncStep AsyncStep;
+
+static void *run_async_step(void *arg) {
+    AsyncStep *step = arg;
+    step_env_fused(step->env, step->sfa, step->opponent, step->moves, step->out);
+    return NULL;
+}
+
+/**
+ * Starts step_env_fused on a background thread and returns immediately. The
+ * moves and out buffers must stay untouched until step_env_wait returns.
+ * Returns 0 on success, -1 if a step is already running or the thread could
+ * not be started.
+ */
+int step_env_async(Env *env, SFArray *sfa, int opponent, int *moves, StepOutput *out) {
+    if (env->async != NULL) {
+        return -1;
+    }
+
+    AsyncStep *step = malloc(sizeof(AsyncStep));
+    if (step == NULL) {
+        return -1;
+    }
+    step->env = env;
+    step->sfa = sfa;
+    step->opponent = opponent;
+    step->moves = moves;
+    step->out = out;
+
+    if (pthread_create(&step->thread, NULL, run_async_step, step) != 0) {
+        free(step);
+        return -1;
+    }
+    env->async = step;
+    return 0;
+}
 
-        move_to_int(&moves[i], move);
+/** Blocks until the step started by step_env_async has finished */
+void step_env_wait(Env *env) {
+    AsyncStep *step = env->async;
+    if (step == NULL) {
+        return;
     }
+    pthread_join(step->thread, NULL);
+    free(step);
+    env->async = NULL;
 }
 
 void step_random_move_env(Env *env, int *moves, int *dones) {
@@ -2,15 +2,134 @@
 #define CHESSENV_H
 
 #include "../MisterQueen/src/board.h"
+#include "../MisterQueen/src/move.h"
+
+#define OPPONENT_NONE 0
+#define OPPONENT_RANDOM 1
+#define OPPONENT_STOCKFISH 2
+
+#define PACKED_MASK_BYTES 704
+#define N_PLANES 19
+#define HASH_HISTORY 128
+#define MOVE_STACK_DEPTH 64
+
+/* Why a game ended, reported per board by the fused step */
+#define END_NONE 0
+#define END_CHECKMATE 1
+#define END_STALEMATE 2
+#define END_REPETITION 3
+#define END_FIFTY_MOVES 4
+#define END_MATERIAL 5
+#define END_TRUNCATED 6
+
+/* Offset of a square within a plane, rank 8 first */
+#define PLANE_SQUARE(sq) ((7 - (sq) / 8) * 8 + (sq) % 8)
+
+/* A move made by push_env with what is needed to take it back */
+struct StackEntry {
+    Move move;
+    Undo undo;
+    int halfmove;
+    unsigned long long hash;
+};
+typedef struct StackEntry StackEntry;
 
 struct Env {
-    Board boards[1024];
+    Board *boards;
+    int *t;
+    unsigned long long *rng;
+    Move *legal;
+    int *n_legal;
+    unsigned long long *hashes;
+    int *n_plies;
+    int *halfmove;
+    int *history;
+    int history_len;
+    struct StackEntry *stack;
+    int *stack_history;
+    int *stack_len;
+    int *bank;
+    size_t bank_size;
+    double *bank_cdf;
+    struct Curriculum *curriculum;
+    int *start_idx;
+    struct ThreadConfig *threads;
+    struct Stats *stats;
     size_t N;
+    size_t capacity;
+    int max_step;
+    float draw_reward;
+    int min_random;
+    int max_random;
+    int invert;
+    float material_weight;
+    float mobility_weight;
+    float check_weight;
+    void *async;
 };
 typedef struct Env Env;
 
+/* Caller-owned output buffers filled by step_env_fused, indexed by board.
+ * Any field left NULL is skipped. legal_offsets (N + 1 entries) and
+ * legal_moves (room for N * MAX_MOVES ids) hold the legal moves in CSR form.
+ * final_boards receives the last position of boards whose game ended this
+ * step, before they are reset, other rows are left untouched. */
+struct StepOutput {
+    int *boards;
+    int *final_boards;
+    unsigned char *planes;
+    float *planes_float;
+    int *history;
+    int *repetitions;
+    int *mask;
+    unsigned char *packed_mask;
+    int *legal_offsets;
+    int *legal_moves;
+    float *reward;
+    float *shaped_reward;
+    int *terminated;
+    int *truncated;
+    int *reason;
+    int *steps;
+};
+typedef struct StepOutput StepOutput;
+
+struct SFArray;
+struct Curriculum;
+struct ThreadConfig;
+struct Stats;
+
+Env *create_env(size_t n);
+void free_env(Env *env);
+unsigned long long rng_next(unsigned long long *state);
+int rng_int(unsigned long long *state, int n);
+void seed_env(Env *env, unsigned long long seed, size_t first_index);
+void reseed_env(Env *env, int *indices, unsigned long long *seeds, int n);
 void get_mask(Env* env, int *move_mask);
-void reset_env(Env* env, int n);
+void get_mask_packed(Env* env, unsigned char *packed_mask);
+void get_mask_subset(Env *env, int *env_ids, int n, int *move_mask);
+void get_mask_packed_subset(Env *env, int *env_ids, int n, unsigned char *packed_mask);
+void get_legal_moves_csr(Env *env, int *offsets, int *move_ids);
+void get_planes(Env *env, unsigned char *planes);
+void get_planes_float(Env *env, float *planes);
+int set_history_len(Env *env, int history_len);
+int repetition_count(Env *env, size_t i);
+void get_history(Env *env, int *history);
+void get_repetitions(Env *env, int *repetitions);
+size_t snapshot_size(Env *env);
+void snapshot_env(Env *env, int *indices, int n, unsigned char *buf);
+void restore_env(Env *env, int *indices, int n, unsigned char *buf);
+void clone_env(Env *env, int *src, int *dst, int n);
+int push_env(Env *env, int *moves);
+void pop_env(Env *env, int k);
+int reset_env(Env* env, int n);
+void set_reset_bank(Env *env, int *positions, size_t n_positions, double *cdf);
+int set_curriculum(Env *env, float rate);
+int get_curriculum(Env *env, double *priority, float *outcome, float *length);
+int enable_stats(Env *env, int on);
+int stats_slots(Env *env);
+void get_stats(Env *env, unsigned long long *values);
+void reset_stats(Env *env);
 void print_board(Env* env);
 void step_env(Env *env, int* moves, int *dones, int *reward);
 void get_boards(Env *env, int* boards);
@@ -19,10 +138,23 @@ void generate_random_move(Env *env, int* boards);
 void reset_boards(Env *env, int *reset);
 void get_possible_moves(Env* env, int*);
 void reset_and_randomize_boards(Env *env, int *reset, int min_rand, int max_rand);
-void invert_env(Env* env, int n);
+int invert_env(Env* env, int n);
 void reset_and_randomize_boards_invert(Env *env, int *reset, int min_rand, int max_rand);
+void configure_env(Env *env, int max_step, float draw_reward, int min_random, int max_random, int invert);
+void configure_shaping(Env *env, float material, float mobility, float check);
+void step_board(Env *env, struct SFArray *sfa, int opponent, size_t i, int move_int, StepOutput *out, size_t k,
+                int thread);
+void step_env_fused(Env *env, struct SFArray *sfa, int opponent, int *moves, StepOutput *out);
+void step_env_subset(Env *env, struct SFArray *sfa, int opponent, int *moves, int *env_ids, int n, StepOutput *out);
+int step_env_async(Env *env, struct SFArray *sfa, int opponent, int *moves, StepOutput *out);
+void step_env_wait(Env *env);
 
 void board_arr_to_mask(int* board_arr, int *move_mask);
+void transition_arrays(int *boards, int *moves, int n, int *next_boards, int *move_mask, int *terminated, float *reward);
+int rollout_arrays(int *boards, int n, int n_playouts, int max_plies, unsigned long long seed,
+                   int *wins, int *draws, int *losses, float *mean_length);
 void board_to_mask(Board* board, int *move_mask);
+void board_to_planes(Board *board, unsigned char *planes);
+void board_to_planes_float(Board *board, float *planes);
 
 #endif /* CHESSENV_H */
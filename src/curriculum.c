@@ -0,0 +1,135 @@
+#include <stdlib.h>
+
+#include "curriculum.h"
+
+static double priority(Curriculum *curriculum, size_t j) {
+    float outcome = curriculum->outcome[j];
+    double variance = curriculum->square[j] - outcome * outcome;
+    if (variance < 0) {
+        variance = 0;
+    }
+    double horizon = CURRICULUM_HORIZON / (CURRICULUM_HORIZON + (double)curriculum->length[j]);
+    return curriculum->base[j] * (CURRICULUM_FLOOR + variance) * horizon;
+}
+
+/** Sets the priority of position j and updates the sums above it */
+static void set_priority(Curriculum *curriculum, size_t j) {
+    double *tree = curriculum->tree;
+    size_t node = curriculum->leaves + j;
+    tree[node] = priority(curriculum, j);
+    for (node /= 2; node > 0; node /= 2) {
+        tree[node] = tree[2 * node] + tree[2 * node + 1];
+    }
+}
+
+/**
+ * Creates a sampler over size positions with running averages updated at
+ * the given rate. cdf holds optional cumulative base weights, NULL weighs
+ * all positions the same. Returns NULL if it could not be allocated.
+ */
+Curriculum *create_curriculum(size_t size, double *cdf, float rate) {
+    Curriculum *curriculum = calloc(1, sizeof(Curriculum));
+    if (curriculum == NULL) {
+        return NULL;
+    }
+    pthread_mutex_init(&curriculum->lock, NULL);
+
+    size_t leaves = 1;
+    while (leaves < size) {
+        leaves *= 2;
+    }
+
+    curriculum->tree = calloc(2 * leaves, sizeof(double));
+    curriculum->base = malloc(size * sizeof(double));
+    curriculum->outcome = calloc(size, sizeof(float));
+    curriculum->square = malloc(size * sizeof(float));
+    curriculum->length = calloc(size, sizeof(float));
+    if (curriculum->tree == NULL || curriculum->base == NULL || curriculum->outcome == NULL
+            || curriculum->square == NULL || curriculum->length == NULL) {
+        free_curriculum(curriculum);
+        return NULL;
+    }
+
+    curriculum->leaves = leaves;
+    curriculum->size = size;
+    curriculum->rate = rate;
+
+    for (size_t j = 0; j < size; j++) {
+        // Unplayed positions count as won and lost equally often
+        curriculum->square[j] = 1;
+        if (cdf == NULL) {
+            curriculum->base[j] = 1;
+        } else {
+            curriculum->base[j] = j == 0 ? cdf[0] : cdf[j] - cdf[j - 1];
+        }
+        curriculum->tree[leaves + j] = priority(curriculum, j);
+    }
+    for (size_t node = leaves - 1; node > 0; node--) {
+        curriculum->tree[node] = curriculum->tree[2 * node] + curriculum->tree[2 * node + 1];
+    }
+    return curriculum;
+}
+
+void free_curriculum(Curriculum *curriculum) {
+    if (curriculum == NULL) {
+        return;
+    }
+    pthread_mutex_destroy(&curriculum->lock);
+    free(curriculum->tree);
+    free(curriculum->base);
+    free(curriculum->outcome);
+    free(curriculum->square);
+    free(curriculum->length);
+    free(curriculum);
+}
+
+/** Returns a position drawn in proportion to its priority, u is uniform in
+ * [0, 1) */
+size_t curriculum_sample(Curriculum *curriculum, double u) {
+    pthread_mutex_lock(&curriculum->lock);
+
+    double *tree = curriculum->tree;
+    u *= tree[1];
+    size_t node = 1;
+    while (node < curriculum->leaves) {
+        size_t left = 2 * node;
+        if (u < tree[left]) {
+            node = left;
+        } else {
+            u -= tree[left];
+            node = left + 1;
+        }
+    }
+
+    pthread_mutex_unlock(&curriculum->lock);
+
+    // Rounding can walk into the empty padding leaves
+    size_t j = node - curriculum->leaves;
+    return j < curriculum->size ? j : curriculum->size - 1;
+}
+
+/** Records the final reward and length of an episode started from
+ * position j */
+void curriculum_update(Curriculum *curriculum, size_t j, float reward, int length) {
+    pthread_mutex_lock(&curriculum->lock);
+
+    float rate = curriculum->rate;
+    curriculum->outcome[j] += rate * (reward - curriculum->outcome[j]);
+    curriculum->square[j] += rate * (reward * reward - curriculum->square[j]);
+    curriculum->length[j] += rate * (length - curriculum->length[j]);
+    set_priority(curriculum, j);
+
+    pthread_mutex_unlock(&curriculum->lock);
+}
+
+/** Copies out the priority, average outcome and average length of every
+ * position */
+void curriculum_stats(Curriculum *curriculum, double *priority, float *outcome, float *length) {
+    pthread_mutex_lock(&curriculum->lock);
+    for (size_t j = 0; j < curriculum->size; j++) {
+        priority[j] = curriculum->tree[curriculum->leaves + j];
+        outcome[j] = curriculum->outcome[j];
+        length[j] = curriculum->length[j];
+    }
+    pthread_mutex_unlock(&curriculum->lock);
+}
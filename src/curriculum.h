@@ -0,0 +1,45 @@
+#ifndef CURRICULUM_H
+#define CURRICULUM_H
+
+#include <stddef.h>
+#include <pthread.h>
+
+/* Lowest priority of a position relative to the most uncertain one, keeps
+ * every position reachable */
+#define CURRICULUM_FLOOR 0.05
+
+/* Episode length in steps at which a position's priority is halved */
+#define CURRICULUM_HORIZON 50
+
+/* Prioritized sampler over the M positions of a reset bank. Each position
+ * keeps running averages of the final reward, its square and the length of
+ * the episodes started from it, and is sampled in proportion to
+ *
+ *     base * (CURRICULUM_FLOOR + variance) * H / (H + length)
+ *
+ * with variance = max(0, square - outcome^2) and H = CURRICULUM_HORIZON.
+ * Positions whose results vary come up most, ones that are reliably won,
+ * lost or drawn least, and among equally uncertain positions the ones that
+ * take fewer steps to play out are preferred. Unplayed positions start at
+ * the highest variance. Priorities live in a sum-tree, sampling and
+ * updates are O(log M) and serialized by lock. */
+struct Curriculum {
+    double *tree;
+    size_t leaves;
+    size_t size;
+    double *base;
+    float *outcome;
+    float *square;
+    float *length;
+    float rate;
+    pthread_mutex_t lock;
+};
+typedef struct Curriculum Curriculum;
+
+Curriculum *create_curriculum(size_t size, double *cdf, float rate);
+void free_curriculum(Curriculum *curriculum);
+size_t curriculum_sample(Curriculum *curriculum, double u);
+void curriculum_update(Curriculum *curriculum, size_t j, float reward, int length);
+void curriculum_stats(Curriculum *curriculum, double *priority, float *outcome, float *length);
+
+#endif /* CURRICULUM_H */
@@ -0,0 +1,147 @@
+#include <stdlib.h>
+#include <stdio.h>
+#include <unistd.h>
+
+#include "envpool.h"
+
+static void *env_pool_worker(void *arg) {
+    EnvPool *pool = arg;
+    // Numbers the workers for the per-thread stats of the env
+    int thread = __atomic_fetch_add(&pool->next_thread, 1, __ATOMIC_RELAXED);
+
+    for (;;) {
+        pthread_mutex_lock(&pool->lock);
+        while (pool->work_count == 0 && !pool->shutdown) {
+            pthread_cond_wait(&pool->has_work, &pool->lock);
+        }
+        if (pool->shutdown) {
+            pthread_mutex_unlock(&pool->lock);
+            return NULL;
+        }
+        int i = pool->work[pool->work_head];
+        pool->work_head = (pool->work_head + 1) % pool->env->N;
+        pool->work_count--;
+        pthread_mutex_unlock(&pool->lock);
+
+        step_board(pool->env, pool->sfa, pool->opponent, i, pool->moves[i], pool->out, i, thread);
+
+        pthread_mutex_lock(&pool->lock);
+        pool->done[(pool->done_head + pool->done_count) % pool->env->N] = i;
+        pool->done_count++;
+        pthread_cond_signal(&pool->has_done);
+        pthread_mutex_unlock(&pool->lock);
+    }
+}
+
+/**
+ * Starts n_threads workers stepping boards of env. With n_threads of 0 one
+ * worker is started per Stockfish instance, or per CPU for other opponents.
+ */
+EnvPool *create_env_pool(Env *env, SFArray *sfa, int opponent, StepOutput *out, size_t n_threads) {
+    if (n_threads == 0) {
+        if (opponent == OPPONENT_STOCKFISH && sfa != NULL) {
+            n_threads = sfa->N;
+        } else {
+            long n_cpus = sysconf(_SC_NPROCESSORS_ONLN);
+            n_threads = n_cpus > 0 ? (size_t)n_cpus : 1;
+        }
+    }
+
+    EnvPool *pool = calloc(1, sizeof(EnvPool));
+    if (pool == NULL) {
+        return NULL;
+    }
+    pool->env = env;
+    pool->sfa = sfa;
+    pool->opponent = opponent;
+    pool->out = out;
+
+    pool->moves = calloc(env->N, sizeof(int));
+    pool->work = calloc(env->N, sizeof(int));
+    pool->done = calloc(env->N, sizeof(int));
+    pool->threads = calloc(n_threads, sizeof(pthread_t));
+    if (pool->moves == NULL || pool->work == NULL || pool->done == NULL || pool->threads == NULL) {
+        free_env_pool(pool);
+        return NULL;
+    }
+
+    pthread_mutex_init(&pool->lock, NULL);
+    pthread_cond_init(&pool->has_work, NULL);
+    pthread_cond_init(&pool->has_done, NULL);
+
+    for (size_t t = 0; t < n_threads; t++) {
+        if (pthread_create(&pool->threads[t], NULL, env_pool_worker, pool) != 0) {
+            break;
+        }
+        pool->n_threads++;
+    }
+    if (pool->n_threads == 0) {
+        free_env_pool(pool);
+        return NULL;
+    }
+    return pool;
+}
+
+/** Stops the workers, boards still queued are dropped */
+void free_env_pool(EnvPool *pool) {
+    if (pool == NULL) {
+        return;
+    }
+
+    if (pool->n_threads > 0) {
+        pthread_mutex_lock(&pool->lock);
+        pool->shutdown = 1;
+        pthread_cond_broadcast(&pool->has_work);
+        pthread_mutex_unlock(&pool->lock);
+
+        for (size_t t = 0; t < pool->n_threads; t++) {
+            pthread_join(pool->threads[t], NULL);
+        }
+        pthread_mutex_destroy(&pool->lock);
+        pthread_cond_destroy(&pool->has_work);
+        pthread_cond_destroy(&pool->has_done);
+    }
+
+    free(pool->moves);
+    free(pool->work);
+    free(pool->done);
+    free(pool->threads);
+    free(pool);
+}
+
+/**
+ * Queues moves[j] for board env_ids[j]. A board must not be sent again
+ * before its id has come back from env_pool_recv.
+ */
+void env_pool_send(EnvPool *pool, int *moves, int *env_ids, int n) {
+    pthread_mutex_lock(&pool->lock);
+    for (int j = 0; j < n; j++) {
+        int i = env_ids[j];
+        pool->moves[i] = moves[j];
+        pool->work[(pool->work_head + pool->work_count) % pool->env->N] = i;
+        pool->work_count++;
+    }
+    pthread_cond_broadcast(&pool->has_work);
+    pthread_mutex_unlock(&pool->lock);
+}
+
+/**
+ * Blocks until at least min_batch boards have finished, then writes the ids
+ * of up to max_batch of them, in completion order, to env_ids. Returns the
+ * number of ids written.
+ */
+int env_pool_recv(EnvPool *pool, int min_batch, int max_batch, int *env_ids) {
+    pthread_mutex_lock(&pool->lock);
+    while (pool->done_count < (size_t)min_batch) {
+        pthread_cond_wait(&pool->has_done, &pool->lock);
+    }
+
+    int n = 0;
+    while (n < max_batch && pool->done_count > 0) {
+        env_ids[n++] = pool->done[pool->done_head];
+        pool->done_head = (pool->done_head + 1) % pool->env->N;
+        pool->done_count--;
+    }
+    pthread_mutex_unlock(&pool->lock);
+    return n;
+}
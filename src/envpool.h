@@ -0,0 +1,41 @@
+#ifndef ENVPOOL_H
+#define ENVPOOL_H
+
+#include <pthread.h>
+
+#include "chessenv.h"
+#include "sfarray.h"
+
+/* Worker threads that step individual boards of an Env as they are sent and
+ * hand back the ids of finished boards in completion order. Results are
+ * written to slot i of the StepOutput buffers for board i. */
+struct EnvPool {
+    Env *env;
+    SFArray *sfa;
+    int opponent;
+    StepOutput *out;
+
+    pthread_mutex_t lock;
+    pthread_cond_t has_work;
+    pthread_cond_t has_done;
+    pthread_t *threads;
+    size_t n_threads;
+    int next_thread;
+    int shutdown;
+
+    int *moves;
+    int *work;
+    size_t work_head;
+    size_t work_count;
+    int *done;
+    size_t done_head;
+    size_t done_count;
+};
+typedef struct EnvPool EnvPool;
+
+EnvPool *create_env_pool(Env *env, SFArray *sfa, int opponent, StepOutput *out, size_t n_threads);
+void free_env_pool(EnvPool *pool);
+void env_pool_send(EnvPool *pool, int *moves, int *env_ids, int n);
+int env_pool_recv(EnvPool *pool, int min_batch, int max_batch, int *env_ids);
+
+#endif /* ENVPOOL_H */
@@ -3,6 +3,7 @@
 #include <string.h>
 #include "rep.h"
 #include "move_map.h"
+#include "threads.h"
 
 /* Forward declarations */
 int offset_to_id(int offset_x, int offset_y, int promo);
@@ -11,32 +12,42 @@ int index_to_offset_id(int index);
 int offset_id_to_index(int offset_id);
 int move_str_to_rep_int(char *move_str);
 
-/* Converts the standard vector legal mask int a move array specific mask, used
- * for transformers.
- */
-void legal_mask_to_move_arr_mask(int *move_arr_mask, int *legal_mask, int N) {
+/* Arguments of legal_mask_to_move_arr_mask */
+typedef struct {
+    int *move_arr_mask;
+    int *legal_mask;
+} MaskLoop;
+
+static void move_arr_mask_body(void *arg, size_t i, int thread) {
+    MaskLoop *loop = arg;
+    int *move_arr_mask = loop->move_arr_mask;
+    int *legal_mask = loop->legal_mask;
 
-#pragma omp parallel for
-    for (size_t i = 0; i < (size_t)N; i++) {
-        int idx = 0;
-        for (size_t j = 0; j < (64 * OFF_TOTAL); j++) {
-            if (legal_mask[i * 64 * OFF_TOTAL + j] == 1) {
+    int idx = 0;
+    for (size_t j = 0; j < (64 * OFF_TOTAL); j++) {
+        if (legal_mask[i * 64 * OFF_TOTAL + j] == 1) {
 
-                int move_arr[5];
-                int_to_move_arr(move_arr, (int*)&j);
+            int move_arr[5];
+            int_to_move_arr(move_arr, (int*)&j);
 
-                int move_rep[2] = {5, 9};
-                move_arr_to_move_rep(move_rep, move_arr);
+            int move_rep[2] = {5, 9};
+            move_arr_to_move_rep(move_rep, move_arr);
 
-                move_arr_mask[i * 2 * 256 + idx] = move_rep[0];
-                move_arr_mask[i * 2 * 256 + idx + 1] = move_rep[1];
+            move_arr_mask[i * 2 * 256 + idx] = move_rep[0];
+            move_arr_mask[i * 2 * 256 + idx + 1] = move_rep[1];
 
-                idx += 2;
-            }
+            idx += 2;
         }
     }
 }
 
+/* Converts the standard vector legal mask int a move array specific mask, used
+ * for transformers.
+ */
+void legal_mask_to_move_arr_mask(int *move_arr_mask, int *legal_mask, int N) {
+    parallel_for(NULL, N, move_arr_mask_body, &(MaskLoop){move_arr_mask, legal_mask});
+}
+
 /* Converts a move array into the move rep format for transformers. */
 void move_arr_to_move_rep(int *move_rep, int *move_arr) {
 
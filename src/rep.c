@@ -3,21 +3,81 @@
 #include <stdio.h>
 
 #include "rep.h"
+#include "threads.h"
 #include "board.h"
 #include "gen.h"
 
+/*
+ * Mirrors the board vertically and swaps the colors of every piece, so the
+ * side to move becomes the other color. Equivalent to loading the fen from
+ * board_to_inverted_fen, without going through a string.
+ */
 void invert_board(Board *board) {
-    char fen[512];
-    board_to_inverted_fen(fen, *board);
-    board_load_fen(board, fen);
+    Board src = *board;
+
+    board_clear(board);
+    for (int sq = 0; sq < 64; sq++) {
+        int piece = src.squares[sq];
+        if (piece != EMPTY) {
+            board_set(board, RF(7 - sq / 8, sq % 8), piece ^ BLACK);
+        }
+    }
+
+    if (src.color == WHITE) {
+        board->color = BLACK;
+        board->hash ^= HASH_COLOR;
+        board->pawn_hash ^= HASH_COLOR;
+    } else {
+        board->color = WHITE;
+    }
+
+    // White rights move to the black bits and vice versa
+    board->castle = ((src.castle & 3) << 2) | ((src.castle >> 2) & 3);
+    board->hash ^= HASH_CASTLE[CASTLE_ALL];
+    board->hash ^= HASH_CASTLE[board->castle];
+    board->pawn_hash ^= HASH_CASTLE[CASTLE_ALL];
+    board->pawn_hash ^= HASH_CASTLE[board->castle];
+
+    if (src.ep) {
+        int sq = LSB(src.ep);
+        board->ep = BIT(RF(7 - sq / 8, sq % 8));
+        board->hash ^= HASH_EP[LSB(board->ep) % 8];
+        board->pawn_hash ^= HASH_EP[LSB(board->ep) % 8];
+    }
 }
 
+/* Inverts a board array in place, see invert_board */
 void invert_array(int *board_arr) {
-    Board board;
-    board_reset(&board);
-    array_to_board(&board, board_arr);
-    invert_board(&board);
-    board_to_array(board_arr, board);
+    // Swap rank i with rank 7 - i, flipping piece colors
+    for (int rank = 0; rank < 4; rank++) {
+        int *top = board_arr + rank * 8;
+        int *bottom = board_arr + (7 - rank) * 8;
+        for (int file = 0; file < 8; file++) {
+            int a = top[file];
+            int b = bottom[file];
+            top[file] = (b >= 1 && b <= 12) ? (b + 5) % 12 + 1 : b;
+            bottom[file] = (a >= 1 && a <= 12) ? (a + 5) % 12 + 1 : a;
+        }
+    }
+
+    board_arr[64] = (board_arr[64] == 14) ? 15 : 14;
+
+    // Black queen, black king, white queen, white king
+    int black_queen = board_arr[65];
+    int black_king = board_arr[66];
+    board_arr[65] = board_arr[67] + 4;
+    board_arr[66] = board_arr[68] + 4;
+    board_arr[67] = black_queen - 4;
+    board_arr[68] = black_king - 4;
+}
+
+static void invert_array_body(void *arg, size_t i, int thread) {
+    invert_array((int *)arg + i * 69);
+}
+
+/* Inverts n board arrays in place, in parallel */
+void invert_arrays(int *board_arrs, int n) {
+    parallel_for(NULL, n, invert_array_body, board_arrs);
 }
 
 /* Converts a Board type into a board array */
@@ -392,6 +452,40 @@ void array_to_possible(int *move_arr, int *board_arr) {
     }
 }
 
+/* Arguments of parallel_array_to_possible */
+typedef struct {
+    int *move_arr;
+    int *board_arrs;
+} PossibleLoop;
+
+static void possible_body(void *arg, size_t i, int thread) {
+    PossibleLoop *loop = arg;
+    int *move_arr = loop->move_arr;
+    int *board_arrs = loop->board_arrs;
+
+    // Create a board from the array
+    Board board;
+    array_to_board(&board, board_arrs + i * 69);
+
+    // Generate legal moves
+    Move possible_moves[MAX_MOVES];
+    int total_legal = gen_legal_moves(&board, possible_moves);
+
+    // Calculate offset for this board's moves in the output array
+    int move_offset = i * MAX_MOVES * 5;
+
+    // Write all legal moves to the output array
+    for (int j = 0; j < total_legal; j++) {
+        move_to_array(&move_arr[move_offset + j * 5], possible_moves[j]);
+    }
+
+    // If there are fewer than MAX_MOVES legal moves, zero out the rest
+    // This marks the end of the move list for this board
+    for (int j = total_legal * 5; j < MAX_MOVES * 5; j++) {
+        move_arr[move_offset + j] = 0;
+    }
+}
+
 /*
  * Converts multiple board arrays into their respective possible moves in parallel
  *
@@ -407,33 +501,7 @@ void array_to_possible(int *move_arr, int *board_arr) {
 void parallel_array_to_possible(int *move_arr, int *board_arrs, int n) {
     bb_init();  // Make sure bitboards are initialized
 
-    // Try to parallelize with OpenMP if available
-    #if defined(_OPENMP)
-    #pragma omp parallel for
-    #endif
-    for (int i = 0; i < n; i++) {
-        // Create a board from the array
-        Board board;
-        array_to_board(&board, board_arrs + i * 69);
-
-        // Generate legal moves
-        Move possible_moves[MAX_MOVES];
-        int total_legal = gen_legal_moves(&board, possible_moves);
-
-        // Calculate offset for this board's moves in the output array
-        int move_offset = i * MAX_MOVES * 5;
-
-        // Write all legal moves to the output array
-        for (int j = 0; j < total_legal; j++) {
-            move_to_array(&move_arr[move_offset + j * 5], possible_moves[j]);
-        }
-
-        // If there are fewer than MAX_MOVES legal moves, zero out the rest
-        // This marks the end of the move list for this board
-        for (int j = total_legal * 5; j < MAX_MOVES * 5; j++) {
-            move_arr[move_offset + j] = 0;
-        }
-    }
+    parallel_for(NULL, n, possible_body, &(PossibleLoop){move_arr, board_arrs});
 }
 
 /* Converts a fen string into an array of possible moves */
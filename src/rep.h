@@ -22,3 +22,4 @@ void array_to_inverted_fen(char* fen, int* boards);
 
 void invert_board(Board *boards);
 void invert_array(int *boards);
+void invert_arrays(int *boards, int n);
@@ -6,27 +6,39 @@
 #include <math.h>
 #include <time.h>
 #include <sys/wait.h> /* For waitpid */
+#include <pthread.h>
 
 /* Handle OpenMP conditionally */
 #ifdef _OPENMP
 #include <omp.h>
 #define HAVE_OPENMP 1
 #else
-/* Define OpenMP functions as no-ops for platforms without OpenMP */
 #define HAVE_OPENMP 0
-static inline int omp_get_thread_num() { return 0; }
-static inline void omp_set_num_threads(int num) { (void)num; }
 #endif
 
 #include "chessenv.h"
 #include "sfarray.h"
 #include "move_map.h"
 #include "rep.h"
+#include "threads.h"
 
 #include "board.h"
 #include "move.h"
 #include "gen.h"
 
+/* One lock per Stockfish pipe */
+struct SFLocks {
+    pthread_mutex_t pipe[256];
+};
+
+/* Arguments of the loops over Stockfish instances */
+typedef struct {
+    SFArray *sfa;
+    int *moves;
+    int *boards;
+    Env *env;
+} SFLoop;
+
 void get_sf_move(SFPipe *sfpipe, char * fen, int depth, char *move) {
     char cmd[256];
     char buf[1024];
@@ -91,7 +103,9 @@ void clean_sfpipe(SFPipe *pipe) {
     fclose(pipe->out);
 }
 
-void create_sfarray(SFArray* sfa, int depth, size_t n_threads) {
+/** Starts the Stockfish instances, returns -1 if the array could not be
+ * allocated, leaving it empty */
+int create_sfarray(SFArray* sfa, int depth, size_t n_threads) {
     // Default to 4 threads/pipes if not specified
     size_t num_threads = 4;
 
@@ -110,9 +124,22 @@ void create_sfarray(SFArray* sfa, int depth, size_t n_threads) {
     // Cap at 256 which is the max size of sfpipe array
     if (num_threads > 256) num_threads = 256;
 
-    omp_set_num_threads(num_threads);
+    // One thread per instance, only for the loops over this array
     sfa->N = num_threads;
+    sfa->threads = create_thread_config(num_threads);
     sfa->depth = depth;
+    sfa->locks = malloc(sizeof(struct SFLocks));
+    if (sfa->threads == NULL || sfa->locks == NULL) {
+        free_thread_config(sfa->threads);
+        free(sfa->locks);
+        sfa->threads = NULL;
+        sfa->locks = NULL;
+        sfa->N = 0;
+        return -1;
+    }
+    for (size_t i = 0; i < num_threads; i++) {
+        pthread_mutex_init(&sfa->locks->pipe[i], NULL);
+    }
 
     // Print OpenMP status
     printf("OpenMP Status: %s\n", HAVE_OPENMP ? "Enabled" : "Disabled");
@@ -126,71 +153,89 @@ void create_sfarray(SFArray* sfa, int depth, size_t n_threads) {
     for (size_t i = 0; i < sfa->N; i++) {
         create_sfpipe(&sfa->sfpipe[i]);
     }
+    return 0;
 }
 
 void clean_sfarray(SFArray* arr) {
     for (size_t i = 0; i < arr->N; i++) {
         clean_sfpipe(&arr->sfpipe[i]);
+        pthread_mutex_destroy(&arr->locks->pipe[i]);
     }
+    free_thread_config(arr->threads);
+    arr->threads = NULL;
+    free(arr->locks);
+    arr->locks = NULL;
 }
 
-void board_arr_to_moves(int* moves, SFArray *sfa, int* boards, size_t N) {
-#pragma omp parallel for
-    for (size_t i = 0; i < N; i++) {
-        // Use thread_id modulo number of Stockfish instances
-        int thread_id = omp_get_thread_num() % sfa->N;
+/** Runs one search on instance sf_idx, waiting for other searches on it */
+static void locked_sf_move(SFArray *sfa, size_t sf_idx, char *fen, char *move) {
+    pthread_mutex_lock(&sfa->locks->pipe[sf_idx]);
+    get_sf_move(&sfa->sfpipe[sf_idx], fen, sfa->depth, move);
+    pthread_mutex_unlock(&sfa->locks->pipe[sf_idx]);
+}
 
-        char fen[512];
-        array_to_fen_noep(fen, &boards[i * 69]);
-        // Unused variable 'len' removed
+static void sf_moves_body(void *arg, size_t i, int thread) {
+    SFLoop *loop = arg;
+    int *moves = loop->moves;
 
-        char move_str[10];
-        get_sf_move(&sfa->sfpipe[thread_id], fen, sfa->depth, move_str);
+    // The loop runs on one thread per Stockfish instance
+    char fen[512];
+    array_to_fen_noep(fen, &loop->boards[i * 69]);
 
-        int move_arr[5];
-        move_str_to_array(move_arr, move_str);
-        move_arr_to_move_rep(&moves[2 * i], move_arr);
-    }
+    char move_str[10];
+    locked_sf_move(loop->sfa, thread % loop->sfa->N, fen, move_str);
+
+    int move_arr[5];
+    move_str_to_array(move_arr, move_str);
+    move_arr_to_move_rep(&moves[2 * i], move_arr);
 }
 
-void board_arr_to_move_int(int* moves, SFArray *sfa, int* boards, size_t N) {
-#pragma omp parallel for
-    for (size_t i = 0; i < N; i++) {
-        // Use thread_id modulo number of Stockfish instances
-        int thread_id = omp_get_thread_num() % sfa->N;
+void board_arr_to_moves(int* moves, SFArray *sfa, int* boards, size_t N) {
+    parallel_for(sfa->threads, N, sf_moves_body, &(SFLoop){sfa, moves, boards, NULL});
+}
 
-        char fen[512];
-        array_to_fen_noep(fen, &boards[i * 69]);
-        // Unused variable 'len' removed
+static void sf_move_int_body(void *arg, size_t i, int thread) {
+    SFLoop *loop = arg;
+    int *moves = loop->moves;
 
-        char move_str[10];
-        get_sf_move(&sfa->sfpipe[thread_id], fen, sfa->depth, move_str);
+    // The loop runs on one thread per Stockfish instance
+    char fen[512];
+    array_to_fen_noep(fen, &loop->boards[i * 69]);
 
-        int move_arr[5];
-        move_str_to_array(move_arr, move_str);
-        move_arr_to_int(&moves[i], move_arr);
-    }
+    char move_str[10];
+    locked_sf_move(loop->sfa, thread % loop->sfa->N, fen, move_str);
+
+    int move_arr[5];
+    move_str_to_array(move_arr, move_str);
+    move_arr_to_int(&moves[i], move_arr);
 }
 
-void generate_stockfish_move(Env *env, SFArray *sfa, int* moves) {
-    // When OpenMP is disabled, this section runs sequentially
-    // but still distributes environments across available Stockfish instances
-#pragma omp parallel for
-    for (size_t i = 0; i < env->N; i++) {
-        // Use modulo to wrap around if we have more environments than Stockfish instances
-        int sf_idx = i % sfa->N;
+void board_arr_to_move_int(int* moves, SFArray *sfa, int* boards, size_t N) {
+    parallel_for(sfa->threads, N, sf_move_int_body, &(SFLoop){sfa, moves, boards, NULL});
+}
 
-        char fen[512];
-        char move_str[10];
+/* Asks Stockfish instance sf_idx for a move on the board, returns the move id.
+ * Safe to call for the same instance from several threads. */
+void board_to_sf_move_int(int *move, SFArray *sfa, size_t sf_idx, Board *board) {
+    char fen[512];
+    char move_str[10];
 
-        Board board = env->boards[i];
-        board_to_fen(fen, board);
+    board_to_fen(fen, *board);
 
-        get_sf_move(&sfa->sfpipe[sf_idx], fen, sfa->depth, move_str);
+    locked_sf_move(sfa, sf_idx, fen, move_str);
 
-        int move_arr[5];
-        move_str_to_array(move_arr, move_str);
+    int move_arr[5];
+    move_str_to_array(move_arr, move_str);
 
-        move_arr_to_int(&moves[i], move_arr);
-    }
+    move_arr_to_int(move, move_arr);
+}
+
+static void sf_env_move_body(void *arg, size_t i, int thread) {
+    SFLoop *loop = arg;
+    // Use modulo to wrap around if we have more environments than Stockfish instances
+    board_to_sf_move_int(&loop->moves[i], loop->sfa, i % loop->sfa->N, &loop->env->boards[i]);
+}
+
+void generate_stockfish_move(Env *env, SFArray *sfa, int* moves) {
+    parallel_for(sfa->threads, env->N, sf_env_move_body, &(SFLoop){sfa, moves, NULL, env});
 }
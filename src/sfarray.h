@@ -10,21 +10,26 @@ struct SFPipe {
 };
 typedef struct SFPipe SFPipe;
 
+/* Stockfish instances. A pipe serves one search at a time, threads asking
+ * the same instance wait on its lock. */
 struct SFArray {
     size_t N;
     int depth;
     SFPipe sfpipe[256];
+    struct ThreadConfig *threads;
+    struct SFLocks *locks;
 };
 typedef struct SFArray SFArray;
 
 /* Function declarations */
 void create_sfpipe(SFPipe *sfpipe);
 void clean_sfpipe(SFPipe *pipe);
-void create_sfarray(SFArray* sfa, int depth, size_t n_threads);
+int create_sfarray(SFArray* sfa, int depth, size_t n_threads);
 void clean_sfarray(SFArray* arr);
 void get_sf_move(SFPipe *sfpipe, char *fen, int depth, char *move);
 void board_arr_to_moves(int* moves, SFArray *sfa, int* boards, size_t N);
 void board_arr_to_move_int(int* moves, SFArray *sfa, int* boards, size_t N);
+void board_to_sf_move_int(int *move, SFArray *sfa, size_t sf_idx, Board *board);
 void generate_stockfish_move(Env *env, SFArray *sfa, int* moves);
 
 #endif /* SFARRAY_H */
@@ -0,0 +1,43 @@
+#include <stdlib.h>
+#include <string.h>
+
+#include "stats.h"
+
+/** Allocates zeroed counters for n_slots threads, NULL on failure */
+Stats *create_stats(int n_slots) {
+    Stats *stats = malloc(sizeof(Stats));
+    if (stats == NULL) {
+        return NULL;
+    }
+    stats->n_slots = n_slots > 0 ? n_slots : 1;
+    void *slots = NULL;
+    if (posix_memalign(&slots, 64, stats->n_slots * sizeof(StatSlot)) != 0) {
+        free(stats);
+        return NULL;
+    }
+    stats->slots = slots;
+    clear_stats(stats);
+    return stats;
+}
+
+void free_stats(Stats *stats) {
+    if (stats == NULL) {
+        return;
+    }
+    free(stats->slots);
+    free(stats);
+}
+
+/** Zeroes every counter. Counts added concurrently may be lost */
+void clear_stats(Stats *stats) {
+    memset(stats->slots, 0, stats->n_slots * sizeof(StatSlot));
+}
+
+/** Writes the N_STAT_FIELDS counters of every slot to values */
+void copy_stats(Stats *stats, unsigned long long *values) {
+    for (int s = 0; s < stats->n_slots; s++) {
+        for (int f = 0; f < N_STAT_FIELDS; f++) {
+            values[s * N_STAT_FIELDS + f] = __atomic_load_n(&stats->slots[s].values[f], __ATOMIC_RELAXED);
+        }
+    }
+}
@@ -0,0 +1,73 @@
+#ifndef STATS_H
+#define STATS_H
+
+#include <time.h>
+
+/* Phases of a step that are timed */
+#define STAT_MOVEGEN 0
+#define STAT_MAKE_MOVE 1
+#define STAT_MASK 2
+#define STAT_ENCODE 3
+#define STAT_RESET 4
+#define STAT_RANDOM_START 5
+#define STAT_OPPONENT 6
+#define N_STAT_PHASES 7
+
+/* Counters of a slot: nanoseconds and calls per phase, then totals */
+#define STAT_NS(phase) (phase)
+#define STAT_CALLS(phase) (N_STAT_PHASES + (phase))
+#define STAT_BOARDS (2 * N_STAT_PHASES)
+#define STAT_LEGAL_MOVES (2 * N_STAT_PHASES + 1)
+#define STAT_RESETS (2 * N_STAT_PHASES + 2)
+#define N_STAT_FIELDS (2 * N_STAT_PHASES + 3)
+
+/* Counters of one thread, aligned to cache lines so threads never write
+ * the same line */
+struct StatSlot {
+    unsigned long long values[N_STAT_FIELDS];
+} __attribute__((aligned(64)));
+typedef struct StatSlot StatSlot;
+
+/* Per-thread step counters of an env. Thread t adds to slot t % n_slots
+ * with relaxed atomics, so counting never takes a lock and only contends
+ * when more threads than slots run. */
+struct Stats {
+    StatSlot *slots;
+    int n_slots;
+};
+typedef struct Stats Stats;
+
+Stats *create_stats(int n_slots);
+void free_stats(Stats *stats);
+void clear_stats(Stats *stats);
+void copy_stats(Stats *stats, unsigned long long *values);
+
+/** Starts timing a phase, 0 when stats are off */
+static inline unsigned long long stat_clock(Stats *stats) {
+    if (stats == NULL) {
+        return 0;
+    }
+    struct timespec now;
+    clock_gettime(CLOCK_MONOTONIC, &now);
+    return (unsigned long long)now.tv_sec * 1000000000ULL + now.tv_nsec;
+}
+
+/** Adds value to a counter of the slot of thread */
+static inline void stat_add(Stats *stats, int thread, int field, unsigned long long value) {
+    if (stats == NULL) {
+        return;
+    }
+    StatSlot *slot = &stats->slots[thread % stats->n_slots];
+    __atomic_fetch_add(&slot->values[field], value, __ATOMIC_RELAXED);
+}
+
+/** Ends timing a phase started by stat_clock */
+static inline void stat_time(Stats *stats, int thread, int phase, unsigned long long start) {
+    if (stats == NULL) {
+        return;
+    }
+    stat_add(stats, thread, STAT_NS(phase), stat_clock(stats) - start);
+    stat_add(stats, thread, STAT_CALLS(phase), 1);
+}
+
+#endif /* STATS_H */
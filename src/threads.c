@@ -0,0 +1,412 @@
+// pthread_setaffinity_np
+#ifndef _GNU_SOURCE
+#define _GNU_SOURCE
+#endif
+#include <stdlib.h>
+#include <string.h>
+#include <unistd.h>
+#include <pthread.h>
+#ifdef __linux__
+#include <sched.h>
+#endif
+#ifdef _OPENMP
+#include <omp.h>
+#endif
+
+#include "threads.h"
+
+// Versions identify a config and its settings, pinned threads remember the
+// version they were pinned for. 0 means not pinned.
+static unsigned next_version = 1;
+static __thread unsigned pinned_version = 0;
+
+static int online_cpus(void) {
+    long n = sysconf(_SC_NPROCESSORS_ONLN);
+    return n > 0 ? (int)n : 1;
+}
+
+/**
+ * Pins a worker thread to its CPU of the config, or releases a thread
+ * pinned by another config back to every CPU. The calling thread, number
+ * 0, is never pinned.
+ */
+static void pin_thread(ThreadConfig *config, int thread) {
+#ifdef __linux__
+    if (thread == 0) {
+        return;
+    }
+    if (config->n_cpus == 0 ? pinned_version == 0 : pinned_version == config->version) {
+        return;
+    }
+
+    cpu_set_t set;
+    CPU_ZERO(&set);
+    if (config->n_cpus > 0) {
+        CPU_SET(config->cpus[(thread - 1) % config->n_cpus], &set);
+    } else {
+        int n = online_cpus();
+        for (int c = 0; c < n && c < CPU_SETSIZE; c++) {
+            CPU_SET(c, &set);
+        }
+    }
+    pthread_setaffinity_np(pthread_self(), sizeof(set), &set);
+    pinned_version = config->n_cpus > 0 ? config->version : 0;
+#else
+    (void)config;
+    (void)thread;
+#endif
+}
+
+#ifndef _OPENMP
+
+/* Persistent workers for builds without OpenMP. The calling thread runs
+ * share 0 of every loop, the workers the others. */
+struct ThreadPool {
+    pthread_t *threads;
+    struct Worker *workers;
+    int n_workers;
+    pthread_mutex_t job_lock;
+    pthread_mutex_t lock;
+    pthread_cond_t start;
+    pthread_cond_t finish;
+    unsigned long generation;
+    int pending;
+    int shutdown;
+
+    ThreadConfig *config;
+    LoopBody body;
+    void *ctx;
+    size_t n;
+    size_t next;
+};
+typedef struct ThreadPool ThreadPool;
+
+struct Worker {
+    ThreadPool *pool;
+    int thread;
+};
+typedef struct Worker Worker;
+
+// Set on threads running a loop body, nested loops run serially there
+static __thread int in_loop = 0;
+
+/** Runs the part of the current loop that belongs to one thread */
+static void run_share(ThreadPool *pool, int thread) {
+    ThreadConfig *config = pool->config;
+    size_t n = pool->n;
+    size_t n_threads = pool->n_workers + 1;
+    size_t chunk = config->chunk > 0 ? (size_t)config->chunk : 0;
+
+    if (config->schedule == SCHEDULE_STATIC) {
+        if (chunk == 0) {
+            size_t hi = n * (thread + 1) / n_threads;
+            for (size_t i = n * thread / n_threads; i < hi; i++) {
+                pool->body(pool->ctx, i, thread);
+            }
+            return;
+        }
+        for (size_t lo = thread * chunk; lo < n; lo += n_threads * chunk) {
+            for (size_t i = lo; i < lo + chunk && i < n; i++) {
+                pool->body(pool->ctx, i, thread);
+            }
+        }
+        return;
+    }
+
+    if (chunk == 0) {
+        chunk = 1;
+    }
+    for (;;) {
+        size_t lo;
+        size_t size = chunk;
+        if (config->schedule == SCHEDULE_GUIDED) {
+            // Chunks shrink with the remaining work, down to chunk
+            lo = __atomic_load_n(&pool->next, __ATOMIC_RELAXED);
+            do {
+                if (lo >= n) {
+                    return;
+                }
+                size = (n - lo) / n_threads;
+                if (size < chunk) {
+                    size = chunk;
+                }
+            } while (!__atomic_compare_exchange_n(&pool->next, &lo, lo + size, 0,
+                                                  __ATOMIC_RELAXED, __ATOMIC_RELAXED));
+        } else {
+            lo = __atomic_fetch_add(&pool->next, size, __ATOMIC_RELAXED);
+        }
+        if (lo >= n) {
+            return;
+        }
+        for (size_t i = lo; i < lo + size && i < n; i++) {
+            pool->body(pool->ctx, i, thread);
+        }
+    }
+}
+
+static void *pool_worker(void *arg) {
+    Worker *worker = arg;
+    ThreadPool *pool = worker->pool;
+    unsigned long seen = 0;
+    in_loop = 1;
+
+    for (;;) {
+        pthread_mutex_lock(&pool->lock);
+        while (pool->generation == seen && !pool->shutdown) {
+            pthread_cond_wait(&pool->start, &pool->lock);
+        }
+        if (pool->shutdown) {
+            pthread_mutex_unlock(&pool->lock);
+            return NULL;
+        }
+        seen = pool->generation;
+        pthread_mutex_unlock(&pool->lock);
+
+        pin_thread(pool->config, worker->thread);
+        run_share(pool, worker->thread);
+
+        pthread_mutex_lock(&pool->lock);
+        pool->pending--;
+        if (pool->pending == 0) {
+            pthread_cond_signal(&pool->finish);
+        }
+        pthread_mutex_unlock(&pool->lock);
+    }
+}
+
+static void free_pool(ThreadPool *pool) {
+    if (pool == NULL) {
+        return;
+    }
+    pthread_mutex_lock(&pool->lock);
+    pool->shutdown = 1;
+    pthread_cond_broadcast(&pool->start);
+    pthread_mutex_unlock(&pool->lock);
+
+    for (int t = 0; t < pool->n_workers; t++) {
+        pthread_join(pool->threads[t], NULL);
+    }
+
+    pthread_mutex_destroy(&pool->job_lock);
+    pthread_mutex_destroy(&pool->lock);
+    pthread_cond_destroy(&pool->start);
+    pthread_cond_destroy(&pool->finish);
+    free(pool->threads);
+    free(pool->workers);
+    free(pool);
+}
+
+static ThreadPool *create_pool(int n_workers) {
+    ThreadPool *pool = calloc(1, sizeof(ThreadPool));
+    Worker *workers = calloc(n_workers, sizeof(Worker));
+    if (pool == NULL || workers == NULL) {
+        free(pool);
+        free(workers);
+        return NULL;
+    }
+    pool->threads = calloc(n_workers, sizeof(pthread_t));
+    if (pool->threads == NULL) {
+        free(pool);
+        free(workers);
+        return NULL;
+    }
+    pool->workers = workers;
+    pthread_mutex_init(&pool->job_lock, NULL);
+    pthread_mutex_init(&pool->lock, NULL);
+    pthread_cond_init(&pool->start, NULL);
+    pthread_cond_init(&pool->finish, NULL);
+
+    for (int t = 0; t < n_workers; t++) {
+        workers[t].pool = pool;
+        workers[t].thread = t + 1;
+        if (pthread_create(&pool->threads[t], NULL, pool_worker, &workers[t]) != 0) {
+            break;
+        }
+        pool->n_workers++;
+    }
+    return pool;
+}
+
+#endif
+
+/**
+ * Creates a config running loops on n_threads threads, 0 for one per CPU,
+ * with a static schedule. Returns NULL if it could not be allocated.
+ */
+ThreadConfig *create_thread_config(int n_threads) {
+    ThreadConfig *config = calloc(1, sizeof(ThreadConfig));
+    if (config == NULL) {
+        return NULL;
+    }
+    config->n_threads = n_threads > 0 ? n_threads : 0;
+    config->schedule = SCHEDULE_STATIC;
+    config->version = __atomic_fetch_add(&next_version, 1, __ATOMIC_RELAXED);
+    return config;
+}
+
+void free_thread_config(ThreadConfig *config) {
+    if (config == NULL) {
+        return;
+    }
+#ifndef _OPENMP
+    free_pool(config->pool);
+#endif
+    free(config->cpus);
+    free(config);
+}
+
+/**
+ * Changes the settings of a config, see ThreadConfig. cpus is copied.
+ * Must not be called while a loop runs on the config. Returns -1 for
+ * invalid settings, or a pinning list where pinning is not supported.
+ */
+int configure_threads(ThreadConfig *config, int n_threads, int schedule, int chunk, int *cpus, int n_cpus) {
+    if (n_threads < 0 || chunk < 0 || n_cpus < 0
+            || schedule < SCHEDULE_STATIC || schedule > SCHEDULE_GUIDED) {
+        return -1;
+    }
+#ifndef __linux__
+    if (n_cpus > 0) {
+        return -1;
+    }
+#endif
+    int *copy = NULL;
+    if (n_cpus > 0) {
+        copy = malloc(n_cpus * sizeof(int));
+        if (copy == NULL) {
+            return -1;
+        }
+        for (int c = 0; c < n_cpus; c++) {
+            if (cpus[c] < 0) {
+                free(copy);
+                return -1;
+            }
+            copy[c] = cpus[c];
+        }
+    }
+
+#ifndef _OPENMP
+    // Workers are started again for the new thread count and pinning
+    free_pool(config->pool);
+    config->pool = NULL;
+#endif
+    free(config->cpus);
+    config->cpus = copy;
+    config->n_cpus = n_cpus;
+    config->n_threads = n_threads;
+    config->schedule = schedule;
+    config->chunk = chunk;
+    config->version = __atomic_fetch_add(&next_version, 1, __ATOMIC_RELAXED);
+    return 0;
+}
+
+/** Number of threads the loops of config run on */
+int thread_count(ThreadConfig *config) {
+    return config->n_threads > 0 ? config->n_threads : online_cpus();
+}
+
+#ifdef _OPENMP
+/* Work-shared loop over [0, n) with the given pragma, inside a parallel region */
+#define OMP_LOOP(pragma)                   \
+    _Pragma(pragma)                        \
+    for (size_t i = 0; i < n; i++) {       \
+        body(ctx, i, thread);              \
+    }
+#endif
+
+static ThreadConfig *default_config = NULL;
+static pthread_once_t default_once = PTHREAD_ONCE_INIT;
+
+static void create_default_config(void) {
+    default_config = create_thread_config(0);
+}
+
+/**
+ * Calls body for every i in [0, n) on the threads of config, a NULL config
+ * uses one thread per CPU with a static schedule. Returns once every call
+ * finished.
+ */
+void parallel_for(ThreadConfig *config, size_t n, LoopBody body, void *ctx) {
+    if (config == NULL) {
+        pthread_once(&default_once, create_default_config);
+        config = default_config;
+    }
+    if (n == 0) {
+        return;
+    }
+
+#ifdef _OPENMP
+    if (config == NULL) {
+        for (size_t i = 0; i < n; i++) {
+            body(ctx, i, 0);
+        }
+        return;
+    }
+    // The schedule is spelled out per loop, setting the run-sched ICV would
+    // change it for every other OpenMP user on the calling thread
+    int schedule = config->schedule;
+    int chunk = config->chunk;
+
+#pragma omp parallel num_threads(thread_count(config))
+    {
+        int thread = omp_get_thread_num();
+        pin_thread(config, thread);
+
+        if (schedule == SCHEDULE_DYNAMIC && chunk > 0) {
+            OMP_LOOP("omp for schedule(dynamic, chunk)")
+        } else if (schedule == SCHEDULE_DYNAMIC) {
+            OMP_LOOP("omp for schedule(dynamic)")
+        } else if (schedule == SCHEDULE_GUIDED && chunk > 0) {
+            OMP_LOOP("omp for schedule(guided, chunk)")
+        } else if (schedule == SCHEDULE_GUIDED) {
+            OMP_LOOP("omp for schedule(guided)")
+        } else if (chunk > 0) {
+            OMP_LOOP("omp for schedule(static, chunk)")
+        } else {
+            OMP_LOOP("omp for schedule(static)")
+        }
+    }
+#else
+    static pthread_mutex_t create_lock = PTHREAD_MUTEX_INITIALIZER;
+    int n_threads = config == NULL ? 1 : thread_count(config);
+
+    if (n_threads > 1 && !in_loop) {
+        pthread_mutex_lock(&create_lock);
+        if (config->pool == NULL) {
+            config->pool = create_pool(n_threads - 1);
+        }
+        pthread_mutex_unlock(&create_lock);
+    }
+
+    ThreadPool *pool = config == NULL ? NULL : config->pool;
+    if (n_threads == 1 || n == 1 || in_loop || pool == NULL || pool->n_workers == 0) {
+        for (size_t i = 0; i < n; i++) {
+            body(ctx, i, 0);
+        }
+        return;
+    }
+
+    pthread_mutex_lock(&pool->job_lock);
+    pthread_mutex_lock(&pool->lock);
+    pool->config = config;
+    pool->body = body;
+    pool->ctx = ctx;
+    pool->n = n;
+    pool->next = 0;
+    pool->pending = pool->n_workers;
+    pool->generation++;
+    pthread_cond_broadcast(&pool->start);
+    pthread_mutex_unlock(&pool->lock);
+
+    in_loop = 1;
+    run_share(pool, 0);
+    in_loop = 0;
+
+    pthread_mutex_lock(&pool->lock);
+    while (pool->pending > 0) {
+        pthread_cond_wait(&pool->finish, &pool->lock);
+    }
+    pthread_mutex_unlock(&pool->lock);
+    pthread_mutex_unlock(&pool->job_lock);
+#endif
+}
@@ -0,0 +1,36 @@
+#ifndef THREADS_H
+#define THREADS_H
+
+#include <stddef.h>
+
+#define SCHEDULE_STATIC 0
+#define SCHEDULE_DYNAMIC 1
+#define SCHEDULE_GUIDED 2
+
+/* Body of a parallel loop, called once per index i by the worker with the
+ * given thread number, which is below the thread count of the config */
+typedef void (*LoopBody)(void *ctx, size_t i, int thread);
+
+/* How the parallel loops over one env are run: n_threads workers (0 for one
+ * per CPU), the loop schedule with its chunk size (0 for the default) and
+ * optionally the n_cpus CPUs the workers are pinned to, round robin. Built
+ * with OpenMP the loops run on OpenMP threads, otherwise on a persistent
+ * pthread pool owned by the config. Pinning is only supported on Linux. */
+struct ThreadConfig {
+    int n_threads;
+    int schedule;
+    int chunk;
+    int *cpus;
+    int n_cpus;
+    unsigned version;
+    struct ThreadPool *pool;
+};
+typedef struct ThreadConfig ThreadConfig;
+
+ThreadConfig *create_thread_config(int n_threads);
+void free_thread_config(ThreadConfig *config);
+int configure_threads(ThreadConfig *config, int n_threads, int schedule, int chunk, int *cpus, int n_cpus);
+int thread_count(ThreadConfig *config);
+void parallel_for(ThreadConfig *config, size_t n, LoopBody body, void *ctx);
+
+#endif /* THREADS_H */
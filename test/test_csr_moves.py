@@ -0,0 +1,60 @@
+import inspect
+
+import numpy as np
+
+from fastchessenv import CBoard, CChessEnv, CMove, RandomChessEnv, SFCChessEnv
+
+
+def test_legal_moves_csr_matches_mask():
+    env = CChessEnv(5, min_random=0, max_random=12, seed=7)
+    env.reset()
+
+    offsets, ids = env.get_legal_moves()
+    mask = env.get_mask()
+
+    assert offsets.shape == (6,)
+    assert offsets[0] == 0
+    assert len(ids) == offsets[-1]
+    for i in range(5):
+        row = ids[offsets[i] : offsets[i + 1]]
+        assert set(row) == set(np.flatnonzero(mask[i]))
+
+
+def test_legal_moves_csr_in_step():
+    env = CChessEnv(4, csr_moves=True, seed=1)
+    state, mask = env.reset()
+    assert env.legal_offsets[-1] == 4 * 20
+
+    for _ in range(10):
+        moves = np.int32(
+            [env.legal_ids[env.legal_offsets[i]] for i in range(env.n)]
+        )
+        state, mask, reward, done = env.step(moves)
+
+        for i in range(env.n):
+            row = env.legal_ids[env.legal_offsets[i] : env.legal_offsets[i + 1]]
+            board = CBoard.from_array(state[i]).to_board()
+            assert set(row) == {
+                CMove.from_move(m).to_int() for m in board.legal_moves
+            }
+
+
+def test_get_possible_moves_uses_csr():
+    env = CChessEnv(2)
+    env.reset()
+
+    moves = env.get_possible_moves()
+
+    assert len(moves) == 2
+    assert len(moves[0].to_str()) == 20
+
+
+def test_subclasses_accept_csr_moves():
+    env = RandomChessEnv(3, csr_moves=True, seed=2)
+    _, mask = env.reset()
+    state, mask, _, _ = env.step(np.int32([np.flatnonzero(m)[0] for m in mask]))
+    for i in range(env.n):
+        row = env.legal_ids[env.legal_offsets[i] : env.legal_offsets[i + 1]]
+        assert set(row) == set(np.flatnonzero(mask[i]))
+
+    assert "csr_moves" in inspect.signature(SFCChessEnv).parameters
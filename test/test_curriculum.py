@@ -0,0 +1,78 @@
+import chess
+import numpy as np
+import pytest
+
+from fastchessenv import CBoards, CChessEnv, CMove
+from fastchessenv_c.lib import CURRICULUM_HORIZON
+
+FENS = [
+    "6k1/5ppp/8/8/8/8/8/R5K1 w - - 0 1",
+    "r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3",
+]
+
+
+def _bank():
+    return CBoards.from_fen(FENS).to_array().reshape(-1, 69)
+
+
+def test_curriculum_tracks_outcomes():
+    bank = _bank()
+    env = CChessEnv(8, reset_positions=bank, curriculum=1.0, seed=0)
+    state, mask = env.reset()
+
+    priority, outcome, length = env.get_curriculum()
+    assert np.allclose(priority, priority[0])
+    assert (outcome == 0).all()
+
+    mate = CMove.from_move(chess.Move.from_uci("a1a8")).to_int()
+    on_mate = (state == bank[0]).all(axis=1)
+    assert on_mate.any()
+    moves = np.int32(
+        [mate if m else np.flatnonzero(row)[0] for m, row in zip(on_mate, mask)]
+    )
+    _, _, reward, done = env.step(moves)
+    assert (reward[on_mate] == 1).all()
+    assert done[on_mate].all()
+
+    priority, outcome, length = env.get_curriculum()
+    assert outcome[0] == 1
+    assert length[0] >= 1
+    assert outcome[1] == 0
+    # Reliably won positions are drawn less often
+    assert priority[0] < priority[1]
+
+
+def test_curriculum_prefers_short_episodes():
+    # Mates end after one step, the opening runs until max_step. With a rate
+    # of 1 both have no variance, only their lengths set them apart.
+    bank = _bank()
+    env = CChessEnv(8, reset_positions=bank, curriculum=1.0, max_step=6, seed=1)
+    state, mask = env.reset()
+    initial, _, _ = env.get_curriculum()
+
+    mate = CMove.from_move(chess.Move.from_uci("a1a8")).to_int()
+    for _ in range(12):
+        on_mate = (state == bank[0]).all(axis=1) & (env.t == 0)
+        moves = np.int32(
+            [mate if m else np.flatnonzero(row)[0] for m, row in zip(on_mate, mask)]
+        )
+        state, mask, _, _ = env.step(moves)
+
+    priority, outcome, length = env.get_curriculum()
+    assert 0 < length[0] < length[1]
+    assert priority[0] > priority[1]
+    assert priority[0] / priority[1] == pytest.approx(
+        (CURRICULUM_HORIZON + length[1]) / (CURRICULUM_HORIZON + length[0]), rel=1e-5
+    )
+    # Settled positions, drawn ones included, rank below unplayed ones
+    assert (priority < initial).all()
+
+
+def test_curriculum_config():
+    bank = _bank()
+    with pytest.raises(ValueError):
+        CChessEnv(2, curriculum=0.1)
+    with pytest.raises(ValueError):
+        CChessEnv(2, reset_positions=bank, curriculum=2.0)
+    with pytest.raises(RuntimeError):
+        CChessEnv(2, reset_positions=bank).get_curriculum()
@@ -0,0 +1,73 @@
+import numpy as np
+
+from fastchessenv import CChessEnv, CMove
+from fastchessenv_c.lib import (
+    END_CHECKMATE,
+    END_MATERIAL,
+    END_NONE,
+    END_REPETITION,
+    END_STALEMATE,
+    END_TRUNCATED,
+    OPPONENT_NONE,
+)
+
+# Knights out and back twice, the start position occurs a third time
+SHUFFLE = ["g1f3", "g8f6", "f3g1", "f6g8"] * 2
+
+
+class _SelfPlayEnv(CChessEnv):
+    opponent = OPPONENT_NONE
+
+
+def _moves(env, move_str):
+    return np.full(env.n, CMove.from_str(move_str).to_int(), dtype=np.int32)
+
+
+def test_threefold_repetition_ends_step():
+    env = _SelfPlayEnv(2, draw_reward=-0.25)
+    env.reset()
+
+    for move in SHUFFLE[:-1]:
+        _, _, reward, done = env.step(_moves(env, move))
+        assert not done.any()
+        assert (env.reason == END_NONE).all()
+
+    _, _, reward, done = env.step(_moves(env, SHUFFLE[-1]))
+    assert done.all()
+    assert (env.terminated == 1).all()
+    assert (env.reason == END_REPETITION).all()
+    assert (reward == -0.25).all()
+    assert (env.t == 0).all()
+
+
+def test_threefold_repetition_ends_push_moves():
+    env = CChessEnv(2)
+    env.reset()
+
+    for move in SHUFFLE[:-1]:
+        done, reward = env.push_moves(_moves(env, move))
+        assert not done.any()
+
+    done, reward = env.push_moves(_moves(env, SHUFFLE[-1]))
+    assert done.all()
+    assert (reward == 0).all()
+
+
+def test_reason_codes_are_consistent():
+    env = CChessEnv(16, max_step=60, draw_reward=-0.5, seed=0)
+    _, mask = env.reset()
+
+    seen = set()
+    for _ in range(200):
+        moves = np.int32([np.random.choice(np.flatnonzero(m)) for m in mask])
+        _, mask, reward, done = env.step(moves)
+
+        seen.update(np.unique(env.reason).tolist())
+        assert ((env.reason != END_NONE) == done).all()
+        assert ((env.reason == END_TRUNCATED) == (env.truncated == 1)).all()
+
+        draws = (env.reason >= END_STALEMATE) & (env.reason <= END_MATERIAL)
+        assert (reward[draws] == -0.5).all()
+        assert (np.abs(reward[env.reason == END_CHECKMATE]) == 1).all()
+
+    assert END_TRUNCATED in seen
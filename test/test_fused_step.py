@@ -0,0 +1,53 @@
+import numpy as np
+
+from fastchessenv import CBoard, CChessEnv, CMove
+
+
+def _legal_random_moves(mask):
+    moves = np.zeros(mask.shape[0], dtype=np.int32)
+    for i, m in enumerate(mask):
+        moves[i] = np.random.choice(np.flatnonzero(m))
+    return moves
+
+
+def test_fused_step_shapes():
+    env = CChessEnv(8)
+    states, masks = env.reset()
+
+    states, masks, reward, done = env.step(_legal_random_moves(masks))
+
+    assert states.shape == (8, 69)
+    assert masks.shape == (8, 88 * 64)
+    assert reward.shape == (8,)
+    assert reward.dtype == np.float32
+    assert done.shape == (8,)
+    assert env.terminated.shape == (8,)
+    assert env.truncated.shape == (8,)
+
+
+def test_fused_step_mask_matches_state():
+    env = CChessEnv(4)
+    states, masks = env.reset()
+
+    for _ in range(20):
+        states, masks, reward, done = env.step(_legal_random_moves(masks))
+
+        for state, mask in zip(states, masks):
+            board = CBoard.from_array(state).to_board()
+            assert np.sum(mask) == len(list(board.legal_moves))
+            for move in board.legal_moves:
+                assert mask[CMove.from_move(move).to_int()] == 1
+
+
+def test_fused_step_counters_and_truncation():
+    env = CChessEnv(4, max_step=6, draw_reward=-0.5)
+    states, masks = env.reset()
+
+    for _ in range(50):
+        states, masks, reward, done = env.step(_legal_random_moves(masks))
+
+        assert ((env.terminated & env.truncated) == 0).all()
+        assert (reward[env.truncated == 1] == -0.5).all()
+        assert (env.t[done] == 0).all()
+        assert (env.t <= 6).all()
+        assert set(np.unique(reward[env.terminated == 1])) <= {-1.0, -0.5, 1.0}
@@ -0,0 +1,61 @@
+import numpy as np
+
+from fastchessenv import CBoard, CChessEnv, CMove
+
+# Knights out and back, returns to the start position every 4 plies. Stops
+# before the third occurrence, which ends the game by repetition
+SHUFFLE = (["g1f3", "g8f6", "f3g1", "f6g8"] * 2)[:-1]
+
+
+def _push(env, move_str):
+    move = CMove.from_str(move_str).to_int()
+    env.push_moves(np.full(env.n, move, dtype=np.int32))
+
+
+def test_repetitions_count_earlier_positions():
+    env = CChessEnv(2)
+    env.reset()
+    assert (env.get_repetitions() == 0).all()
+
+    counts = []
+    for move in SHUFFLE:
+        _push(env, move)
+        counts.append(env.get_repetitions()[0])
+
+    assert counts == [0, 0, 0, 1, 1, 1, 1]
+
+
+def test_history_is_stacked_oldest_first():
+    env = CChessEnv(2, history=3)
+    state, _ = env.reset()
+
+    history = env.history
+    assert history.shape == (2, 3, 69)
+    assert (history[:, :2] == 0).all()
+    assert (history[:, 2] == state).all()
+
+    _push(env, "e2e4")
+    _push(env, "e7e5")
+    _push(env, "g1f3")
+
+    history = env.get_history()
+    fens = [CBoard.from_array(h).to_fen().split(" ")[0] for h in history[0]]
+    assert fens == [
+        "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR",
+        "rnbqkbnr/pppp1ppp/8/4p3/4P3/8/PPPP1PPP/RNBQKBNR",
+        "rnbqkbnr/pppp1ppp/8/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R",
+    ]
+    assert (history[:, -1] == env.get_state()).all()
+
+
+def test_step_history_restarts_on_reset():
+    env = CChessEnv(4, history=4, max_step=4)
+    _, mask = env.reset()
+
+    for _ in range(12):
+        moves = np.int32([np.flatnonzero(m)[0] for m in mask])
+        state, mask, _, done = env.step(moves)
+
+        assert (env.history[:, -1] == state).all()
+        # A reset board only knows its new start position
+        assert (env.history[done, :-1] == 0).all()
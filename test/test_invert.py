@@ -1,26 +1,43 @@
+import chess
 import numpy as np
-from cffi import FFI
 
-from chessenv.rep import CBoard
-from chessenv_c.lib import invert_array
+from fastchessenv import CBoard, CBoards, CChessEnv, invert_boards
 
-_ffi = FFI()
+FENS = [
+    chess.STARTING_FEN,
+    "r3k2r/pppq1ppp/2n2n2/3pp3/4P3/2N2N2/PPPQ1PPP/R3K2R w Kq - 0 1",
+    "rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3",
+    "8/8/4k3/8/2pP4/8/4K3/8 b - d3 0 1",
+]
 
 
-def _invert_array(board_arr):
-    board_arr = np.int32(board_arr)
-    invert_array(
-        _ffi.cast("int *", board_arr.ctypes.data),
-    )
-    return board_arr
+def _position(fen):
+    # Compare piece placement, turn, castling and ep only
+    return " ".join(fen.split(" ")[:4])
 
 
-def test_invert():
-    fen = "Q1b1kbn1/2Pp1p2/2n1p3/p6p/7p/2q4P/1rP1PPP1/RNBK1BNR w KQkq a6"
-    board = CBoard.from_fen(fen)
-    print(fen)
-    print(CBoard.from_array(_invert_array(board.to_array())).to_fen())
+def test_invert_boards_matches_mirror():
+    boards = CBoards.from_fen(FENS).to_array().reshape(-1, 69)
+    inverted = invert_boards(boards)
 
+    for fen, arr in zip(FENS, inverted):
+        expected = chess.Board(fen).mirror().fen()
+        assert _position(CBoard.from_array(arr).to_fen()) == _position(expected)
 
-if __name__ == "__main__":
-    test_invert()
+
+def test_invert_boards_twice_is_identity():
+    boards = CBoards.from_fen(FENS).to_array().reshape(-1, 69)
+    assert (invert_boards(invert_boards(boards)) == boards).all()
+
+
+def test_env_invert_matches_array_invert():
+    env = CChessEnv(8, min_random=1, max_random=11)
+    env.reset()
+    before = env.get_state().copy()
+
+    env.invert_boards()
+
+    assert (env.get_state() == invert_boards(before)).all()
+    for state, mask in zip(env.get_state(), env.get_mask()):
+        board = CBoard.from_array(state).to_board()
+        assert mask.sum() == len(list(board.legal_moves))
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from fastchessenv import CChessEnv
+
+
+def test_env_larger_than_1024():
+    env = CChessEnv(5000)
+    states, masks = env.reset()
+
+    assert states.shape == (5000, 69)
+    assert masks.shape == (5000, 88 * 64)
+    assert (masks.sum(axis=1) == 20).all()
+
+    moves = np.int32([np.flatnonzero(m)[0] for m in masks])
+    states, masks, reward, done = env.step(moves)
+
+    assert (env.t == 2).all()
+    assert (masks.sum(axis=1) > 0).all()
+
+
+def test_many_small_envs():
+    envs = [CChessEnv(2) for _ in range(64)]
+    for env in envs:
+        states, masks = env.reset()
+        assert states.shape == (2, 69)
+    del envs
+
+
+def test_reset_past_capacity_raises():
+    env = CChessEnv(2)
+    env.reset()
+    env.n = 4
+
+    with pytest.raises(ValueError):
+        env.reset()
+    with pytest.raises(ValueError):
+        env.invert_boards()
@@ -0,0 +1,48 @@
+import numpy as np
+
+from fastchessenv import CBoard, CChessEnv, CMove
+
+
+def _first_legal_moves(mask):
+    return np.int32([np.flatnonzero(m)[0] for m in mask])
+
+
+def _assert_mask_matches(states, masks):
+    for state, mask in zip(states, masks):
+        board = CBoard.from_array(state).to_board()
+        assert np.sum(mask) == len(list(board.legal_moves))
+        for move in board.legal_moves:
+            assert mask[CMove.from_move(move).to_int()] == 1
+
+
+def test_cached_mask_matches_step_mask():
+    env = CChessEnv(4, min_random=1, max_random=5)
+    _, mask = env.reset()
+
+    for _ in range(10):
+        states, mask, _, _ = env.step(_first_legal_moves(mask))
+        mask = mask.copy()
+        assert (env.get_mask() == mask).all()
+        _assert_mask_matches(env.get_state(), mask)
+
+
+def test_cache_invalidated_by_invert():
+    env = CChessEnv(3)
+    _, mask = env.reset()
+    env.step(_first_legal_moves(mask))
+
+    env.invert_boards()
+    _assert_mask_matches(env.get_state(), env.get_mask())
+
+
+def test_cache_invalidated_by_reset_boards():
+    env = CChessEnv(3)
+    _, mask = env.reset()
+    env.step(_first_legal_moves(mask))
+
+    env.reset_boards(np.int32([1, 0, 1]))
+    states = env.get_state()
+    masks = env.get_mask()
+    _assert_mask_matches(states, masks)
+    assert masks[0].sum() == 20
+    assert masks[2].sum() == 20
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from fastchessenv import CChessEnv, CMove
+from fastchessenv_c.lib import MOVE_STACK_DEPTH
+
+
+def _first_legal_moves(mask):
+    return np.int32([np.flatnonzero(m)[0] for m in mask])
+
+
+def test_push_pop_restores_boards():
+    env = CChessEnv(4, min_random=2, max_random=10, history=3)
+    env.reset()
+    state = env.get_state().copy()
+    mask = env.get_mask().copy()
+    history = env.get_history().copy()
+    repetitions = env.get_repetitions().copy()
+
+    for _ in range(5):
+        env.push(_first_legal_moves(env.get_mask()))
+    assert (env.stack_depth == 5).all()
+    assert not (env.get_state() == state).all()
+    assert (env.get_history()[:, -1] == env.get_state()).all()
+
+    env.pop(5)
+    assert (env.stack_depth == 0).all()
+    assert (env.get_state() == state).all()
+    assert (env.get_mask() == mask).all()
+    assert (env.get_history() == history).all()
+    assert (env.get_repetitions() == repetitions).all()
+
+
+def test_push_skips_negative_moves():
+    env = CChessEnv(3)
+    env.reset()
+    state = env.get_state().copy()
+
+    moves = _first_legal_moves(env.get_mask())
+    moves[1] = -1
+    env.push(moves)
+
+    assert list(env.stack_depth) == [1, 0, 1]
+    assert (env.get_state()[1] == state[1]).all()
+
+    # Popping more than was pushed stops at the original position
+    env.pop(3)
+    assert (env.get_state() == state).all()
+
+
+def test_step_commits_pushed_moves():
+    env = CChessEnv(2)
+    _, mask = env.reset()
+
+    env.push(_first_legal_moves(mask))
+    env.step(_first_legal_moves(env.get_mask()))
+    assert (env.stack_depth == 0).all()
+
+
+def test_push_depth_limit():
+    env = CChessEnv(1)
+    env.reset()
+
+    # Knights out and back, always legal
+    shuffle = [CMove.from_str(m).to_int() for m in ["g1f3", "g8f6", "f3g1", "f6g8"]]
+    for i in range(MOVE_STACK_DEPTH):
+        env.push(np.int32([shuffle[i % 4]]))
+    assert env.stack_depth[0] == MOVE_STACK_DEPTH
+
+    with pytest.raises(RuntimeError):
+        env.push(np.int32([shuffle[0]]))
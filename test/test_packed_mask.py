@@ -0,0 +1,42 @@
+import numpy as np
+
+from fastchessenv import CChessEnv, unpack_mask
+
+
+def test_packed_mask_matches_dense():
+    env = CChessEnv(6, seed=3, min_random=0, max_random=10)
+    env.reset()
+
+    dense = env.get_mask(packed=False)
+    packed = env.get_mask(packed=True)
+
+    assert packed.shape == (6, 704)
+    assert packed.dtype == np.uint8
+    assert (np.packbits(dense.astype(np.uint8), axis=-1) == packed).all()
+    assert (unpack_mask(packed) == (dense == 1)).all()
+
+
+def test_packed_mask_step():
+    env = CChessEnv(4, packed_mask=True, seed=0)
+    state, packed = env.reset()
+    assert packed.shape == (4, 704)
+
+    for _ in range(10):
+        mask = unpack_mask(packed)
+        moves = np.int32([np.flatnonzero(m)[0] for m in mask])
+        state, packed, reward, done = env.step(moves)
+
+        assert packed.shape == (4, 704)
+        assert (unpack_mask(packed) == (env.get_mask(packed=False) == 1)).all()
+
+
+def test_unpack_mask_dtype():
+    packed = np.zeros((2, 704), dtype=np.uint8)
+    packed[0, 0] = 0x80
+
+    mask = unpack_mask(packed, dtype=np.float32)
+
+    assert mask.shape == (2, 88 * 64)
+    assert mask.dtype == np.float32
+    assert mask[0, 0] == 1.0
+    assert mask.sum() == 1.0
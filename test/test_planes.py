@@ -0,0 +1,54 @@
+import chess
+import numpy as np
+import pytest
+
+from fastchessenv import CBoard, CChessEnv
+
+
+def _first_legal_moves(mask):
+    return np.int32([np.flatnonzero(m)[0] for m in mask])
+
+
+def _expected_planes(state):
+    board = CBoard.from_array(state).to_board()
+    planes = np.zeros((19, 8, 8), dtype=np.uint8)
+    for square, piece in board.piece_map().items():
+        plane = piece.piece_type - 1 + (0 if piece.color == chess.WHITE else 6)
+        planes[plane, 7 - chess.square_rank(square), chess.square_file(square)] = 1
+    planes[12] = board.turn == chess.WHITE
+    planes[13] = board.has_kingside_castling_rights(chess.WHITE)
+    planes[14] = board.has_queenside_castling_rights(chess.WHITE)
+    planes[15] = board.has_kingside_castling_rights(chess.BLACK)
+    planes[16] = board.has_queenside_castling_rights(chess.BLACK)
+    ep = np.flatnonzero(state[:64] == 13)
+    if len(ep):
+        planes[17].flat[ep[0]] = 1
+    planes[18] = 1
+    return planes
+
+
+def test_get_planes_start_position():
+    env = CChessEnv(2)
+    state, _ = env.reset()
+    planes = env.get_planes()
+
+    assert planes.shape == (2, 19, 8, 8)
+    assert planes.dtype == np.uint8
+    for s, p in zip(state, planes):
+        assert (p == _expected_planes(s)).all()
+
+
+def test_step_planes_match_state():
+    env = CChessEnv(4, planes=np.float32, min_random=2, max_random=8)
+    _, mask = env.reset()
+
+    for _ in range(10):
+        state, mask, _, _ = env.step(_first_legal_moves(mask))
+        assert env.planes.dtype == np.float32
+        for s, p in zip(state, env.planes):
+            assert (p == _expected_planes(s)).all()
+
+
+def test_planes_bad_dtype():
+    with pytest.raises(ValueError):
+        CChessEnv(2, planes=np.int64)
@@ -0,0 +1,65 @@
+import chess
+import numpy as np
+import pytest
+
+from fastchessenv import CBoards, CChessEnv
+
+FENS = [
+    "r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3",
+    "rnbqkb1r/pppppppp/5n2/8/3P4/8/PPP1PPPP/RNBQKBNR w KQkq - 1 2",
+    "4k3/8/8/8/8/8/4P3/4K2R w K - 0 1",
+]
+
+
+def _bank():
+    return CBoards.from_fen(FENS).to_array().reshape(-1, 69)
+
+
+def _rows(states):
+    return {tuple(s) for s in states}
+
+
+def test_reset_samples_from_bank():
+    bank = _bank()
+    env = CChessEnv(32, reset_positions=bank, seed=0)
+    state, _ = env.reset()
+
+    assert _rows(state) <= _rows(bank)
+    assert len(_rows(state)) > 1
+
+
+def test_reset_weights():
+    bank = _bank()
+    env = CChessEnv(16, reset_positions=bank, reset_weights=[0, 0, 1])
+    state, _ = env.reset()
+    assert (state == bank[2]).all()
+
+    with pytest.raises(ValueError):
+        CChessEnv(2, reset_positions=bank, reset_weights=[1, 1])
+
+
+def test_reset_positions_memmap_file(tmp_path):
+    bank = _bank()
+    path = tmp_path / "bank.bin"
+    bank.tofile(path)
+
+    env = CChessEnv(8, reset_positions=str(path), max_step=2)
+    state, mask = env.reset()
+    assert _rows(state) <= _rows(bank)
+
+    # Boards reset after truncation come from the bank too
+    for _ in range(6):
+        moves = np.int32([np.flatnonzero(m)[0] for m in mask])
+        state, mask, _, done = env.step(moves)
+        assert _rows(state[done]) <= _rows(bank)
+
+
+def test_reset_positions_invert():
+    board = chess.Board()
+    board.push_uci("e2e4")
+    bank = CBoards.from_fen([board.fen()]).to_array().reshape(-1, 69)
+    assert bank[0, 64] == 15
+
+    env = CChessEnv(2, reset_positions=bank, invert=True)
+    state, _ = env.reset()
+    assert (state[:, 64] == 14).all()
@@ -0,0 +1,46 @@
+import chess
+import numpy as np
+import pytest
+
+from fastchessenv import CBoards, rollout
+
+FENS = [
+    chess.STARTING_FEN,
+    # White to move is checkmated
+    "rnb1kbnr/pppp1ppp/8/4p3/6Pq/5P2/PPPPP2P/RNBQKBNR w KQkq - 1 3",
+    # Bare kings
+    "4k3/8/8/8/8/8/8/4K3 w - - 0 1",
+]
+
+
+def _boards():
+    return CBoards.from_fen(FENS).to_array().reshape(-1, 69)
+
+
+def test_rollout_counts():
+    wins, draws, losses, mean_length = rollout(_boards(), 50, max_plies=100, seed=1)
+
+    assert (wins + draws + losses == 50).all()
+    assert (mean_length <= 100).all()
+
+    # Terminal positions end immediately
+    assert losses[1] == 50 and mean_length[1] == 0
+    assert draws[2] == 50 and mean_length[2] == 0
+
+
+def test_rollout_seeded():
+    a = rollout(_boards()[:1], 20, seed=7)
+    b = rollout(_boards()[:1], 20, seed=7)
+    for x, y in zip(a, b):
+        assert (x == y).all()
+
+
+def test_rollout_empty():
+    wins, draws, losses, mean_length = rollout(_boards(), 0)
+    assert not (wins.any() or draws.any() or losses.any() or mean_length.any())
+
+    wins, *_ = rollout(np.zeros((0, 69), dtype=np.int32), 10)
+    assert wins.shape == (0,)
+
+    with pytest.raises(ValueError):
+        rollout(_boards(), -1)
@@ -0,0 +1,51 @@
+import numpy as np
+
+from fastchessenv import CChessEnv, RandomChessEnv
+
+
+def _rollout(env, steps=20):
+    states, masks = env.reset()
+    history = [np.array(states)]
+    for _ in range(steps):
+        moves = np.int32([np.flatnonzero(m)[0] for m in masks])
+        states, masks, _, _ = env.step(moves)
+        history.append(np.array(states))
+    return np.stack(history)
+
+
+def test_same_seed_replays():
+    a = _rollout(CChessEnv(8, min_random=2, max_random=6, seed=1234))
+    b = _rollout(CChessEnv(8, min_random=2, max_random=6, seed=1234))
+    assert (a == b).all()
+
+
+def test_different_seeds_differ():
+    a = _rollout(RandomChessEnv(8, seed=1))
+    b = _rollout(RandomChessEnv(8, seed=2))
+    assert not (a == b).all()
+
+
+def test_reseed():
+    env = CChessEnv(4, seed=0)
+    env.reset()
+    first = np.array(env.random())
+
+    env.reseed(np.arange(4), np.zeros(4, dtype=np.uint64))
+    second = np.array(env.random())
+
+    env.reseed(np.arange(4), np.zeros(4, dtype=np.uint64))
+    third = np.array(env.random())
+
+    assert (second == third).all()
+    assert first.shape == second.shape
+
+
+def test_seed_first_index():
+    whole = CChessEnv(6, seed=5)
+    whole.reset()
+    moves = np.array(whole.random())
+
+    part = CChessEnv(2, seed=5)
+    part.reset()
+    part.seed(5, first_index=3)
+    assert (np.array(part.random()) == moves[3:5]).all()
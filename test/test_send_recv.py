@@ -0,0 +1,97 @@
+import shutil
+
+import numpy as np
+import pytest
+
+from fastchessenv import CBoard, CChessEnv, SFCChessEnv
+from fastchessenv_c.lib import END_TRUNCATED
+
+
+def _first_legal_moves(mask):
+    return np.int32([np.flatnonzero(m)[0] for m in mask])
+
+
+def test_send_recv_all():
+    env = CChessEnv(8, seed=2, pool_threads=4)
+    _, mask = env.reset()
+
+    env.send(_first_legal_moves(mask))
+    env_ids, state, mask, reward, done = env.recv(min_batch=8)
+
+    assert sorted(env_ids) == list(range(8))
+    assert state.shape == (8, 69)
+    assert mask.shape == (8, 88 * 64)
+    assert reward.shape == done.shape == (8,)
+    for s, m in zip(state, mask):
+        board = CBoard.from_array(s).to_board()
+        assert np.sum(m) == len(list(board.legal_moves))
+
+
+def test_send_recv_partial_batches():
+    env = CChessEnv(6, seed=3, pool_threads=2)
+    _, mask = env.reset()
+    masks = np.array(mask)
+
+    env.send(_first_legal_moves(masks[:4]), env_ids=[0, 1, 2, 3])
+    received = []
+    for _ in range(2):
+        env_ids, state, mask, reward, done = env.recv(min_batch=2)
+        assert len(env_ids) == 2
+        received.extend(env_ids)
+        masks[env_ids] = mask
+
+    assert sorted(received) == [0, 1, 2, 3]
+
+    env.send(_first_legal_moves(masks[[0, 5]]), env_ids=[0, 5])
+    env_ids, *_ = env.recv(min_batch=2)
+    assert sorted(env_ids) == [0, 5]
+
+
+def test_recv_sets_end_flags():
+    env = CChessEnv(4, max_step=1, seed=5, pool_threads=2)
+    _, mask = env.reset()
+
+    env.send(_first_legal_moves(mask[:2]), env_ids=[2, 3])
+    env_ids, state, mask, reward, done = env.recv(min_batch=2)
+
+    assert env.terminated.shape == env.truncated.shape == env.reason.shape == (2,)
+    assert done.all()
+    assert env.truncated.all()
+    assert not env.terminated.any()
+    assert (env.reason == END_TRUNCATED).all()
+
+
+def test_send_errors():
+    env = CChessEnv(4, pool_threads=1)
+    _, mask = env.reset()
+    moves = _first_legal_moves(mask)
+
+    env.send(moves[:2], env_ids=[0, 1])
+    with pytest.raises(ValueError):
+        env.send(moves[:1], env_ids=[1])
+    with pytest.raises(RuntimeError):
+        env.step(moves)
+    with pytest.raises(RuntimeError):
+        env.get_state()
+    with pytest.raises(RuntimeError):
+        env.get_mask()
+    with pytest.raises(ValueError):
+        env.recv(min_batch=3)
+
+    env.recv(min_batch=2)
+
+
+@pytest.mark.skipif(shutil.which("stockfish") is None, reason="needs stockfish")
+def test_more_boards_than_stockfish_instances():
+    # 256 instances at most, boards 0..3 share theirs with boards 256..259
+    env = SFCChessEnv(260, depth=1, seed=0, pool_threads=260)
+    assert env._sfa.N < env.n
+    _, mask = env.reset()
+
+    env.send(_first_legal_moves(mask))
+    env_ids, state, mask, reward, done = env.recv(min_batch=260)
+    assert sorted(env_ids) == list(range(260))
+    for i in np.flatnonzero(~done):
+        board = CBoard.from_array(state[i]).to_board()
+        assert board.is_valid()
+        assert mask[i].sum() == board.legal_moves.count()
@@ -0,0 +1,82 @@
+import chess
+import numpy as np
+import pytest
+
+from fastchessenv import CBoard, CChessEnv, CMove
+
+VALUES = {chess.PAWN: 1, chess.KNIGHT: 3, chess.BISHOP: 3, chess.ROOK: 5, chess.QUEEN: 9}
+WEIGHTS = {"material": 1.0, "mobility": 0.5, "check": 0.25}
+
+
+def _material(board, color):
+    return sum(
+        value * (len(board.pieces(piece, color)) - len(board.pieces(piece, not color)))
+        for piece, value in VALUES.items()
+    )
+
+
+def _expected(before, move_int, after):
+    """Shaping terms of one step recomputed with python-chess"""
+    agent = before.turn
+    moved = before.copy()
+    moved.push(CMove.from_int(move_int).to_move())
+    replied = after.turn == agent
+
+    shaped = WEIGHTS["material"] * (_material(after, agent) - _material(before, agent))
+    if replied:
+        shaped += WEIGHTS["mobility"] * (
+            after.legal_moves.count() - before.legal_moves.count()
+        )
+    shaped += WEIGHTS["check"] * moved.is_check()
+    if replied:
+        shaped -= WEIGHTS["check"] * after.is_check()
+    return shaped
+
+
+def test_shaped_reward_matches_python_chess():
+    env = CChessEnv(8, seed=0, min_random=4, max_random=20, max_step=40, shaping=WEIGHTS)
+    rng = np.random.default_rng(0)
+    state, mask = env.reset()
+    for _ in range(30):
+        moves = np.int32([rng.choice(np.flatnonzero(m)) for m in mask])
+        before = state.copy()
+        state, mask, reward, done = env.step(moves)
+
+        for i in range(env.n):
+            after = env.final_state[i] if done[i] else state[i]
+            expected = _expected(
+                CBoard.from_array(before[i]).to_board(),
+                moves[i],
+                CBoard.from_array(after).to_board(),
+            )
+            assert env.shaped_reward[i] == pytest.approx(expected)
+
+
+def test_missing_terms_weigh_zero():
+    env = CChessEnv(8, seed=1, min_random=4, max_random=20, shaping={})
+    assert env.shaping == {"material": 0.0, "mobility": 0.0, "check": 0.0}
+    state, mask = env.reset()
+    for _ in range(10):
+        moves = np.int32([np.flatnonzero(m)[0] for m in mask])
+        state, mask, reward, done = env.step(moves)
+        assert not env.shaped_reward.any()
+
+
+def test_shaping_does_not_change_results():
+    reference = CChessEnv(8, seed=2, min_random=2, max_random=6)
+    env = CChessEnv(8, seed=2, min_random=2, max_random=6, shaping=WEIGHTS)
+    _, mask = reference.reset()
+    env.reset()
+    for _ in range(10):
+        moves = np.int32([np.flatnonzero(m)[-1] for m in mask])
+        state, mask, reward, done = reference.step(moves)
+        state2, _, reward2, done2 = env.step(moves)
+        assert (state == state2).all()
+        assert (reward == reward2).all()
+        assert (done == done2).all()
+
+
+def test_unknown_shaping_term():
+    with pytest.raises(ValueError):
+        CChessEnv(2, shaping={"center": 1.0})
+    assert CChessEnv(2).shaping is None
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from fastchessenv import CChessEnv, ShardedChessEnv
+
+
+def _first_legal_moves(mask):
+    return np.int32([np.flatnonzero(m)[0] for m in mask])
+
+
+def test_sharded_matches_single_env():
+    kwargs = dict(seed=7, min_random=1, max_random=6, max_step=8)
+    single = CChessEnv(6, **kwargs)
+    sharded = ShardedChessEnv(6, shards=3, **kwargs)
+    try:
+        state, mask = single.reset()
+        s_state, s_mask = sharded.reset()
+        assert (state == s_state).all()
+        assert (mask == s_mask).all()
+
+        for _ in range(6):
+            moves = _first_legal_moves(mask)
+            state, mask, reward, done = single.step(moves)
+            s_state, s_mask, s_reward, s_done = sharded.step(moves)
+            assert (state == s_state).all()
+            assert (mask == s_mask).all()
+            assert (reward == s_reward).all()
+            assert (done == s_done).all()
+            assert (single.truncated == sharded.truncated).all()
+            assert (single.reason == sharded.reason).all()
+    finally:
+        sharded.close()
+
+
+def test_sharded_packed_mask():
+    env = ShardedChessEnv(4, shards=2, packed_mask=True)
+    try:
+        _, mask = env.reset()
+        assert mask.shape == (4, 704)
+        assert mask.dtype == np.uint8
+    finally:
+        env.close()
+
+
+def test_sharded_worker_error():
+    with pytest.raises(RuntimeError):
+        ShardedChessEnv(4, shards=2, planes="int64")
+
+    env = ShardedChessEnv(2, shards=2)
+    env.close()
+    with pytest.raises(RuntimeError):
+        env.reset()
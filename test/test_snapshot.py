@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from fastchessenv import CChessEnv
+
+
+def _first_legal_moves(mask):
+    return np.int32([np.flatnonzero(m)[0] for m in mask])
+
+
+def _play(env, mask, steps):
+    results = []
+    for _ in range(steps):
+        state, mask, reward, done = env.step(_first_legal_moves(mask))
+        results.append((state.copy(), reward.copy(), done.copy()))
+    return results, mask
+
+
+def test_restore_replays_exactly():
+    env = CChessEnv(4, seed=3, history=2, max_step=20)
+    _, mask = env.reset()
+    _play(env, mask, 5)
+
+    buf = env.snapshot()
+    mask = env.get_mask()
+    t = env.t.copy()
+    first, _ = _play(env, mask, 10)
+
+    env.restore(buf)
+    assert (env.t == t).all()
+    second, _ = _play(env, env.get_mask(), 10)
+
+    for a, b in zip(first, second):
+        for x, y in zip(a, b):
+            assert (x == y).all()
+
+
+def test_snapshot_subset_and_restore_elsewhere():
+    env = CChessEnv(3, min_random=4, max_random=8)
+    env.reset()
+    state = env.get_state().copy()
+
+    buf = env.snapshot([2])
+    assert buf.dtype == np.uint8 and buf.shape[0] == 1
+
+    env.restore(buf, [0])
+    after = env.get_state()
+    assert (after[0] == state[2]).all()
+    assert (after[1:] == state[1:]).all()
+    assert (env.get_mask()[0] == env.get_mask()[2]).all()
+
+
+def test_clone():
+    env = CChessEnv(4, min_random=4, max_random=8)
+    env.reset()
+    state = env.get_state().copy()
+
+    env.clone([1], [3])
+    assert (env.get_state()[3] == state[1]).all()
+    assert env.get_repetitions()[3] == env.get_repetitions()[1]
+
+    with pytest.raises(ValueError):
+        env.clone([0, 1], [1, 2])
+
+
+def test_restore_wrong_size():
+    env = CChessEnv(2)
+    env.reset()
+    with pytest.raises(ValueError):
+        env.restore(env.snapshot([0]))
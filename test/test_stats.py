@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from fastchessenv import CChessEnv
+from fastchessenv.env import STAT_PHASES
+
+
+def _first_legal_moves(mask):
+    return np.int32([np.flatnonzero(m)[0] for m in mask])
+
+
+def _play(env, steps=10):
+    state, mask = env.reset()
+    for _ in range(steps):
+        state, mask, _, _ = env.step(_first_legal_moves(mask))
+
+
+def test_stats_count_steps():
+    env = CChessEnv(16, seed=0, min_random=2, max_random=6, max_step=4, stats=True)
+    _play(env, steps=10)
+    stats = env.stats()
+
+    assert stats["boards"] == 16 * 10
+    assert stats["make_move_calls"] == stats["boards"] + stats["opponent_calls"]
+    assert stats["movegen_calls"] == stats["make_move_calls"]
+    assert stats["encode_calls"] == stats["mask_calls"] == 16 * 10
+    assert stats["resets"] == stats["reset_calls"] > 0
+    assert stats["random_start_calls"] == stats["resets"]
+    assert stats["legal_moves"] > 0
+    for phase in STAT_PHASES:
+        assert stats[f"{phase}_ns"] >= 0
+
+    per_thread = stats["per_thread"]
+    assert len(per_thread) >= 1
+    assert per_thread["boards"].sum() == stats["boards"]
+    assert per_thread["calls"].sum(axis=0)[0] == stats["movegen_calls"]
+
+
+def test_stats_do_not_change_results():
+    reference = CChessEnv(8, seed=1, min_random=1, max_random=4)
+    env = CChessEnv(8, seed=1, min_random=1, max_random=4, stats=True)
+    state, mask = reference.reset()
+    env.reset()
+    for _ in range(6):
+        moves = _first_legal_moves(mask)
+        state, mask, reward, done = reference.step(moves)
+        state2, mask2, reward2, done2 = env.step(moves)
+        assert (state == state2).all()
+        assert (reward == reward2).all()
+
+
+def test_reset_stats():
+    env = CChessEnv(4, seed=0, stats=True)
+    _play(env, steps=3)
+    assert env.stats()["boards"] == 12
+    env.reset_stats()
+    stats = env.stats()
+    assert stats["boards"] == 0
+    assert not stats["per_thread"]["ns"].any()
+
+
+def test_stats_disabled():
+    env = CChessEnv(4)
+    with pytest.raises(RuntimeError):
+        env.stats()
+    with pytest.raises(RuntimeError):
+        env.reset_stats()
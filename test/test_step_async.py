@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from fastchessenv import CChessEnv
+
+
+def _first_legal_moves(mask):
+    return np.int32([np.flatnonzero(m)[0] for m in mask])
+
+
+def test_step_async_matches_step():
+    sync_env = CChessEnv(8, seed=5)
+    async_env = CChessEnv(8, seed=5)
+    _, sync_mask = sync_env.reset()
+    _, async_mask = async_env.reset()
+
+    for _ in range(10):
+        sync_results = sync_env.step(_first_legal_moves(sync_mask))
+
+        async_env.step_async(_first_legal_moves(async_mask))
+        async_results = async_env.step_wait()
+
+        for a, b in zip(sync_results, async_results):
+            assert (a == b).all()
+        sync_mask, async_mask = sync_results[1], async_results[1]
+
+
+def test_step_async_pending_errors():
+    env = CChessEnv(2)
+    _, mask = env.reset()
+
+    env.step_async(_first_legal_moves(mask))
+    with pytest.raises(RuntimeError):
+        env.step(_first_legal_moves(mask))
+    with pytest.raises(RuntimeError):
+        env.step_async(_first_legal_moves(mask))
+    for read in (env.get_state, env.get_mask, env.get_planes, env.get_possible_moves):
+        with pytest.raises(RuntimeError):
+            read()
+    env.step_wait()
+
+    with pytest.raises(RuntimeError):
+        env.step_wait()
@@ -0,0 +1,121 @@
+import numpy as np
+import pytest
+
+from fastchessenv import CChessEnv
+
+
+def _first_legal_moves(mask):
+    return np.int32([np.flatnonzero(m)[0] for m in mask])
+
+
+def test_step_buffers_are_reused():
+    env = CChessEnv(4)
+    _, mask = env.reset()
+
+    first = env.step(_first_legal_moves(mask))
+    second = env.step(_first_legal_moves(first[1]))
+    third = env.step(_first_legal_moves(second[1]))
+
+    # Double buffered: results alternate between two sets of arrays
+    for a, b in zip(first, third):
+        assert np.shares_memory(a, b)
+    for a, b in zip(first, second):
+        assert not np.shares_memory(a, b)
+
+
+def test_step_buffers_are_read_only():
+    env = CChessEnv(2)
+    state, mask = env.reset()
+
+    assert not state.flags.writeable
+    assert not mask.flags.writeable
+
+    state, mask, reward, done = env.step(_first_legal_moves(mask))
+    with pytest.raises(ValueError):
+        reward[0] = 1.0
+
+
+def test_step_out():
+    env = CChessEnv(3)
+    _, mask = env.reset()
+
+    out = (
+        np.zeros((3, 69), dtype=np.int32),
+        np.zeros((3, 88 * 64), dtype=np.int32),
+        np.zeros(3, dtype=np.float32),
+        np.zeros(3, dtype=bool),
+    )
+    results = env.step(_first_legal_moves(mask), out=out)
+
+    for a, b in zip(results, out):
+        assert a is b
+    assert (out[0].sum(axis=1) > 0).all()
+    assert (out[1].sum(axis=1) > 0).all()
+
+
+def test_step_out_does_not_allocate(monkeypatch):
+    import fastchessenv.env
+
+    env = CChessEnv(3, csr_moves=True, history=2)
+    out = (
+        np.zeros((3, 69), dtype=np.int32),
+        np.zeros((3, 88 * 64), dtype=np.int32),
+        np.zeros(3, dtype=np.float32),
+        np.zeros(3, dtype=bool),
+    )
+    env.reset(out=out[:2])
+    structs = [b.out for b in env._buffers]
+
+    def fail(*args, **kwargs):
+        raise AssertionError("step allocated a new buffer set")
+
+    monkeypatch.setattr(fastchessenv.env, "_StepBuffers", fail)
+    for _ in range(10):
+        results = env.step(_first_legal_moves(out[1]), out=out)
+        for a, b in zip(results, out):
+            assert a is b
+    assert [b.out for b in env._buffers] == structs
+
+    # Without out the env-owned arrays are used again
+    state, mask, _, _ = env.step(_first_legal_moves(out[1]))
+    assert not np.shares_memory(state, out[0])
+    assert (state == env.get_state()).all()
+
+
+def test_step_out_bad_dtype():
+    env = CChessEnv(2)
+    _, mask = env.reset()
+
+    out = (
+        np.zeros((2, 69), dtype=np.int64),
+        np.zeros((2, 88 * 64), dtype=np.int32),
+        np.zeros(2, dtype=np.float32),
+        np.zeros(2, dtype=bool),
+    )
+    with pytest.raises(ValueError):
+        env.step(_first_legal_moves(mask), out=out)
+
+
+def test_step_out_bad_shape():
+    env = CChessEnv(2)
+    _, mask = env.reset()
+
+    for state in (np.zeros(2 * 69, dtype=np.int32), np.zeros((69, 2), dtype=np.int32)):
+        out = (
+            state,
+            np.zeros((2, 88 * 64), dtype=np.int32),
+            np.zeros(2, dtype=np.float32),
+            np.zeros(2, dtype=bool),
+        )
+        with pytest.raises(ValueError):
+            env.step(_first_legal_moves(mask), out=out)
+
+
+def test_get_mask_out_is_cleared():
+    env = CChessEnv(2)
+    env.reset()
+
+    out = np.ones((2, 88 * 64), dtype=np.int32)
+    mask = env.get_mask(out=out)
+
+    assert mask.sum() == 40
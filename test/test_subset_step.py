@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from fastchessenv import CBoard, CChessEnv
+
+
+def _first_legal_moves(mask):
+    return np.int32([np.flatnonzero(m)[0] for m in mask])
+
+
+def test_subset_step_only_touches_listed_boards():
+    env = CChessEnv(6, csr_moves=True)
+    _, mask = env.reset()
+    before = env.get_state().copy()
+
+    env_ids = np.int32([4, 1])
+    state, sub_mask, reward, done = env.step(
+        _first_legal_moves(mask[env_ids]), env_ids=env_ids
+    )
+
+    assert state.shape == (2, 69)
+    assert sub_mask.shape == (2, 88 * 64)
+    assert reward.shape == done.shape == env.terminated.shape == (2,)
+    assert env.legal_offsets.shape == (3,)
+
+    after = env.get_state()
+    untouched = [0, 2, 3, 5]
+    assert (after[untouched] == before[untouched]).all()
+    assert (after[env_ids] == state).all()
+    assert (env.t[untouched] == 0).all()
+    assert (env.t[env_ids] == 2).all()
+
+
+def test_subset_mask_matches_full_mask():
+    env = CChessEnv(5, min_random=2, max_random=10, packed_mask=True)
+    env.reset()
+
+    env_ids = [3, 0, 2]
+    full = env.get_mask()
+    assert (env.get_mask(env_ids=env_ids) == full[env_ids]).all()
+
+    dense = env.get_mask(env_ids=env_ids, packed=False)
+    for ids, m in zip(env_ids, dense):
+        board = CBoard.from_array(env.get_state()[ids]).to_board()
+        assert m.sum() == len(list(board.legal_moves))
+
+
+def test_subset_step_rejects_duplicates():
+    env = CChessEnv(3)
+    _, mask = env.reset()
+
+    with pytest.raises(ValueError):
+        env.step(_first_legal_moves(mask[[0, 0]]), env_ids=[0, 0])
+    with pytest.raises(IndexError):
+        env.step(_first_legal_moves(mask[[0]]), env_ids=[3])
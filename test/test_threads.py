@@ -0,0 +1,54 @@
+import sys
+
+import numpy as np
+import pytest
+
+from fastchessenv import CChessEnv
+
+
+def _first_legal_moves(mask):
+    return np.int32([np.flatnonzero(m)[0] for m in mask])
+
+
+def _play(env, steps=8):
+    state, mask = env.reset()
+    states = [state.copy()]
+    for _ in range(steps):
+        state, mask, _, _ = env.step(_first_legal_moves(mask))
+        states.append(state.copy())
+    return np.stack(states)
+
+
+@pytest.mark.parametrize("schedule", ["static", "dynamic", "guided"])
+@pytest.mark.parametrize("n_threads,chunk", [(1, 0), (3, 0), (4, 5)])
+def test_thread_config_does_not_change_results(schedule, n_threads, chunk):
+    reference = CChessEnv(37, seed=3, min_random=2, max_random=8, max_step=6)
+    env = CChessEnv(37, seed=3, min_random=2, max_random=8, max_step=6)
+    env.set_threads(n_threads, schedule=schedule, chunk=chunk)
+
+    assert env.n_threads == n_threads
+    assert (_play(reference) == _play(env)).all()
+
+
+def test_threads_param():
+    env = CChessEnv(4, threads=2)
+    assert env.n_threads == 2
+    assert CChessEnv(4).n_threads >= 1
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="pinning is Linux only")
+def test_cpu_pinning():
+    env = CChessEnv(16, seed=0)
+    env.set_threads(2, cpus=[0])
+    state, mask = env.reset()
+    env.step(_first_legal_moves(mask))
+
+
+def test_invalid_thread_config():
+    env = CChessEnv(4)
+    with pytest.raises(ValueError):
+        env.set_threads(2, schedule="auto")
+    with pytest.raises(ValueError):
+        env.set_threads(-1)
+    with pytest.raises(ValueError):
+        env.set_threads(2, cpus=[-1])
@@ -0,0 +1,40 @@
+import chess
+import numpy as np
+
+from fastchessenv import CBoard, CBoards, CMove, transition
+
+FENS = [
+    chess.STARTING_FEN,
+    # Scholar's mate in one
+    "r1bqkbnr/pppp1ppp/2n5/4p3/2B1P3/5Q2/PPPP1PPP/RNB1K1NR w KQkq - 4 4",
+    # The king capturing the last piece leaves bare kings
+    "4k3/8/8/8/8/8/3n4/4K3 w - - 0 1",
+]
+MOVES = ["e2e4", "f3f7", "e1d2"]
+
+
+def test_transition_matches_python_chess():
+    boards = CBoards.from_fen(FENS).to_array().reshape(-1, 69)
+    moves = np.int32([CMove.from_str(m).to_int() for m in MOVES])
+
+    next_boards, mask, terminated, reward = transition(boards, moves)
+
+    assert next_boards.shape == (3, 69)
+    assert mask.shape == (3, 88 * 64)
+    for fen, move, arr, m in zip(FENS, MOVES, next_boards, mask):
+        board = chess.Board(fen)
+        board.push_uci(move)
+        got = CBoard.from_array(arr).to_board()
+        assert got.board_fen() == board.board_fen()
+        assert got.turn == board.turn
+        assert m.sum() == board.legal_moves.count()
+
+    assert list(terminated) == [False, True, True]
+    assert list(reward) == [0.0, 1.0, 0.0]
+
+
+def test_transition_does_not_modify_input():
+    boards = CBoards.from_fen(FENS[:1]).to_array().reshape(-1, 69)
+    before = boards.copy()
+    transition(boards, [CMove.from_str("e2e4").to_int()])
+    assert (boards == before).all()
@@ -0,0 +1,60 @@
+import chess
+import numpy as np
+import pytest
+
+gym = pytest.importorskip("gymnasium")
+
+from fastchessenv import CBoards, CMove  # noqa: E402
+from fastchessenv.vector import ChessVectorEnv  # noqa: E402
+
+
+def _first_legal_moves(mask):
+    return np.int32([np.flatnonzero(m)[0] for m in mask])
+
+
+def test_vector_env_api():
+    env = ChessVectorEnv(4, max_step=6)
+    obs, info = env.reset(seed=0)
+
+    assert env.observation_space.contains(obs)
+    assert info["action_mask"].shape == (4, 88 * 64)
+
+    obs, reward, terminated, truncated, info = env.step(
+        _first_legal_moves(info["action_mask"])
+    )
+    assert obs.shape == (4, 69)
+    assert reward.dtype == np.float32
+    assert terminated.dtype == bool
+    assert truncated.dtype == bool
+    assert not info["_final_obs"].any()
+
+
+def test_vector_env_autoreset_final_obs():
+    bank = CBoards.from_fen(["6k1/5ppp/8/8/8/8/8/R5K1 w - - 0 1"]).to_array()
+    env = ChessVectorEnv(2, reset_positions=bank.reshape(-1, 69))
+    obs, info = env.reset()
+
+    mate = CMove.from_move(chess.Move.from_uci("a1a8")).to_int()
+    obs, reward, terminated, truncated, info = env.step(np.int32([mate, mate]))
+
+    assert terminated.all()
+    assert not truncated.any()
+    assert info["_final_obs"].all()
+    assert (info["reason"] == 1).all()
+    # The finished game's last position is kept, obs is the next game
+    assert (obs == bank.reshape(-1, 69)[0]).all()
+    assert not (info["final_obs"] == obs).all()
+
+
+def test_vector_env_truncation():
+    env = ChessVectorEnv(3, max_step=2)
+    _, info = env.reset(seed=1)
+
+    truncated = np.zeros(3, dtype=bool)
+    for _ in range(2):
+        _, _, terminated, truncated, info = env.step(
+            _first_legal_moves(info["action_mask"])
+        )
+    assert truncated.all()
+    assert not terminated.any()
+    assert (info["reason"] == 6).all()